@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the performance-sensitive parts of the planner:
+1. LLM plan parsing (incremental parser vs. the original safe_json_loads)
+2. Traveler profile node lookups (type index vs. linear scan)
+3. Traveler profile memory (dict vs. compact backend)
+4. Bounded profile cache memory as the user base grows
+5. Profile store writes (operation log vs. rewriting the whole profile)
+6. Traveler similarity queries over 100k profiles
+7. Related-destination lookups from the co-visit graph
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from plan_parser import parse_plan
+from prompt_engine import PromptEngine
+from traveler_profile import TravelerProfile, CompactTravelerProfile
+from profile_store import ProfileStore
+from similarity_index import SimilarityIndex
+from destination_graph import DestinationGraph
+
+def timed(fn, repeat):
+    """Best-of-three average seconds per call"""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+def _legacy_safe_json_loads(text):
+    """The original all-or-nothing parser, kept here as the baseline"""
+    try:
+        start = text.find('{')
+        end = text.rfind('}') + 1
+        if start == -1 or end == 0:
+            raise ValueError("No valid JSON structure found in response")
+        json_str = text[start:end].replace('\n', '').replace('\r', '')
+        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+        return json.loads(json_str)
+    except Exception:
+        return None
+
+def _sample_plan(days):
+    return {
+        "itinerary": {
+            f"Day {d}": [f"Activity {a} on day {d} with a fairly long description of the place" for a in range(4)]
+            for d in range(1, days + 1)
+        },
+        "budget_analysis": {
+            category: {"estimated": 100 + i, "range": f"{80 + i}-{150 + i}"}
+            for i, category in enumerate(["accommodation", "food", "transportation", "activities", "miscellaneous"])
+        },
+        "travel_tips": {category: [f"{category} tip {i}" for i in range(6)]
+                        for category in ["cultural", "practical", "safety", "food"]},
+        "personalized_recommendations": {category: [f"{category} idea {i}" for i in range(6)]
+                                         for category in ["based_on_interests", "budget_optimization", "hidden_gems"]}
+    }
+
+def benchmark_plan_parser():
+    """Compare parse time and recovered sections on large and malformed payloads"""
+    print("⏱️  Plan parser: incremental parse_plan vs. legacy safe_json_loads")
+    schema = PromptEngine().output_schemas["comprehensive"]
+
+    large = "Here is your plan:\n" + json.dumps(_sample_plan(30), indent=4)
+    payloads = {
+        "valid, 30 days": large,
+        "truncated tips block": large[:large.index('"safety"') + 20],
+        "trailing comma + prose after": large[:-1] + ",}\nHope you enjoy!",
+        "one malformed day": large.replace('"Day 7": [', '"Day 7": [,', 1)
+    }
+
+    for name, text in payloads.items():
+        legacy = _legacy_safe_json_loads(text)
+        plan, problems = parse_plan(text, schema)
+        legacy_time = timed(lambda: _legacy_safe_json_loads(text), 50)
+        new_time = timed(lambda: parse_plan(text, schema), 50)
+        legacy_sections = len(legacy) if legacy else 0
+        days = len(plan.get("itinerary", {}))
+        print(f"   {name:<30} {len(text) / 1024:6.1f} KB | legacy {legacy_time * 1000:7.3f} ms, "
+              f"{legacy_sections} sections | incremental {new_time * 1000:7.3f} ms, "
+              f"{len(plan)} sections, {days} days")
+
+def _linear_node_by_type(profiles, user_id, node_type):
+    """The original scan over every node of a profile, kept here as the baseline"""
+    for node_id, node_info in profiles.profiles.get(user_id, {}).get('nodes', {}).items():
+        if node_info['type'] == node_type:
+            return node_id
+    return None
+
+def benchmark_profile_lookups():
+    """Singleton lookups and upserts as a profile accumulates travel_preferences nodes"""
+    print("⏱️  Profile lookups: type index vs. linear scan")
+    for size in [10, 100, 1000, 5000]:
+        # No retention limit, so the profile really grows to `size` nodes
+        profiles = TravelerProfile(retention={})
+        for i in range(size):
+            profiles.add_travel_preferences("user", {'destination': f"City {i}", 'days': "3"})
+        # Added last, so the linear scan has to walk every other node first
+        profiles.update_budget_profile("user", "$1000")
+
+        scan_time = timed(lambda: _linear_node_by_type(profiles, "user", "budget"), 200)
+        index_time = timed(lambda: profiles.get_node_by_type("user", "budget"), 200)
+        upsert_time = timed(lambda: profiles.update_budget_profile("user", "$2000"), 200)
+        print(f"   {size:>5} nodes | linear scan {scan_time * 1e6:9.2f} µs | "
+              f"indexed {index_time * 1e6:6.2f} µs | budget upsert {upsert_time * 1e6:6.2f} µs")
+
+def _populate(profiles, users):
+    for u in range(users):
+        user_id = str(u)
+        profiles.update_budget_profile(user_id, "$2000")
+        profiles.update_interests_profile(user_id, ["Culture", "Food", "Nature"])
+        for trip in ["Paris", "Rome"]:
+            profiles.add_previous_trip(user_id, trip, {'duration': "5 days"})
+        for i in range(20):
+            profiles.add_travel_preferences(user_id, {'destination': f"City {i}", 'days': "4",
+                                                      'departure_city': "Delhi"})
+
+def benchmark_profile_memory(users=2000):
+    """Heap used by a populated profile store, per backend"""
+    print(f"⏱️  Profile memory: {users} users, 25 nodes and 2 edges each")
+    results = {}
+    for name, backend in [("dict", TravelerProfile), ("compact", CompactTravelerProfile)]:
+        tracemalloc.start()
+        profiles = backend()
+        _populate(profiles, users)
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del profiles
+        print(f"   {name:<8} {results[name] / 1024 / 1024:7.1f} MB | {results[name] / users:8.0f} bytes/user")
+    print(f"   compact uses {100 * (1 - results['compact'] / results['dict']):.0f}% less memory")
+
+def benchmark_profile_cache(users=8000, max_profiles=1000):
+    """Heap in use as more users arrive than the profile cache holds"""
+    print(f"⏱️  Profile cache: {users} users through a {max_profiles}-profile LRU")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(os.path.join(tmp, "profiles.db"))
+        for label, profiles in [("unbounded", TravelerProfile(max_profiles=users, shards=1)),
+                                ("bounded", TravelerProfile(max_profiles=max_profiles, store=store))]:
+            tracemalloc.start()
+            checkpoints = []
+            for u in range(users):
+                profiles.update_budget_profile(str(u), "$2000")
+                profiles.add_travel_preferences(str(u), {'destination': "Tokyo", 'days': "4"})
+                if (u + 1) % (users // 4) == 0:
+                    checkpoints.append(tracemalloc.get_traced_memory()[0] / 1024 / 1024)
+            tracemalloc.stop()
+            print(f"   {label:<10} " + " | ".join(f"{mb:5.1f} MB" for mb in checkpoints)
+                  + f" | evictions {profiles.evictions}")
+        store.close()
+
+def benchmark_profile_writes(nodes=500, updates=200):
+    """Seconds per persisted budget update on a large profile"""
+    print(f"⏱️  Profile writes: {updates} updates to a {nodes}-node profile")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(os.path.join(tmp, "profiles.db"), flush_interval=60, snapshot_every=10 ** 9)
+        profiles = TravelerProfile(retention={}, store=store)
+        for i in range(nodes):
+            profiles.add_previous_trip("big_user", f"City {i}", {})
+        store.flush()
+        conn = store._connection()
+
+        def logged():
+            profiles.update_budget_profile("big_user", "$2000")
+            store.flush()
+
+        def rewritten():
+            profiles.update_budget_profile("big_user", "$2000")
+            with store._lock:
+                store._pending.clear()
+            conn.execute("BEGIN IMMEDIATE")
+            store._write_profile(conn, "big_user", profiles.get_profile("big_user"))
+            conn.execute("COMMIT")
+
+        log, full = timed(logged, updates), timed(rewritten, updates)
+        print(f"   op log    {log * 1000:7.3f} ms/update")
+        print(f"   rewrite   {full * 1000:7.3f} ms/update ({full / log:.0f}x slower)")
+        store.close()
+
+def benchmark_similarity(profiles=100000, batch=64):
+    """Build time and top-k query latency of the similarity index"""
+    print(f"⏱️  Similarity index: {profiles} profiles")
+    rng = random.Random(7)
+    interests = [f"interest {i}" for i in range(40)]
+    cities = [f"city {i}" for i in range(500)]
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for u in range(profiles):
+        index.update(str(u), rng.sample(interests, rng.randint(1, 4)), rng.choice([400, 900, 1800, 4000, 9000]),
+                     rng.sample(cities, rng.randint(1, 6)))
+    build = time.perf_counter() - start
+    users = [str(rng.randrange(profiles)) for _ in range(batch)]
+    single = timed(lambda: index.similar(users[0], k=25), 20)
+    recommend = timed(lambda: index.recommend_destinations(users[0]), 20)
+    batched = timed(lambda: index.recommend_destinations_many(users), 3) / batch
+    print(f"   build     {build / profiles * 1e6:7.1f} us/profile ({index.stats()['matrix_mb']} MB matrix)")
+    print(f"   top-25    {single * 1000:7.2f} ms/query")
+    print(f"   recommend {recommend * 1000:7.2f} ms/query")
+    print(f"   batched   {batched * 1000:7.2f} ms/user in batches of {batch}")
+
+def benchmark_destination_graph(plans=50000, travelers=10000):
+    """Incremental build and lookup latency of the destination co-visit graph"""
+    print(f"⏱️  Destination graph: {plans} plans by {travelers} travelers")
+    rng = random.Random(11)
+    interests = [f"interest {i}" for i in range(40)]
+    cities = [f"city {i}" for i in range(500)]
+    graph = DestinationGraph()
+    start = time.perf_counter()
+    for plan_id in range(1, plans + 1):
+        graph.add_plan(plan_id, str(rng.randrange(travelers)), rng.choice(cities), rng.sample(interests, 2))
+    build = time.perf_counter() - start
+    related = timed(lambda: graph.related("city 7"), 1000)
+    recommend = timed(lambda: graph.recommend_for("42"), 1000)
+    print(f"   build     {build / plans * 1e6:7.1f} us/plan ({graph.stats()['edges']} edges)")
+    print(f"   related   {related * 1e6:7.1f} us/lookup")
+    print(f"   recommend {recommend * 1e6:7.1f} us/traveler")
+
+def main():
+    """Run all benchmarks"""
+    print("🚀 Running benchmarks...\n")
+    benchmark_plan_parser()
+    print()
+    benchmark_profile_lookups()
+    print()
+    benchmark_profile_memory()
+    print()
+    benchmark_profile_cache()
+    print()
+    benchmark_profile_writes()
+    print()
+    benchmark_similarity()
+    print()
+    benchmark_destination_graph()
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import os
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import networkx as nx
+
+from similarity_index import normalize_token
+
+# Neighbors precomputed per destination; lookups beyond this many are truncated
+RELATED_DESTINATIONS = int(os.getenv("RELATED_DESTINATIONS", "10"))
+
+def interest_overlap(a: Set[str], b: Set[str]) -> float:
+    """Jaccard overlap of two interest sets, 0.0 when either is empty"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class DestinationGraph:
+    """
+    Co-visit graph of destinations planned by the same travelers
+    Nodes are normalized destination names. A traveler's destinations come from
+    their saved plans and the previous trips in their profile. Every pair of
+    them adds 1 + interest_weight * (interest overlap of the two trips) to the
+    edge between the two places, so edges weigh both how many travelers paired
+    two places and how alike those trips were. A destination's interests are
+    those of its first trip; repeat plans do not add weight.
+    When a traveler's destinations change (a plan is saved, edited or deleted,
+    or their trips change) their old pairs are subtracted and the new ones
+    added. Each touched node's top neighbors are re-ranked on write, so
+    related() is a dictionary lookup.
+    """
+
+    def __init__(self, neighbors: int = RELATED_DESTINATIONS, interest_weight: float = 1.0):
+        self.neighbors = neighbors
+        self.interest_weight = interest_weight
+        self.graph = nx.Graph()
+        # user -> source -> (destination key, display name, interests); a source is
+        # ('plan', id), ('visit', n) or ('trip', n), kept in the order they arrived
+        self.sources: Dict[str, Dict[Tuple[str, Hashable], Tuple[str, str, Set[str]]]] = {}
+        self.visits: Dict[str, Dict[str, Set[str]]] = {}  # user -> destination -> all interests
+        self.plan_owners: Dict[int, str] = {}
+        self.related_lists: Dict[str, List[Tuple[str, float]]] = {}
+        self.last_plan_id = 0
+        self._visit_ids = itertools.count()
+        self._lock = threading.RLock()
+        self.updates = 0
+        self.lookups = 0
+
+    # --- Incremental updates ---
+
+    def _source(self, destination: Optional[str], interests: Iterable[str]):
+        key = normalize_token(destination or "")
+        if not key:
+            return None
+        return key, str(destination).strip(), {normalize_token(i) for i in interests or () if i}
+
+    def add_visit(self, user_id: str, destination: Optional[str], interests: Iterable[str] = ()) -> bool:
+        """Record that a traveler planned a destination; returns False if nothing changed"""
+        source = self._source(destination, interests)
+        if source is None:
+            return False
+        with self._lock:
+            self._replace(user_id, {('visit', next(self._visit_ids)): source})
+            return True
+
+    def add_plan(self, plan_id: int, user_id: str, destination: Optional[str], interests: Iterable[str] = ()) -> bool:
+        """add_visit for a saved plan, skipping plans at or below last_plan_id"""
+        with self._lock:
+            if plan_id <= self.last_plan_id:
+                return False
+            self.last_plan_id = plan_id
+            source = self._source(destination, interests)
+            if source is None:
+                return False
+            self.plan_owners[plan_id] = user_id
+            self._replace(user_id, {('plan', plan_id): source})
+            return True
+
+    def update_plan(self, plan_id: int, user_id: str, destination: Optional[str], interests: Iterable[str] = ()) -> bool:
+        """Apply an edited plan, moving its co-visits to the new destination"""
+        with self._lock:
+            if plan_id > self.last_plan_id:
+                # Not synced yet; add_plan() will see the edited row
+                return False
+            self.remove_plan(plan_id)
+            source = self._source(destination, interests)
+            if source is None:
+                return False
+            self.plan_owners[plan_id] = user_id
+            self._replace(user_id, {('plan', plan_id): source})
+            return True
+
+    def remove_plan(self, plan_id: int) -> bool:
+        """Take a deleted plan's destination out of its traveler's co-visits"""
+        with self._lock:
+            user_id = self.plan_owners.pop(plan_id, None)
+            if user_id is None:
+                return False
+            self._replace(user_id, {}, drop=[('plan', plan_id)])
+            return True
+
+    def set_trips(self, user_id: str, destinations: Iterable[Optional[str]], interests: Iterable[str] = ()) -> bool:
+        """Replace a traveler's previous-trip destinations; returns False if they did not change"""
+        interests = list(interests or ())
+        trips = [source for source in (self._source(d, interests) for d in destinations) if source is not None]
+        with self._lock:
+            current = [source for (kind, _), source in self.sources.get(user_id, {}).items() if kind == 'trip']
+            if trips == current:
+                return False
+            old = [sid for sid in self.sources.get(user_id, {}) if sid[0] == 'trip']
+            self._replace(user_id, {('trip', n): source for n, source in enumerate(trips)}, drop=old)
+            return True
+
+    def _trip_map(self, user_id: str) -> Dict[str, Set[str]]:
+        """Each destination of the traveler with the interests of its first trip"""
+        trips: Dict[str, Set[str]] = {}
+        for key, _, interests in self.sources.get(user_id, {}).values():
+            trips.setdefault(key, interests)
+        return trips
+
+    def _pairs(self, trips: Dict[str, Set[str]]):
+        for a, b in itertools.combinations(sorted(trips), 2):
+            yield a, b, 1.0 + self.interest_weight * interest_overlap(trips[a], trips[b])
+
+    def _replace(self, user_id: str, added: Dict[Tuple[str, Hashable], Tuple[str, str, Set[str]]], drop=()):
+        """Swap a traveler's sources and move their co-visit pairs from the old set to the new one"""
+        before = self._trip_map(user_id)
+        sources = self.sources.setdefault(user_id, {})
+        for source_id in drop:
+            key, _, _ = sources.pop(source_id)
+            if source_id[0] != 'trip':
+                self.graph.nodes[key]['plans'] -= 1
+        for source_id, (key, name, _) in added.items():
+            if key not in self.graph:
+                self.graph.add_node(key, name=name, plans=0, travelers=0)
+            if source_id[0] != 'trip':
+                self.graph.nodes[key]['plans'] += 1
+        sources.update(added)
+        after = self._trip_map(user_id)
+
+        for key in after.keys() - before.keys():
+            self.graph.nodes[key]['travelers'] += 1
+        for key in before.keys() - after.keys():
+            self.graph.nodes[key]['travelers'] -= 1
+        for a, b, weight in self._pairs(before):
+            edge = self.graph[a][b]
+            edge['weight'] -= weight
+            edge['travelers'] -= 1
+            if edge['travelers'] <= 0:
+                self.graph.remove_edge(a, b)
+        for a, b, weight in self._pairs(after):
+            if self.graph.has_edge(a, b):
+                self.graph[a][b]['weight'] += weight
+                self.graph[a][b]['travelers'] += 1
+            else:
+                self.graph.add_edge(a, b, weight=weight, travelers=1)
+
+        self.visits[user_id] = {}
+        for key, _, interests in sources.values():
+            self.visits[user_id].setdefault(key, set()).update(interests)
+        if not sources:
+            del self.sources[user_id]
+            del self.visits[user_id]
+
+        touched = set(before) | set(after) | {key for key, _, _ in added.values()}
+        for key in touched:
+            node = self.graph.nodes[key]
+            if node['plans'] <= 0 and node['travelers'] <= 0:
+                self.graph.remove_node(key)
+                self.related_lists.pop(key, None)
+            else:
+                self._rank(key)
+        self.updates += 1
+
+    def _rank(self, node: str):
+        edges = self.graph[node]
+        self.related_lists[node] = heapq.nlargest(
+            self.neighbors, ((other, data['weight']) for other, data in edges.items()),
+            key=lambda item: (item[1], item[0])
+        )
+
+    # --- Lookups ---
+
+    def name(self, key: str) -> str:
+        return self.graph.nodes[key]['name']
+
+    def related(self, destination: str, top: int = 5) -> List[str]:
+        """Destinations most often planned alongside this one"""
+        self.lookups += 1
+        with self._lock:
+            ranked = self.related_lists.get(normalize_token(destination), [])
+            return [self.name(other) for other, _ in ranked[:top]]
+
+    def recommend(self, destinations: Iterable[str], top: int = 5) -> List[str]:
+        """Destinations related to any of these, summed by edge weight, excluding the ones given"""
+        self.lookups += 1
+        keys = {normalize_token(d) for d in destinations if d}
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for key in keys:
+                for other, weight in self.related_lists.get(key, []):
+                    if other not in keys:
+                        totals[other] = totals.get(other, 0.0) + weight
+            ranked = sorted(totals, key=lambda key: (-totals[key], key))[:top]
+            return [self.name(key) for key in ranked]
+
+    def recommend_for(self, user_id: str, top: int = 5) -> List[str]:
+        """recommend() over every destination the traveler has planned or visited"""
+        with self._lock:
+            visited = list(self.visits.get(user_id, {}))
+        return self.recommend(visited, top)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'destinations': self.graph.number_of_nodes(),
+            'edges': self.graph.number_of_edges(),
+            'travelers': len(self.visits),
+            'last_plan_id': self.last_plan_id,
+            'updates': self.updates,
+            'lookups': self.lookups
+        }
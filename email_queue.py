@@ -0,0 +1,204 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Refused addresses and bad credentials fail the same way on every attempt
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError)
+
+def is_permanent_error(error: Exception) -> bool:
+    """Whether retrying a send that raised this error is pointless"""
+    if isinstance(error, PERMANENT_ERRORS):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+class EmailDispatcher:
+    """
+    Background sender for outbound email
+    Messages are queued by the request thread and sent by a single worker that
+    keeps one authenticated SMTP connection open across messages. Messages that
+    arrive together are sent as a batch over that connection; a failed send
+    drops the connection and is retried with exponential backoff, unless the
+    server refused it permanently (5xx) or the message itself is broken. The
+    connection is closed after idle_timeout seconds without mail.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, batch_size: int = 20, batch_window: float = 0.2,
+                 max_retries: int = 3, backoff_factor: float = 1.0, idle_timeout: float = 60.0,
+                 timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._connection: Optional[smtplib.SMTP] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._waiting_retries = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.connections = 0
+        self.batches = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.username and self.password)
+
+    def enqueue(self, to_email: str, subject: str, html: str, sender: Optional[str] = None) -> bool:
+        """Queue an HTML message; returns False if no SMTP account is configured"""
+        if not self.configured:
+            print('[ERROR] SMTP credentials not set in .env')
+            return False
+        self._queue.put({'to': to_email, 'subject': subject, 'html': html,
+                         'sender': sender or self.username, 'attempts': 0})
+        self._ensure_worker()
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message was sent or gave up (mainly for tests)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks or self._waiting_retries:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="email-dispatcher", daemon=True)
+                self._worker.start()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._connection is None:
+            connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.use_tls:
+                    connection.starttls()
+                if self.username and self.password:
+                    connection.login(self.username, self.password)
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                raise
+            self._connection = connection
+            self.connections += 1
+        return self._connection
+
+    def _disconnect(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Block for one message, then collect whatever else arrives within batch_window"""
+        try:
+            batch = [self._queue.get(timeout=self.idle_timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                self._disconnect()
+                continue
+            self.batches += 1
+            for message in batch:
+                try:
+                    self._send(message)
+                except (smtplib.SMTPException, OSError) as e:
+                    self._disconnect()
+                    self._retry_later(message, e)
+                except Exception as e:
+                    # A message that cannot be built will not build on a retry either
+                    self.failed += 1
+                    print(f"[ERROR] Dropping malformed email to {message.get('to')}: {e!r}")
+                finally:
+                    self._queue.task_done()
+
+    def _send(self, message: Dict[str, Any]):
+        msg = MIMEMultipart()
+        msg['From'] = message['sender']
+        msg['To'] = message['to']
+        msg['Subject'] = message['subject']
+        msg.attach(MIMEText(message['html'], 'html'))
+        self._connect().sendmail(message['sender'], message['to'], msg.as_string())
+        self.sent += 1
+        print(f"[DEBUG] Email sent successfully to {message['to']}")
+
+    def _retry_later(self, message: Dict[str, Any], error: Exception):
+        message['attempts'] += 1
+        if is_permanent_error(error):
+            self.failed += 1
+            print(f"[ERROR] Email to {message['to']} refused, not retrying: {error}")
+            return
+        if message['attempts'] > self.max_retries:
+            self.failed += 1
+            print(f"[ERROR] Giving up on email to {message['to']}: {error}")
+            return
+        self.retries += 1
+        delay = self.backoff_factor * (2 ** (message['attempts'] - 1))
+        print(f"[ERROR] Failed to send email to {message['to']} ({error}), retrying in {delay:.1f}s")
+        # Requeue after the delay without holding up the rest of the batch
+        with self._lock:
+            self._waiting_retries += 1
+        timer = threading.Timer(delay, self._requeue, args=(message,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, message: Dict[str, Any]):
+        self._queue.put(message)
+        with self._lock:
+            self._waiting_retries -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queue.qsize() + self._waiting_retries,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'connections': self.connections,
+            'batches': self.batches
+        }
+
+# Global instance for the application
+email_dispatcher = EmailDispatcher(
+    host=os.getenv('SMTP_HOST', 'smtp.gmail.com'),
+    port=int(os.getenv('SMTP_PORT', '587')),
+    username=os.getenv('GMAIL_USER'),
+    password=os.getenv('GMAIL_PASSWORD'),
+    use_tls=os.getenv('SMTP_USE_TLS', 'true').lower() in ('1', 'true', 'yes'),
+    batch_size=int(os.getenv('SMTP_BATCH_SIZE', '20')),
+    max_retries=int(os.getenv('SMTP_MAX_RETRIES', '3'))
+)
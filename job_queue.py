@@ -0,0 +1,255 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class PersistentJobQueue:
+    """
+    Durable FIFO job queue in a local SQLite file
+    Jobs move queued -> running -> done/failed. A job is claimed atomically, so
+    several workers (or processes) never run the same one. A claim is a lease
+    owned by this queue instance that the worker renews with heartbeat(); a
+    running job is only taken over once its lease has expired, i.e. its
+    worker stopped or died, never while another live process is running it.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3, lease_seconds: float = 60.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        # Identifies this process (and queue instance) as the holder of its leases
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                enqueued_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                claimed_by TEXT,
+                lease_expires REAL
+            )
+        """)
+        # Queue files created before leases existed lack the lease columns
+        existing = {row[1] for row in self._connection().execute("PRAGMA table_info(jobs)")}
+        for column, ddl in (('claimed_by', 'TEXT'), ('lease_expires', 'REAL')):
+            if column not in existing:
+                self._connection().execute(f"ALTER TABLE jobs ADD COLUMN {column} {ddl}")
+        self._connection().execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> int:
+        """Persist a job and return its id"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO jobs (kind, payload, enqueued_at, updated_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(payload, default=str), now, now))
+        return cursor.lastrowid
+
+    def claim(self) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+        """
+        Lease the oldest runnable job and return (id, kind, payload)
+        Runnable means queued, or running under a lease that has expired.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status = 'queued' OR (status = 'running' "
+                "AND (lease_expires IS NULL OR lease_expires < ?)) ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?, "
+                    "claimed_by = ?, lease_expires = ? WHERE id = ?",
+                    (now, self.owner, now + self.lease_seconds, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def heartbeat(self, job_ids: List[int]) -> int:
+        """Extend the leases this queue holds on running jobs; returns how many were renewed"""
+        if not job_ids:
+            return 0
+        now = time.time()
+        cursor = self._connection().execute(
+            f"UPDATE jobs SET lease_expires = ? WHERE status = 'running' AND claimed_by = ? "
+            f"AND id IN ({','.join('?' * len(job_ids))})",
+            (now + self.lease_seconds, self.owner, *job_ids))
+        return cursor.rowcount
+
+    def complete(self, job_id: int) -> bool:
+        """Mark a leased job done; False if the lease was lost to another worker"""
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ?, lease_expires = NULL "
+            "WHERE id = ? AND claimed_by = ?",
+            (time.time(), job_id, self.owner))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, error: str) -> bool:
+        """Record a failure; the job is queued again until it runs out of attempts"""
+        conn = self._connection()
+        attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        retry = attempts is not None and attempts[0] < self.max_attempts
+        conn.execute(
+            "UPDATE jobs SET status = ?, last_error = ?, updated_at = ?, lease_expires = NULL "
+            "WHERE id = ? AND claimed_by = ?",
+            ('queued' if retry else 'failed', error, time.time(), job_id, self.owner))
+        return retry
+
+    def requeue_expired(self) -> int:
+        """Put running jobs whose lease expired (their worker stopped or died) back in the queue"""
+        now = time.time()
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = 'queued', claimed_by = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)", (now, now))
+        return cursor.rowcount
+
+    def purge_finished(self, older_than: float) -> int:
+        """Delete done/failed jobs last updated more than older_than seconds ago"""
+        cursor = self._connection().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - older_than,))
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+class JobWorkerPool:
+    """
+    Bounded pool of daemon threads draining a PersistentJobQueue
+    handlers maps a job kind to a callable taking the payload. Workers are woken
+    by notify() after an enqueue and otherwise poll every poll_interval seconds.
+    While jobs run, a heartbeat thread renews their leases every third of the
+    queue's lease_seconds.
+    """
+
+    def __init__(self, queue: PersistentJobQueue, handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+                 workers: int = 2, poll_interval: float = 2.0,
+                 on_failure: Optional[Callable[[int, Dict[str, Any], str], None]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.on_failure = on_failure
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._active: Dict[int, None] = {}  # Job ids being executed, for heartbeats
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """Requeue jobs with expired leases and start the workers (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            requeued = self.queue.requeue_expired()
+            if requeued:
+                print(f"[DEBUG] Requeued {requeued} interrupted job(s)")
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads + [self._heartbeat_thread]:
+            if thread is not None:
+                thread.join(timeout)
+        self._threads = []
+        self._heartbeat_thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def notify(self):
+        """Wake an idle worker after a job was enqueued"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                print(f"[ERROR] Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._execute(*job)
+
+    def _heartbeat(self):
+        while not self._stopping.wait(self.queue.lease_seconds / 3):
+            with self._lock:
+                job_ids = list(self._active)
+            try:
+                self.queue.heartbeat(job_ids)
+            except sqlite3.Error as e:
+                print(f"[ERROR] Could not renew job leases: {e}")
+
+    def _execute(self, job_id: int, kind: str, payload: Dict[str, Any]):
+        with self._lock:
+            self._active[job_id] = None
+        try:
+            self._handle(job_id, kind, payload)
+        finally:
+            with self._lock:
+                self._active.pop(job_id, None)
+
+    def _handle(self, job_id: int, kind: str, payload: Dict[str, Any]):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job kind '{kind}'")
+            handler(payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Job {job_id} ({kind}) failed: {error}")
+            if not self.queue.fail(job_id, error):
+                self.failed += 1
+                if self.on_failure is not None:
+                    self.on_failure(job_id, payload, error)
+            return
+        if not self.queue.complete(job_id):
+            print(f"[ERROR] Job {job_id} ({kind}) finished after its lease was taken over")
+        self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': len(self._threads),
+            'completed': self.completed,
+            'failed': self.failed,
+            'jobs': self.queue.counts()
+        }
@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+except ImportError:  # Optional; only needed for redis:// URLs
+    redis = None
+
+from travel_cache import MISSING
+
+class SQLiteKVStore:
+    """
+    Key-value store in one SQLite file, shared by every process on the host
+    Values are JSON documents with an optional absolute expiry. WAL mode lets
+    all workers read while one writes. Implements the same small interface as
+    RedisKVStore: get, set, delete, incr and clear.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        """The stored value, or MISSING if absent or expired"""
+        row = self._connection().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return MISSING
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._connection().execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)",
+                                   (key, json.dumps(value, separators=(',', ':')), expires_at))
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str) -> int:
+        """Atomically add one to an integer counter and return the new value"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + 1
+            conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, NULL)", (key, json.dumps(value)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def clear(self, prefix: str = ""):
+        self._connection().execute("DELETE FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def purge_expired(self) -> int:
+        return self._connection().execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'keys': self._connection().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+        }
+
+class RedisKVStore:
+    """Same interface as SQLiteKVStore on top of a Redis-compatible server"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("redis:// shared cache URLs need the redis package installed")
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Any:
+        value = self.client.get(key)
+        return MISSING if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.client.set(key, json.dumps(value, separators=(',', ':')),
+                        px=max(1, int(ttl * 1000)) if ttl is not None else None)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def clear(self, prefix: str = ""):
+        for key in self.client.scan_iter(match=f"{prefix}*"):
+            self.client.delete(key)
+
+    def purge_expired(self) -> int:
+        return 0  # Redis expires keys itself
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'redis', 'url': self.url, 'keys': self.client.dbsize()}
+
+def open_kv_store(url: Optional[str]):
+    """KV store for a sqlite:///path or redis://host URL; None or "none" disables sharing"""
+    if not url or url.lower() == "none":
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisKVStore(url)
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return SQLiteKVStore(path)
+    raise ValueError(f"Unsupported shared cache URL: {url}")
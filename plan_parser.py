@@ -0,0 +1,242 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_STRUCTURAL = re.compile(r'[{}\[\]:,"]')
+_STRING_SPECIAL = re.compile(r'[\\"]')
+
+# Returned by prune_to_schema when nothing of a value conforms
+INVALID = object()
+
+_TYPE_CHECKS = {
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'string': lambda v: isinstance(v, str),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'boolean': lambda v: isinstance(v, bool)
+}
+
+def _loads(fragment: str) -> Any:
+    """json.loads that tolerates raw newlines in strings and trailing commas"""
+    try:
+        return json.loads(fragment, strict=False)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', fragment), strict=False)
+
+def conforms(value: Any, spec: Dict[str, Any]) -> bool:
+    """Check a value against a small JSON-schema subset (type, properties, items, ...)"""
+    types = spec.get('type')
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        if not any(_TYPE_CHECKS[t](value) for t in types):
+            return False
+    if isinstance(value, dict):
+        properties = spec.get('properties', {})
+        if any(key not in value for key in spec.get('required', [])):
+            return False
+        if len(value) < spec.get('minProperties', 0):
+            return False
+        extra = spec.get('additionalProperties')
+        for key, item in value.items():
+            sub = properties.get(key, extra)
+            if isinstance(sub, dict) and not conforms(item, sub):
+                return False
+    if isinstance(value, list) and 'items' in spec:
+        return all(conforms(item, spec['items']) for item in value)
+    return True
+
+def prune_to_schema(value: Any, spec: Dict[str, Any]) -> Any:
+    """Drop the entries of an object that do not conform, instead of rejecting all of it"""
+    if isinstance(value, dict) and 'additionalProperties' in spec:
+        kept = {key: item for key, item in value.items()
+                if conforms(item, spec.get('properties', {}).get(key, spec['additionalProperties']))}
+        return kept if len(kept) >= spec.get('minProperties', 0) else INVALID
+    return value if conforms(value, spec) else INVALID
+
+class StreamingPlanParser:
+    """
+    Incremental, schema-aware parser for the JSON plan returned by the LLM
+    Chunks are fed as they arrive; every value that completes at depth 1 (a
+    plan section) or depth 2 (an itinerary day, a budget line, a tip category)
+    is reported as a (path, value) event. Text before the first '{' such as a
+    model preamble or a code fence is skipped. With a schema, entries that do
+    not conform are dropped, and result() recovers the well-formed parts of a
+    truncated or partly malformed response.
+    """
+
+    MAX_EVENT_DEPTH = 2
+
+    def __init__(self, schema: Optional[Dict[str, Any]] = None):
+        self.schema = schema
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        # One frame per open container: [kind, current key or index, expecting_key, start offset]
+        self.stack: List[list] = []
+        self.string_start = None
+        self.sections: Dict[str, Any] = {}
+        self.partial: Dict[str, Dict[Any, Any]] = {}
+        self.problems: List[str] = []
+
+    def _path(self) -> Tuple:
+        return tuple(frame[1] for frame in self.stack)
+
+    def _section_spec(self, section: Any) -> Optional[Dict[str, Any]]:
+        if self.schema is None:
+            return None
+        return self.schema.get('properties', {}).get(section)
+
+    def _emit(self, events: List[Tuple[Tuple, Any]], path: Tuple, start: int, end: int):
+        if not 1 <= len(path) <= self.MAX_EVENT_DEPTH:
+            return
+        try:
+            value = _loads(self.buffer[start:end])
+        except ValueError:
+            self.problems.append(f"{'.'.join(map(str, path))}: malformed JSON")
+            return
+
+        section = path[0]
+        spec = self._section_spec(section)
+        if len(path) == 1:
+            if spec is not None:
+                value = prune_to_schema(value, spec)
+                if value is INVALID:
+                    self.problems.append(f"{section}: does not match the plan schema")
+                    return
+            self.sections[section] = value
+        else:
+            if spec is not None:
+                entry_spec = spec.get('properties', {}).get(path[1], spec.get('additionalProperties'))
+                if isinstance(entry_spec, dict) and not conforms(value, entry_spec):
+                    self.problems.append(f"{section}.{path[1]}: does not match the plan schema")
+                    return
+            self.partial.setdefault(section, {})[path[1]] = value
+        events.append((path, value))
+
+    def _string_closed(self, events, end: int):
+        frame = self.stack[-1]
+        if frame[0] == '{' and frame[2]:
+            try:
+                frame[1] = _loads(self.buffer[self.string_start:end])
+            except ValueError:
+                frame[1] = self.buffer[self.string_start + 1:end - 1]
+        else:
+            self._emit(events, self._path(), self.string_start, end)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple, Any]]:
+        """Consume a chunk of model output and return the values it completed"""
+        events = []
+        if self.finished:
+            return events
+        self.buffer += chunk
+        buf = self.buffer
+        n = len(buf)
+        pos = self.pos
+
+        if not self.started:
+            start = buf.find('{', pos)
+            if start == -1:
+                self.pos = n
+                return events
+            self.started = True
+            self.stack.append(['{', None, True, start])
+            pos = start + 1
+
+        while pos < n:
+            if self.in_string:
+                m = _STRING_SPECIAL.search(buf, pos)
+                if m is None:
+                    pos = n
+                    break
+                if m.group() == '\\':
+                    if m.end() >= n:
+                        # Wait for the escaped character
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                self.in_string = False
+                pos = m.end()
+                self._string_closed(events, pos)
+                continue
+
+            m = _STRUCTURAL.search(buf, pos)
+            if m is None:
+                # Possibly a scalar cut in half; rescan it with the next chunk
+                break
+            i = m.start()
+            ch = m.group()
+            frame = self.stack[-1]
+            if not (frame[0] == '{' and frame[2]) and buf[pos:i].strip():
+                self._emit(events, self._path(), pos, i)
+            pos = i + 1
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch in '{[':
+                self.stack.append([ch, None if ch == '{' else 0, ch == '{', i])
+            elif ch in '}]':
+                closed = self.stack.pop()
+                if not self.stack:
+                    self.finished = True
+                    break
+                self._emit(events, self._path(), closed[3], i + 1)
+            elif ch == ':':
+                frame[2] = False
+            elif frame[0] == '{':
+                frame[2] = True
+            else:
+                frame[1] += 1
+
+        self.pos = pos
+        return events
+
+    def result(self) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Best-effort plan from everything fed so far
+        Completed sections are used as is; a section cut off mid-way keeps the
+        entries that did complete. Returns the plan and a list of problems.
+        """
+        plan = {}
+        problems = list(self.problems)
+        for section in list(self.sections) + list(self.partial):
+            if section in plan:
+                continue
+            if section in self.sections:
+                plan[section] = self.sections[section]
+                continue
+            entries = self.partial[section]
+            value = list(entries.values()) if all(isinstance(k, int) for k in entries) else dict(entries)
+            spec = self._section_spec(section)
+            if spec is not None and prune_to_schema(value, spec) is INVALID:
+                continue
+            plan[section] = value
+            problems.append(f"{section}: incomplete, kept {len(entries)} entries")
+
+        if self.schema is not None:
+            for section in self.schema.get('required', []):
+                if section not in plan:
+                    problems.append(f"{section}: missing")
+        return plan, problems
+
+def parse_plan(text: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Parse a complete LLM response, recovering whatever sections are well formed"""
+    text = text or ""
+    # Fast path: a well-formed response that already matches the schema
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start != -1 and end > start:
+        try:
+            whole = _loads(text[start:end])
+        except ValueError:
+            whole = None
+        if isinstance(whole, dict) and (schema is None or conforms(whole, schema)):
+            return whole, []
+
+    parser = StreamingPlanParser(schema)
+    parser.feed(text)
+    return parser.result()
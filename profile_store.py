@@ -0,0 +1,434 @@
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from travel_cache import MISSING
+
+# Operations logged for a user before their tail is folded into a new snapshot
+SNAPSHOT_EVERY = int(os.getenv("PROFILE_SNAPSHOT_EVERY", "50"))
+
+# How often a loaded profile is checked for changes flushed by other processes
+RECHECK_SECONDS = float(os.getenv("PROFILE_RECHECK_SECONDS", "1"))
+
+def apply_op(profile: Optional[Dict[str, Any]], user_id: str, op: str,
+             args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Replay one logged operation onto a dict-shaped profile (None if it does not exist yet)"""
+    if op == 'create':
+        return {'user_id': user_id, 'created_at': args['at'], 'last_updated': args['at'],
+                'nodes': {}, 'edges': []}
+    if op == 'replace':
+        return args['profile']
+    if profile is None:
+        return None
+
+    if op == 'add_node':
+        profile['nodes'][str(args['id'])] = {'id': args['id'], 'type': args['type'],
+                                             'data': args['data'], 'created_at': args['created_at']}
+    elif op == 'update_node':
+        node = profile['nodes'].get(str(args['id']))
+        if node is not None:
+            node['data'].update(args['data'])
+    elif op == 'remove_node':
+        if profile['nodes'].pop(str(args['id']), None) is not None:
+            profile['edges'] = [edge for edge in profile['edges']
+                                if edge['source'] != args['id'] and edge['target'] != args['id']]
+    elif op == 'add_edge':
+        profile['edges'].append({'source': args['source'], 'target': args['target'],
+                                 'relationship': args['relationship'], 'created_at': args['created_at']})
+    elif op == 'synced':
+        profile['synced_version'] = args['version']
+    if args.get('at'):
+        profile['last_updated'] = args['at']
+    return profile
+
+class ProfileStore:
+    """
+    All traveler profile graphs in one SQLite file, stored as an event log
+    Every profile mutation is appended to the ops table as a small JSON record,
+    so a write costs the size of the change rather than the profile. Profiles,
+    nodes and edges hold per-user snapshots; once a user has snapshot_every
+    logged operations, the flush folds them into a new snapshot and deletes
+    them. Reading a profile replays its snapshot plus the tail of the log.
+
+    Appends are buffered and a background thread flushes them in a single
+    transaction every flush_interval seconds (or once batch_size operations
+    are waiting), so a flush is applied entirely or not at all.
+
+    Several worker processes can share one file. With a shared KV store, each
+    flush bumps a per-user version counter there, and is_stale() tells a
+    worker when its in-memory copy misses changes flushed by another one.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0, batch_size: int = 500,
+                 snapshot_every: int = SNAPSHOT_EVERY, shared: Optional[Any] = None,
+                 recheck_interval: float = RECHECK_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.shared = shared
+        self.recheck_interval = recheck_interval
+        self._seen: Dict[str, int] = {}  # Version each loaded profile reflects
+        self._checked: Dict[str, float] = {}
+
+        self._pending: List[Tuple[str, str, str, Optional[str]]] = []  # (user_id, op, args JSON, at)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self.flushes = 0
+        self.ops_written = 0
+        self.snapshots = 0
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                created_at TEXT,
+                last_updated TEXT,
+                synced_version INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS nodes (
+                user_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                node_id NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at TEXT,
+                PRIMARY KEY (user_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS edges (
+                user_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                source NOT NULL,
+                target NOT NULL,
+                relationship TEXT,
+                created_at TEXT,
+                PRIMARY KEY (user_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS ops (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                op TEXT NOT NULL,
+                args TEXT NOT NULL,
+                at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_ops_user ON ops (user_id, seq);
+        """)
+
+    # --- Write-behind log ---
+
+    def start(self):
+        """Start the background flusher (idempotent) and flush once more at exit"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="profile-store", daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def append(self, user_id: str, op: str, args: Dict[str, Any]):
+        """Log one operation; args are serialized now so later mutations cannot change them"""
+        record = (user_id, op, json.dumps(args, separators=(',', ':')), args.get('at'))
+        with self._lock:
+            self._pending.append(record)
+            backlog = len(self._pending)
+        if backlog >= self.batch_size:
+            self._wakeup.set()
+
+    def close(self):
+        """Stop the flusher after a final flush"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+            atexit.unregister(self.flush)
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[ERROR] Profile store flush failed: {e}")
+
+    def flush(self) -> int:
+        """Append every buffered operation in one transaction and snapshot long tails"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT INTO ops (user_id, op, args, at) VALUES (?, ?, ?, ?)", pending)
+                users = list({record[0] for record in pending})
+                long_tails = []
+                for start in range(0, len(users), 500):
+                    chunk = users[start:start + 500]
+                    long_tails += [row[0] for row in conn.execute(
+                        f"SELECT user_id FROM ops WHERE user_id IN ({','.join('?' * len(chunk))}) "
+                        f"GROUP BY user_id HAVING COUNT(*) >= ?", chunk + [self.snapshot_every])]
+                for user_id in long_tails:
+                    self._snapshot(conn, user_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+            self.flushes += 1
+            self.ops_written += len(pending)
+            self.snapshots += len(long_tails)
+            for user_id in users:
+                self._bump_version(user_id)
+            return len(pending)
+
+    def _snapshot(self, conn: sqlite3.Connection, user_id: str):
+        """Fold a user's log tail into their snapshot and compact the log"""
+        profile, last_seq = self._replay(conn, user_id)
+        if profile is None:
+            self._delete_rows(conn, user_id)
+            return
+        self._write_profile(conn, user_id, profile)
+        conn.execute("DELETE FROM ops WHERE user_id = ? AND seq <= ?", (user_id, last_seq))
+
+    def _write_profile(self, conn: sqlite3.Connection, user_id: str, profile: Dict[str, Any]):
+        conn.execute("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                     (user_id, profile.get('created_at'), profile.get('last_updated'),
+                      profile.get('synced_version')))
+        conn.execute("DELETE FROM nodes WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM edges WHERE user_id = ?", (user_id,))
+        conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?)", [
+            (user_id, position, node.get('id', key), node['type'],
+             json.dumps(node.get('data', {}), separators=(',', ':')), node.get('created_at'))
+            for position, (key, node) in enumerate(profile.get('nodes', {}).items())
+        ])
+        conn.executemany("INSERT INTO edges VALUES (?, ?, ?, ?, ?, ?)", [
+            (user_id, position, edge['source'], edge['target'], edge.get('relationship'), edge.get('created_at'))
+            for position, edge in enumerate(profile.get('edges', []))
+        ])
+
+    # --- Cross-process coherence ---
+
+    @staticmethod
+    def _version_key(user_id: str) -> str:
+        return f"profile-version:{user_id}"
+
+    def _read_version(self, user_id: str) -> Optional[int]:
+        if self.shared is None:
+            return None
+        try:
+            version = self.shared.get(self._version_key(user_id))
+        except Exception as e:
+            print(f"[ERROR] Shared profile version read failed: {e}")
+            return None
+        return None if version is MISSING else version
+
+    def _bump_version(self, user_id: str):
+        """Announce a write; our copy stays current only if nobody else wrote in between"""
+        if self.shared is None:
+            return
+        try:
+            version = self.shared.incr(self._version_key(user_id))
+        except Exception as e:
+            print(f"[ERROR] Shared profile version update failed: {e}")
+            return
+        with self._lock:
+            if self._seen.get(user_id, 0) == version - 1:
+                self._seen[user_id] = version
+
+    def is_stale(self, user_id: str) -> bool:
+        """Whether another process flushed changes to this profile since it was loaded here"""
+        if self.shared is None:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(user_id, 0.0) < self.recheck_interval:
+            return False
+        self._checked[user_id] = now
+        version = self._read_version(user_id)
+        return version is not None and version != self._seen.get(user_id)
+
+    def _mark_loaded(self, user_id: str, version: Optional[int]):
+        with self._lock:
+            if version is None:
+                self._seen.pop(user_id, None)
+            else:
+                self._seen[user_id] = version
+            self._checked[user_id] = time.monotonic()
+
+    # --- Reads ---
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """One profile in the dict-shaped format, including operations not yet flushed"""
+        # Hold the write lock so operations taken by an in-flight flush are visible
+        with self._write_lock:
+            # Read the version first: a write that lands during the replay makes it stale
+            self._mark_loaded(user_id, self._read_version(user_id))
+            profile, _ = self._replay(self._connection(), user_id)
+            with self._lock:
+                buffered = [record for record in self._pending if record[0] == user_id]
+        for _, op, args, _ in buffered:
+            profile = apply_op(profile, user_id, op, json.loads(args))
+        return profile
+
+    def _replay(self, conn: sqlite3.Connection, user_id: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Snapshot plus logged tail of one user, and the last sequence number applied"""
+        row = conn.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        profile = None
+        if row is not None:
+            profile = self._profile(row)
+            for node_row in conn.execute("SELECT * FROM nodes WHERE user_id = ? ORDER BY position", (user_id,)):
+                self._add_node(profile, node_row)
+            for edge_row in conn.execute("SELECT * FROM edges WHERE user_id = ? ORDER BY position", (user_id,)):
+                self._add_edge(profile, edge_row)
+        last_seq = 0
+        for seq, op, args in conn.execute("SELECT seq, op, args FROM ops WHERE user_id = ? ORDER BY seq",
+                                          (user_id,)):
+            profile = apply_op(profile, user_id, op, json.loads(args))
+            last_seq = seq
+        return profile, last_seq
+
+    def load_all(self, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Every stored profile, most recently updated first, replayed in one pass per table"""
+        self.flush()
+        conn = self._connection()
+        # A user's last update is the later of their snapshot and their newest logged operation
+        query = """
+            SELECT user_id FROM (
+                SELECT user_id, last_updated AS at FROM profiles
+                UNION ALL SELECT user_id, at FROM ops
+            ) GROUP BY user_id ORDER BY MAX(at) DESC
+        """
+        rows = conn.execute(query + (" LIMIT ?" if limit is not None else ""),
+                            (limit,) if limit is not None else ()).fetchall()
+        wanted = {row[0] for row in rows}
+        for user_id in wanted:
+            self._mark_loaded(user_id, self._read_version(user_id))
+        profiles: Dict[str, Optional[Dict[str, Any]]] = {row[0]: None for row in rows}
+        for row in conn.execute("SELECT * FROM profiles"):
+            if row[0] in wanted:
+                profiles[row[0]] = self._profile(row)
+        for node_row in conn.execute("SELECT * FROM nodes ORDER BY user_id, position"):
+            if profiles.get(node_row[0]) is not None:
+                self._add_node(profiles[node_row[0]], node_row)
+        for edge_row in conn.execute("SELECT * FROM edges ORDER BY user_id, position"):
+            if profiles.get(edge_row[0]) is not None:
+                self._add_edge(profiles[edge_row[0]], edge_row)
+        for user_id, op, args in conn.execute("SELECT user_id, op, args FROM ops ORDER BY seq"):
+            if user_id in wanted:
+                profiles[user_id] = apply_op(profiles[user_id], user_id, op, json.loads(args))
+        # Oldest first, so the most recent end up as most recently used
+        return iter([profile for profile in reversed(list(profiles.values())) if profile is not None])
+
+    @staticmethod
+    def _profile(row) -> Dict[str, Any]:
+        return {'user_id': row[0], 'created_at': row[1], 'last_updated': row[2],
+                'synced_version': row[3], 'nodes': {}, 'edges': []}
+
+    @staticmethod
+    def _add_node(profile: Dict[str, Any], row):
+        _, _, node_id, node_type, data, created_at = row
+        profile['nodes'][str(node_id)] = {'id': node_id, 'type': node_type,
+                                          'data': json.loads(data), 'created_at': created_at}
+
+    @staticmethod
+    def _add_edge(profile: Dict[str, Any], row):
+        _, _, source, target, relationship, created_at = row
+        profile['edges'].append({'source': source, 'target': target,
+                                 'relationship': relationship, 'created_at': created_at})
+
+    def user_ids(self) -> List[str]:
+        with self._lock:
+            users = {record[0] for record in self._pending}
+        conn = self._connection()
+        users.update(row[0] for row in conn.execute("SELECT user_id FROM profiles UNION SELECT user_id FROM ops"))
+        return list(users)
+
+    def delete(self, user_id: str) -> bool:
+        with self._write_lock:
+            with self._lock:
+                before = len(self._pending)
+                self._pending = [record for record in self._pending if record[0] != user_id]
+                buffered = len(self._pending) != before
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = self._delete_rows(conn, user_id)
+            conn.execute("COMMIT")
+        self._bump_version(user_id)
+        return deleted or buffered
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, user_id: str) -> bool:
+        deleted = conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,)).rowcount
+        conn.execute("DELETE FROM nodes WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM edges WHERE user_id = ?", (user_id,))
+        deleted += conn.execute("DELETE FROM ops WHERE user_id = ?", (user_id,)).rowcount
+        return bool(deleted)
+
+    # --- Migration ---
+
+    def migrate_json_files(self, pattern: str) -> int:
+        """Import per-user traveler_profile_*.json files for users not already stored"""
+        existing = set(self.user_ids())
+        snapshots = {}
+        for filename in sorted(glob.glob(pattern)):
+            try:
+                with open(filename, 'r') as f:
+                    profile = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Skipping {filename}: {e}")
+                continue
+            user_id = profile.get('user_id')
+            if user_id and user_id not in existing:
+                snapshots[user_id] = profile
+        if snapshots:
+            with self._write_lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for user_id, profile in snapshots.items():
+                        self._write_profile(conn, user_id, profile)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            print(f"[DEBUG] Migrated {len(snapshots)} JSON profile(s) into {self.path}")
+        return len(snapshots)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        logged = self._connection().execute("SELECT COUNT(*) FROM ops").fetchone()[0]
+        return {
+            'shared': self.shared is not None,
+            'pending': pending,
+            'logged': logged,
+            'flushes': self.flushes,
+            'ops_written': self.ops_written,
+            'snapshots': self.snapshots
+        }
@@ -1,5 +1,115 @@
 import json
-from typing import Dict, List, Any, Optional
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+PROMPT_KINDS = ("itinerary", "budget_analysis", "travel_tips", "recommendations", "comprehensive")
+
+# Context window of the model (llama3-8b-8192 by default) and the most output it may use
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "4096"))
+
+# Expected output size per prompt type: (fixed tokens, tokens per trip day)
+OUTPUT_TOKENS = {
+    "itinerary": (80, 70),
+    "budget_analysis": (250, 0),
+    "travel_tips": (300, 0),
+    "recommendations": (250, 0),
+    "comprehensive": (600, 70)
+}
+
+# Profile context fields, most useful first; the last ones are dropped first
+PROFILE_FIELDS = ("interests", "budget", "nationality", "previous_trips")
+
+# Recent requests kept for prompt size / latency stats
+PROMPT_STATS_SAMPLES = int(os.getenv("PROMPT_STATS_SAMPLES", "500"))
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Offline estimate of a BPE token count, on the high side
+    Words count one token per 8 letters (rounded up), numbers one per three
+    digits, and every other non-space character one token.
+    """
+    return sum(1 + (len(piece) - 1) // 8 if piece.isalpha() else 1 for piece in _TOKEN_PATTERN.findall(text))
+
+class CompiledPrompt:
+    """
+    One prompt type split into a static prefix and a per-request suffix
+    The prefix (role, output format, few-shot examples, general guidelines)
+    is built once and is the same bytes on every call, so a provider-side
+    prefix cache can reuse it. Only the suffix template is filled per request.
+    """
+    __slots__ = ('kind', 'prefix', 'suffix', 'examples', 'prefix_tokens')
+
+    def __init__(self, kind: str, prefix: str, suffix: str, examples: int = 0):
+        self.kind = kind
+        self.prefix = prefix
+        self.suffix = suffix
+        self.examples = examples
+        self.prefix_tokens = estimate_tokens(prefix)
+
+    def render(self, profile_context: Optional[str] = None, **fields) -> Tuple[str, str]:
+        """(prefix, suffix) with the request fields and optional profile context filled in"""
+        profile = f"\nTRAVELER PROFILE CONTEXT:\n{profile_context}\n" if profile_context else ""
+        return self.prefix, self.suffix.format(profile=profile, **fields)
+
+class PromptPlan:
+    """Chat messages for one request plus the token budget they were fitted to"""
+    __slots__ = ('kind', 'messages', 'prompt_tokens', 'max_tokens', 'examples', 'profile_fields', 'trimmed')
+
+    def __init__(self, kind: str, messages: List[Dict[str, str]], prompt_tokens: int, max_tokens: int,
+                 examples: int, profile_fields: Tuple[str, ...], trimmed: bool):
+        self.kind = kind
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.examples = examples
+        self.profile_fields = profile_fields
+        self.trimmed = trimmed
+
+class PromptStats:
+    """Prompt sizes and response latencies of recent LLM requests"""
+
+    # Upper bounds (estimated prompt tokens) of the size buckets latency is grouped by
+    BUCKETS = (500, 1000, 2000, 4000)
+
+    def __init__(self, samples: int = PROMPT_STATS_SAMPLES):
+        self.samples = deque(maxlen=samples)
+        self.requests = 0
+        self.trimmed = 0
+        self._lock = threading.Lock()
+
+    def record(self, plan: PromptPlan, latency: float, prompt_tokens: Optional[int] = None):
+        """Record one request; prompt_tokens is the provider's own count when it reports one"""
+        with self._lock:
+            self.samples.append((plan.kind, plan.prompt_tokens, prompt_tokens, latency))
+            self.requests += 1
+            self.trimmed += plan.trimmed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self.samples)
+            requests, trimmed = self.requests, self.trimmed
+        by_size = {}
+        for _, estimated, _, latency in samples:
+            bucket = next((f"<={limit}" for limit in self.BUCKETS if estimated <= limit), f">{self.BUCKETS[-1]}")
+            count, total = by_size.get(bucket, (0, 0.0))
+            by_size[bucket] = (count + 1, total + latency)
+        reported = [(estimated, actual) for _, estimated, actual, _ in samples if actual]
+        return {
+            'requests': requests,
+            'trimmed': trimmed,
+            'avg_prompt_tokens': round(sum(s[1] for s in samples) / len(samples)) if samples else 0,
+            'avg_latency_s': round(sum(s[3] for s in samples) / len(samples), 3) if samples else 0.0,
+            # Provider count / estimate; above 1.0 means estimate_tokens is undercounting
+            'estimate_ratio': round(sum(a for _, a in reported) / sum(e for e, _ in reported), 3) if reported else None,
+            'latency_by_prompt_tokens': {bucket: {'requests': count, 'avg_latency_s': round(total / count, 3)}
+                                         for bucket, (count, total) in by_size.items()}
+        }
 
 class PromptEngine:
     """
@@ -10,6 +120,12 @@ class PromptEngine:
     def __init__(self):
         self.few_shot_examples = self._load_few_shot_examples()
         self.output_formats = self._load_output_formats()
+        self.output_schemas = self._load_output_schemas()
+        self.templates = self._load_prompt_templates()
+        self.compiled = {kind: self._compile(kind) for kind in PROMPT_KINDS}
+        # Prefixes with fewer few-shot examples, compiled on first use: (kind, examples) -> CompiledPrompt
+        self.trimmed_prefixes: Dict[Tuple[str, int], CompiledPrompt] = {}
+        self.prompt_stats = PromptStats()
     
     def _load_few_shot_examples(self) -> Dict[str, List[Dict[str, str]]]:
         """Load few-shot examples for different types of travel planning"""
@@ -35,6 +151,42 @@ class PromptEngine:
                     "input": "Provide travel tips for first-time visitor to Istanbul",
                     "output": """{"tips": {"cultural": ["Dress modestly when visiting mosques", "Learn basic Turkish greetings"], "practical": ["Get Istanbulkart for public transport", "Bargain at Grand Bazaar"], "safety": ["Be aware of pickpockets in crowded areas", "Use official taxi stands"], "food": ["Try traditional Turkish breakfast", "Visit local tea houses"]}}"""
                 }
+            ],
+            "recommendations": [
+                {
+                    "input": "Recommend extras for a 3-day trip to Tokyo under $1500 focused on Culture, Food",
+                    "output": """{"recommendations": {"based_on_interests": ["Visit traditional tea houses", "Try authentic sushi at Tsukiji"], "budget_optimization": ["Use convenience store meals", "Walk between nearby attractions"], "hidden_gems": ["Explore Yanaka Ginza", "Visit Kappabashi kitchen street"]}}"""
+                }
+            ],
+            "comprehensive": [
+                {
+                    "input": "Plan a 3-day trip to Tokyo under $1500 focused on Culture, Food",
+                    "output": """{
+    "itinerary": {
+        "Day 1": ["Visit Senso-ji Temple in Asakusa", "Explore Tsukiji Outer Market", "Evening at Tokyo Skytree"],
+        "Day 2": ["Morning at Meiji Shrine", "Shibuya Crossing", "Traditional tea ceremony"],
+        "Day 3": ["Imperial Palace East Gardens", "Akihabara electronics district", "Farewell dinner at izakaya"]
+    },
+    "budget_analysis": {
+        "accommodation": {"estimated": 300, "range": "250-350"},
+        "food": {"estimated": 200, "range": "180-250"},
+        "transportation": {"estimated": 80, "range": "60-100"},
+        "activities": {"estimated": 150, "range": "120-180"},
+        "miscellaneous": {"estimated": 50, "range": "30-70"}
+    },
+    "travel_tips": {
+        "cultural": ["Remove shoes when entering temples", "Learn basic Japanese greetings"],
+        "practical": ["Get a Pasmo/Suica card", "Use Google Maps for navigation"],
+        "safety": ["Tokyo is very safe", "Keep valuables secure"],
+        "food": ["Try conveyor belt sushi", "Visit local ramen shops"]
+    },
+    "personalized_recommendations": {
+        "based_on_interests": ["Visit traditional tea houses", "Try authentic sushi at Tsukiji"],
+        "budget_optimization": ["Use convenience store meals", "Walk between nearby attractions"],
+        "hidden_gems": ["Explore Yanaka Ginza", "Visit Kappabashi kitchen street"]
+    }
+}"""
+                }
             ]
         }
     
@@ -50,126 +202,248 @@ Each day should have 2-4 activities that are realistic for the given budget and
 {"budget_breakdown": {"accommodation": {"estimated": number, "range": "min-max"}, "food": {"estimated": number, "range": "min-max"}, "transportation": {"estimated": number, "range": "min-max"}, "activities": {"estimated": number, "range": "min-max"}, "miscellaneous": {"estimated": number, "range": "min-max"}}, "total_estimated": number, "budget_status": "comfortable/tight/luxury", "savings_potential": number}""",
             
             "travel_tips": """Return ONLY valid JSON in this exact format (no explanations):
-{"tips": {"cultural": ["tip1", "tip2"], "practical": ["tip1", "tip2"], "safety": ["tip1", "tip2"], "food": ["tip1", "tip2"]}}"""
-        }
-    
-    def build_itinerary_prompt(self, destination: str, days: int, budget: int, 
-                              preferences: str, traveler_profile: Dict[str, Any] = None) -> str:
-        """Build enhanced itinerary prompt with few-shot examples and profile context"""
-        
-        # Base prompt
-        prompt = f"""You are an expert AI travel planner with deep knowledge of destinations worldwide.
+{"tips": {"cultural": ["tip1", "tip2"], "practical": ["tip1", "tip2"], "safety": ["tip1", "tip2"], "food": ["tip1", "tip2"]}}""",
 
-{self.output_formats['itinerary']}
+            "recommendations": """Return ONLY valid JSON in this exact format (no explanations):
+{"recommendations": {"based_on_interests": ["rec1", "rec2"], "budget_optimization": ["rec1", "rec2"], "hidden_gems": ["rec1", "rec2"]}}""",
 
-FEW-SHOT EXAMPLES:
-"""
-        
-        # Add few-shot examples
-        for example in self.few_shot_examples["itinerary"]:
-            prompt += f"""
-Input: {example['input']}
-Output: {example['output']}
-"""
-        
-        # Add current request
-        prompt += f"""
-Now plan a {days}-day trip to {destination} under ${budget} focused on {preferences}.
-"""
-        
-        # Add traveler profile context if available
-        if traveler_profile:
-            profile_context = self._build_profile_context(traveler_profile)
-            prompt += f"\nTRAVELER PROFILE CONTEXT:\n{profile_context}\n"
-        
-        # Add specific instructions
-        prompt += f"""
-IMPORTANT GUIDELINES:
-- Activities should be realistic for the budget of ${budget}
-- Focus on the specified interests: {preferences}
+            "comprehensive": """Return ONLY valid JSON in this exact format (no explanations):
+{
+    "itinerary": {
+        "Day 1": ["activity1", "activity2", "activity3"],
+        "Day 2": ["activity1", "activity2", "activity3"]
+    },
+    "budget_analysis": {
+        "accommodation": {"estimated": number, "range": "min-max"},
+        "food": {"estimated": number, "range": "min-max"},
+        "transportation": {"estimated": number, "range": "min-max"},
+        "activities": {"estimated": number, "range": "min-max"},
+        "miscellaneous": {"estimated": number, "range": "min-max"}
+    },
+    "travel_tips": {
+        "cultural": ["tip1", "tip2"],
+        "practical": ["tip1", "tip2"],
+        "safety": ["tip1", "tip2"],
+        "food": ["tip1", "tip2"]
+    },
+    "personalized_recommendations": {
+        "based_on_interests": ["rec1", "rec2"],
+        "budget_optimization": ["rec1", "rec2"],
+        "hidden_gems": ["rec1", "rec2"]
+    }
+}"""
+        }
+    
+    def _load_output_schemas(self) -> Dict[str, Dict[str, Any]]:
+        """Load JSON schemas matching the output formats, used to validate LLM responses"""
+        string_list = {"type": "array", "items": {"type": "string"}}
+        cost_line = {
+            "type": "object",
+            "properties": {
+                "estimated": {"type": ["number", "string"]},
+                "range": {"type": ["string", "number"]}
+            },
+            "required": ["estimated"]
+        }
+        string_lists = {"type": "object", "additionalProperties": string_list}
+        return {
+            # One schema per section prompt, each answer wrapped in its own top-level key
+            "itinerary": {
+                "type": "object",
+                "properties": {"itinerary": {"type": "object", "additionalProperties": string_list, "minProperties": 1}},
+                "required": ["itinerary"]
+            },
+            "budget_analysis": {
+                "type": "object",
+                "properties": {"budget_breakdown": {"type": "object", "additionalProperties": cost_line}},
+                "required": ["budget_breakdown"]
+            },
+            "travel_tips": {
+                "type": "object",
+                "properties": {"tips": string_lists},
+                "required": ["tips"]
+            },
+            "recommendations": {
+                "type": "object",
+                "properties": {"recommendations": string_lists},
+                "required": ["recommendations"]
+            },
+            "comprehensive": {
+                "type": "object",
+                "properties": {
+                    "itinerary": {"type": "object", "additionalProperties": string_list, "minProperties": 1},
+                    "budget_analysis": {"type": "object", "additionalProperties": cost_line},
+                    "travel_tips": {"type": "object", "additionalProperties": string_list},
+                    "personalized_recommendations": {"type": "object", "additionalProperties": string_list}
+                },
+                "required": ["itinerary", "budget_analysis", "travel_tips", "personalized_recommendations"]
+            }
+        }
+    
+    def _load_prompt_templates(self) -> Dict[str, Dict[str, str]]:
+        """
+        Per prompt type: the role line and general guidelines that go into the
+        static prefix, and the request template that makes up the suffix.
+        Nothing request-specific may appear in role or guidelines.
+        """
+        return {
+            "itinerary": {
+                "role": "You are an expert AI travel planner with deep knowledge of destinations worldwide.",
+                "guidelines": """IMPORTANT GUIDELINES:
+- Activities should be realistic for the traveler's budget
+- Focus on the traveler's specified interests
 - Include a mix of free and paid activities
 - Consider local culture and customs
 - Activities should be achievable within each day
 - Include meal suggestions where appropriate
-- Consider transportation between activities
-
+- Consider transportation between activities""",
+                "request": """Now plan a {days}-day trip to {destination} under ${budget} focused on {preferences}.
+{profile}
+Keep every activity realistic for the ${budget} budget and focused on: {preferences}.
 Return the itinerary in the exact JSON format specified above."""
-        
-        return prompt
-    
-    def build_budget_analysis_prompt(self, destination: str, days: int, budget: int,
-                                   traveler_profile: Dict[str, Any] = None) -> str:
-        """Build budget analysis prompt"""
-        
-        prompt = f"""You are an expert travel budget analyst.
-
-{self.output_formats['budget_analysis']}
-
-FEW-SHOT EXAMPLES:
-"""
-        
-        for example in self.few_shot_examples["budget_analysis"]:
-            prompt += f"""
-Input: {example['input']}
-Output: {example['output']}
-"""
-        
-        prompt += f"""
-Now analyze the budget for a {days}-day trip to {destination} with ${budget} total budget.
-"""
-        
-        if traveler_profile:
-            profile_context = self._build_profile_context(traveler_profile)
-            prompt += f"\nTRAVELER PROFILE CONTEXT:\n{profile_context}\n"
-        
-        prompt += f"""
-Consider:
-- Local cost of living in {destination}
+            },
+            "budget_analysis": {
+                "role": "You are an expert travel budget analyst.",
+                "guidelines": """Consider:
+- Local cost of living at the destination
 - Seasonal variations in prices
 - Traveler's budget preferences
 - Quality vs cost trade-offs
-- Emergency fund recommendations
-
+- Emergency fund recommendations""",
+                "request": """Now analyze the budget for a {days}-day trip to {destination} with ${budget} total budget.
+{profile}
 Return the budget analysis in the exact JSON format specified above."""
-        
-        return prompt
-    
-    def build_travel_tips_prompt(self, destination: str, traveler_profile: Dict[str, Any] = None) -> str:
-        """Build travel tips prompt"""
-        
-        prompt = f"""You are an expert travel advisor with local knowledge of {destination}.
-
-{self.output_formats['travel_tips']}
-
-FEW-SHOT EXAMPLES:
-"""
-        
-        for example in self.few_shot_examples["travel_tips"]:
-            prompt += f"""
-Input: {example['input']}
-Output: {example['output']}
-"""
-        
-        prompt += f"""
-Now provide comprehensive travel tips for visiting {destination}.
-"""
-        
-        if traveler_profile:
-            profile_context = self._build_profile_context(traveler_profile)
-            prompt += f"\nTRAVELER PROFILE CONTEXT:\n{profile_context}\n"
-        
-        prompt += f"""
-Focus on:
+            },
+            "travel_tips": {
+                "role": "You are an expert travel advisor with local knowledge of destinations worldwide.",
+                "guidelines": """Focus on:
 - Cultural etiquette and customs
 - Practical travel advice
 - Safety considerations
 - Local food and dining tips
 - Transportation tips
-- Money-saving advice
-
+- Money-saving advice""",
+                "request": """Now provide comprehensive travel tips for visiting {destination}.
+{profile}
 Return the travel tips in the exact JSON format specified above."""
-        
-        return prompt
+            },
+            "recommendations": {
+                "role": "You are an expert travel curator who finds personal touches for each trip.",
+                "guidelines": """Focus on:
+- Activities that match the traveler's interests
+- Ways to stretch the budget further
+- Lesser-known places most visitors miss""",
+                "request": """Now recommend extras for a {days}-day trip to {destination} under ${budget} focused on {preferences}.
+{profile}
+Return the recommendations in the exact JSON format specified above."""
+            },
+            "comprehensive": {
+                "role": "You are an expert AI travel planner. Create a comprehensive travel plan for the trip requested below.",
+                "guidelines": """IMPORTANT GUIDELINES:
+- Activities should be realistic for the traveler's budget
+- Focus on the traveler's specified interests
+- Include a mix of free and paid activities
+- Consider local culture and customs
+- Provide accurate budget estimates
+- Include practical and cultural travel tips
+- Offer personalized recommendations based on interests
+- Consider seasonal factors and local events""",
+                "request": """Now create a comprehensive {days}-day travel plan for {destination} under ${budget} focused on {preferences}.
+{profile}
+Keep every activity and estimate realistic for the ${budget} budget and focused on: {preferences}.
+Return the complete travel plan in the exact JSON format specified above."""
+            }
+        }
+
+    def _compile(self, kind: str, examples: Optional[int] = None) -> CompiledPrompt:
+        """Assemble the static prefix of one prompt type with its first `examples` few-shot examples"""
+        template = self.templates[kind]
+        chosen = self.few_shot_examples[kind][:examples]
+        parts = [template["role"], "\n\n", self.output_formats[kind], "\n"]
+        if chosen:
+            parts.append("\nFEW-SHOT EXAMPLES:\n")
+        for example in chosen:
+            parts.append(f"\nInput: {example['input']}\nOutput: {example['output']}\n")
+        parts.append("\n" + template["guidelines"] + "\n")
+        return CompiledPrompt(kind, "".join(parts), template["request"], len(chosen))
+
+    def _prefix(self, kind: str, examples: int) -> CompiledPrompt:
+        if examples == self.compiled[kind].examples:
+            return self.compiled[kind]
+        key = (kind, examples)
+        if key not in self.trimmed_prefixes:
+            self.trimmed_prefixes[key] = self._compile(kind, examples)
+        return self.trimmed_prefixes[key]
+
+    def output_tokens(self, kind: str, days: Optional[int] = None) -> int:
+        """Output tokens to reserve for a prompt type, capped at LLM_MAX_OUTPUT_TOKENS"""
+        fixed, per_day = OUTPUT_TOKENS[kind]
+        return min(LLM_MAX_OUTPUT_TOKENS, fixed + per_day * int(days or 1))
+
+    def plan_prompt(self, kind: str, traveler_profile: Dict[str, Any] = None,
+                    context_tokens: int = LLM_CONTEXT_TOKENS, **fields) -> PromptPlan:
+        """
+        Chat messages that fit the context window with room for the expected output
+        Few-shot examples are dropped first (down to one), then profile context
+        fields from the least useful, then the last example. If even the bare
+        prompt does not fit, max_tokens shrinks to whatever room is left.
+        """
+        reserve = self.output_tokens(kind, fields.get("days"))
+        profile = traveler_profile or {}
+        present = tuple(name for name in PROFILE_FIELDS if name in profile)
+        examples = self.compiled[kind].examples
+
+        candidates = [(n, len(present)) for n in range(examples, 0, -1)]
+        candidates += [(min(1, examples), f) for f in range(len(present) - 1, -1, -1)]
+        candidates.append((0, 0))
+
+        for n, f in candidates:
+            compiled = self._prefix(kind, n)
+            kept = {name: profile[name] for name in present[:f]}
+            profile_context = self._build_profile_context(kept) if kept else None
+            prefix, suffix = compiled.render(profile_context, **fields)
+            prompt_tokens = compiled.prefix_tokens + estimate_tokens(suffix)
+            if prompt_tokens + reserve <= context_tokens:
+                break
+        max_tokens = max(1, min(reserve, context_tokens - prompt_tokens))
+        trimmed = (n, f) != candidates[0]
+        if trimmed:
+            print(f"[DEBUG] Trimmed {kind} prompt to {n} examples and {f} profile fields "
+                  f"({prompt_tokens} tokens, max_tokens={max_tokens})")
+        messages = [{"role": "system", "content": prefix}, {"role": "user", "content": suffix}]
+        return PromptPlan(kind, messages, prompt_tokens, max_tokens, n, present[:f], trimmed)
+
+    def render(self, kind: str, traveler_profile: Dict[str, Any] = None, **fields) -> Tuple[str, str]:
+        """(static prefix, dynamic suffix) of a prompt type for one request"""
+        profile_context = self._build_profile_context(traveler_profile) if traveler_profile else None
+        return self.compiled[kind].render(profile_context, **fields)
+
+    def build_messages(self, kind: str, traveler_profile: Dict[str, Any] = None, **fields) -> List[Dict[str, str]]:
+        """Chat messages with the static prefix as the system message, so requests share it"""
+        prefix, suffix = self.render(kind, traveler_profile, **fields)
+        return [{"role": "system", "content": prefix}, {"role": "user", "content": suffix}]
+
+    def build_itinerary_prompt(self, destination: str, days: int, budget: int, 
+                              preferences: str, traveler_profile: Dict[str, Any] = None) -> str:
+        """Build enhanced itinerary prompt with few-shot examples and profile context"""
+        return "\n".join(self.render("itinerary", traveler_profile, destination=destination, days=days,
+                                     budget=budget, preferences=preferences))
+    
+    def build_budget_analysis_prompt(self, destination: str, days: int, budget: int,
+                                   traveler_profile: Dict[str, Any] = None) -> str:
+        """Build budget analysis prompt"""
+        return "\n".join(self.render("budget_analysis", traveler_profile, destination=destination, days=days,
+                                     budget=budget))
+    
+    def build_travel_tips_prompt(self, destination: str, traveler_profile: Dict[str, Any] = None) -> str:
+        """Build travel tips prompt"""
+        return "\n".join(self.render("travel_tips", traveler_profile, destination=destination))
+    
+    def build_recommendations_prompt(self, destination: str, days: int, budget: int,
+                                     preferences: str, traveler_profile: Dict[str, Any] = None) -> str:
+        """Build personalized recommendations prompt"""
+        return "\n".join(self.render("recommendations", traveler_profile, destination=destination, days=days,
+                                     budget=budget, preferences=preferences))
     
     def _build_profile_context(self, profile: Dict[str, Any]) -> str:
         """Build context string from traveler profile"""
@@ -199,84 +473,8 @@ Return the travel tips in the exact JSON format specified above."""
     def build_comprehensive_prompt(self, destination: str, days: int, budget: int,
                                  preferences: str, traveler_profile: Dict[str, Any] = None) -> str:
         """Build a comprehensive prompt that includes itinerary, budget analysis, and tips"""
-        
-        prompt = f"""You are an expert AI travel planner. Create a comprehensive travel plan for {destination}.
-
-Return ONLY valid JSON in this exact format (no explanations):
-{{
-    "itinerary": {{
-        "Day 1": ["activity1", "activity2", "activity3"],
-        "Day 2": ["activity1", "activity2", "activity3"]
-    }},
-    "budget_analysis": {{
-        "accommodation": {{"estimated": number, "range": "min-max"}},
-        "food": {{"estimated": number, "range": "min-max"}},
-        "transportation": {{"estimated": number, "range": "min-max"}},
-        "activities": {{"estimated": number, "range": "min-max"}},
-        "miscellaneous": {{"estimated": number, "range": "min-max"}}
-    }},
-    "travel_tips": {{
-        "cultural": ["tip1", "tip2"],
-        "practical": ["tip1", "tip2"],
-        "safety": ["tip1", "tip2"],
-        "food": ["tip1", "tip2"]
-    }},
-    "personalized_recommendations": {{
-        "based_on_interests": ["rec1", "rec2"],
-        "budget_optimization": ["rec1", "rec2"],
-        "hidden_gems": ["rec1", "rec2"]
-    }}
-}}
-
-FEW-SHOT EXAMPLE:
-Input: Plan a 3-day trip to Tokyo under $1500 focused on Culture, Food
-Output: {{
-    "itinerary": {{
-        "Day 1": ["Visit Senso-ji Temple in Asakusa", "Explore Tsukiji Outer Market", "Evening at Tokyo Skytree"],
-        "Day 2": ["Morning at Meiji Shrine", "Shibuya Crossing", "Traditional tea ceremony"],
-        "Day 3": ["Imperial Palace East Gardens", "Akihabara electronics district", "Farewell dinner at izakaya"]
-    }},
-    "budget_analysis": {{
-        "accommodation": {{"estimated": 300, "range": "250-350"}},
-        "food": {{"estimated": 200, "range": "180-250"}},
-        "transportation": {{"estimated": 80, "range": "60-100"}},
-        "activities": {{"estimated": 150, "range": "120-180"}},
-        "miscellaneous": {{"estimated": 50, "range": "30-70"}}
-    }},
-    "travel_tips": {{
-        "cultural": ["Remove shoes when entering temples", "Learn basic Japanese greetings"],
-        "practical": ["Get a Pasmo/Suica card", "Use Google Maps for navigation"],
-        "safety": ["Tokyo is very safe", "Keep valuables secure"],
-        "food": ["Try conveyor belt sushi", "Visit local ramen shops"]
-    }},
-    "personalized_recommendations": {{
-        "based_on_interests": ["Visit traditional tea houses", "Try authentic sushi at Tsukiji"],
-        "budget_optimization": ["Use convenience store meals", "Walk between nearby attractions"],
-        "hidden_gems": ["Explore Yanaka Ginza", "Visit Kappabashi kitchen street"]
-    }}
-}}
-
-Now create a comprehensive {days}-day travel plan for {destination} under ${budget} focused on {preferences}.
-"""
-        
-        if traveler_profile:
-            profile_context = self._build_profile_context(traveler_profile)
-            prompt += f"\nTRAVELER PROFILE CONTEXT:\n{profile_context}\n"
-        
-        prompt += f"""
-IMPORTANT GUIDELINES:
-- Activities should be realistic for the budget of ${budget}
-- Focus on the specified interests: {preferences}
-- Include a mix of free and paid activities
-- Consider local culture and customs
-- Provide accurate budget estimates
-- Include practical and cultural travel tips
-- Offer personalized recommendations based on interests
-- Consider seasonal factors and local events
-
-Return the complete travel plan in the exact JSON format specified above."""
-        
-        return prompt
+        return "\n".join(self.render("comprehensive", traveler_profile, destination=destination, days=days,
+                                     budget=budget, preferences=preferences))
 
 # Global instance for the application
 prompt_engine = PromptEngine() 
\ No newline at end of file
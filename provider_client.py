@@ -0,0 +1,213 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Executor, Future, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Status codes worth another attempt; anything else is returned to the caller as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Methods that are safe to send twice. Other requests (the Groq completion POST)
+# may already have been processed and billed after a read timeout or a 5xx, so
+# they are only retried on connect errors and on statuses that refuse the work.
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+SAFE_RETRY_STATUSES = {429, 503}
+
+# Per-provider defaults. Every value can be overridden from the environment with
+# <PROVIDER>_<SETTING>, e.g. GROQ_READ_TIMEOUT=30 or BOOKING_MAX_RETRIES=0.
+DEFAULT_PROVIDER_CONFIG = {
+    "booking": {
+        "base_url": "https://booking-com.p.rapidapi.com",
+        "connect_timeout": 3.05,
+        "read_timeout": 6.0,
+        "max_retries": 2,
+        "backoff_factor": 0.3,
+        "total_timeout": 8.0,
+        "pool_size": 10
+    },
+    "tavily": {
+        "base_url": "https://api.tavily.com",
+        "connect_timeout": 3.05,
+        "read_timeout": 6.0,
+        "max_retries": 2,
+        "backoff_factor": 0.3,
+        "total_timeout": 8.0,
+        "pool_size": 10
+    },
+    "groq": {
+        "base_url": "https://api.groq.com",
+        "connect_timeout": 3.05,
+        "read_timeout": 20.0,
+        "max_retries": 1,
+        "backoff_factor": 0.5,
+        # Every attempt and backoff together; keep below ITINERARY_DEADLINE
+        "total_timeout": 24.0,
+        "pool_size": 10
+    }
+}
+
+class ProviderClient:
+    """
+    Keep-alive HTTP client for one upstream provider
+    Owns a requests.Session with its own connection pool, applies connect/read
+    timeouts to every call and retries transient failures with jittered backoff.
+    All attempts and backoffs of one call fit in total_timeout: each attempt's
+    timeouts are cut to the time left, and no retry starts without enough time.
+    """
+
+    def __init__(self, name: str, base_url: str, connect_timeout: float, read_timeout: float,
+                 max_retries: int, backoff_factor: float, pool_size: int, total_timeout: float = 30.0):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.total_timeout = total_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After header"""
+        delay = random.uniform(0, self.backoff_factor * (2 ** attempt))
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.timeout[1]))
+        return delay
+
+    def _wait_for_retry(self, delay: float, deadline: float) -> bool:
+        """Sleep before a retry, or return False if the retry could not even connect before the deadline"""
+        if deadline - time.monotonic() - delay < self.timeout[0]:
+            return False
+        time.sleep(delay)
+        return True
+
+    @staticmethod
+    def _is_connect_error(error: Exception) -> bool:
+        """Whether the request failed before it reached the provider"""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+    def request(self, method: str, path: str, total_timeout: Optional[float] = None,
+                **kwargs) -> requests.Response:
+        """
+        Send a request, retrying connection errors, timeouts and retryable statuses
+        Non-idempotent methods are only retried when the provider cannot have
+        done the work. total_timeout can only shorten the client's own limit.
+        """
+        url = path if path.startswith('http') else f"{self.base_url}{path}"
+        budget = self.total_timeout if total_timeout is None else min(total_timeout, self.total_timeout)
+        deadline = min(time.monotonic() + budget, current_deadline() or float('inf'))
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else SAFE_RETRY_STATUSES
+        fixed_timeout = 'timeout' in kwargs
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.Timeout(f"{self.name} request not sent: deadline passed")
+            if not fixed_timeout:
+                kwargs['timeout'] = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retryable = idempotent or self._is_connect_error(e)
+                if last_attempt or not retryable or not self._wait_for_retry(self._retry_delay(attempt), deadline):
+                    raise
+                print(f"[DEBUG] {self.name} request failed ({e}), retrying")
+                continue
+
+            if response.status_code in retry_statuses and not last_attempt:
+                delay = self._retry_delay(attempt, response)
+                if deadline - time.monotonic() - delay >= self.timeout[0]:
+                    print(f"[DEBUG] {self.name} returned {response.status_code}, retrying")
+                    # Release the pooled connection before it is dropped
+                    response.close()
+                    self._wait_for_retry(delay, deadline)
+                    continue
+            return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+# --- Stage deadlines ---
+# Future.cancel() cannot stop a call that has started, so a planning stage that
+# misses its deadline would keep its worker busy. Stages run under a
+# thread-local deadline instead: every ProviderClient call on that thread is
+# cut to it, and calls after it fail at once, so an overrunning stage returns
+# its worker within about one connect timeout of the deadline.
+_stage = threading.local()
+
+def current_deadline() -> Optional[float]:
+    """The time.monotonic() deadline provider calls on this thread must meet, if any"""
+    return getattr(_stage, 'deadline', None)
+
+@contextmanager
+def stage_deadline(at: Optional[float]):
+    """Cap every provider call made on this thread inside the block at time.monotonic() `at`"""
+    previous = current_deadline()
+    if at is not None and previous is not None:
+        at = min(at, previous)
+    _stage.deadline = at if at is not None else previous
+    try:
+        yield
+    finally:
+        _stage.deadline = previous
+
+def submit_with_deadline(executor: Executor, at: Optional[float], fn: Callable, *args) -> Future:
+    """executor.submit() with fn's provider calls capped at `at`"""
+    def run():
+        with stage_deadline(at):
+            return fn(*args)
+    return executor.submit(run)
+
+def result_or_fallback(future: Future, at: float, fallback: Callable[[], Any]) -> Any:
+    """Wait for future until `at`, then cancel it if it has not started and return fallback()"""
+    try:
+        return future.result(timeout=max(0.0, at - time.monotonic()))
+    except FuturesTimeoutError:
+        future.cancel()
+        return fallback()
+
+def _load_provider_config() -> Dict[str, Dict[str, Any]]:
+    """Merge environment overrides into the default provider settings"""
+    config = {}
+    for name, defaults in DEFAULT_PROVIDER_CONFIG.items():
+        settings = dict(defaults)
+        for key, value in defaults.items():
+            override = os.getenv(f"{name.upper()}_{key.upper()}")
+            if override is not None:
+                settings[key] = type(value)(override)
+        config[name] = settings
+    return config
+
+class ProviderRegistry:
+    """One shared ProviderClient per configured provider"""
+
+    def __init__(self, config: Dict[str, Dict[str, Any]] = None):
+        self.config = config if config is not None else _load_provider_config()
+        self.clients = {name: ProviderClient(name, **settings) for name, settings in self.config.items()}
+
+    def __getitem__(self, name: str) -> ProviderClient:
+        return self.clients[name]
+
+# Global instance for the application
+providers = ProviderRegistry()
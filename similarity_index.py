@@ -0,0 +1,195 @@
+import os
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Budget tiers of the planning form; a profile's budget is one-hot encoded by tier
+BUDGET_TIERS = (500, 1000, 2000, 5000, 10000)
+
+# Hashed feature widths; wider means fewer collisions but more memory per profile
+INTEREST_DIMS = int(os.getenv("SIMILARITY_INTEREST_DIMS", "64"))
+DESTINATION_DIMS = int(os.getenv("SIMILARITY_DESTINATION_DIMS", "128"))
+
+def normalize_token(value: Any) -> str:
+    return ' '.join(str(value).lower().split())
+
+class SimilarityIndex:
+    """
+    Cross-user traveler similarity over a dense float32 feature matrix
+    Each profile is one row made of three blocks: hashed interests, a one-hot
+    budget tier and hashed destinations (visited or planned). Hashing is
+    signed, so tokens that share a slot do not systematically look alike. Each
+    block is L2-normalized and weighted, and the row is normalized again, so a
+    dot product is a weighted cosine similarity. A profile change rewrites its
+    row in place. A top-k query is one matrix product plus argpartition, and
+    several users can be queried with a single product.
+    """
+
+    def __init__(self, interest_dims: int = INTEREST_DIMS, destination_dims: int = DESTINATION_DIMS,
+                 weights: Tuple[float, float, float] = (1.0, 0.5, 1.0), capacity: int = 1024):
+        self.interest_dims = interest_dims
+        self.destination_dims = destination_dims
+        self.weights = weights
+        self.budget_offset = interest_dims
+        self.destination_offset = interest_dims + len(BUDGET_TIERS)
+        self.dims = self.destination_offset + destination_dims
+
+        self.matrix = np.zeros((capacity, self.dims), dtype=np.float32)
+        self.rows: Dict[str, int] = {}
+        self.users: List[Optional[str]] = []  # Row -> user id, None for free rows
+        self.destinations: List[Dict[str, str]] = []  # Row -> normalized name -> display name
+        self.free: List[int] = []
+        self._lock = threading.RLock()
+        self.updates = 0
+        self.queries = 0
+
+    # --- Encoding ---
+
+    @staticmethod
+    def _slot(token: str, dims: int) -> Tuple[int, float]:
+        digest = zlib.crc32(token.encode())
+        return digest % dims, 1.0 if digest & 0x80000000 else -1.0
+
+    @staticmethod
+    def budget_tier(budget: Optional[float]) -> Optional[int]:
+        if budget is None:
+            return None
+        for tier, limit in enumerate(BUDGET_TIERS):
+            if budget <= limit:
+                return tier
+        return len(BUDGET_TIERS) - 1
+
+    def encode(self, interests: Iterable[str] = (), budget: Optional[float] = None,
+               destinations: Iterable[str] = ()) -> np.ndarray:
+        """Feature row for one profile"""
+        vector = np.zeros(self.dims, dtype=np.float32)
+        blocks = [
+            (0, self.interest_dims, {normalize_token(i) for i in interests if i}),
+            (self.destination_offset, self.destination_dims, {normalize_token(d) for d in destinations if d})
+        ]
+        for (offset, dims, tokens), weight in zip(blocks, (self.weights[0], self.weights[2])):
+            for token in tokens:
+                slot, sign = self._slot(token, dims)
+                vector[offset + slot] += sign
+            block = vector[offset:offset + dims]
+            norm = np.linalg.norm(block)
+            if norm:
+                block *= weight / norm
+        tier = self.budget_tier(budget)
+        if tier is not None:
+            vector[self.budget_offset + tier] = self.weights[1]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # --- Incremental updates ---
+
+    def update(self, user_id: str, interests: Iterable[str] = (), budget: Optional[float] = None,
+               destinations: Iterable[str] = ()):
+        """Insert or rewrite one profile's row"""
+        user_id = str(user_id)
+        destinations = [d for d in destinations if d]
+        vector = self.encode(interests, budget, destinations)
+        names = {normalize_token(d): str(d).strip() for d in destinations}
+        with self._lock:
+            row = self.rows.get(user_id)
+            if row is None:
+                row = self._allocate(user_id)
+            self.matrix[row] = vector
+            self.destinations[row] = names
+            self.updates += 1
+
+    def _allocate(self, user_id: str) -> int:
+        if self.free:
+            row = self.free.pop()
+            self.users[row] = user_id
+        else:
+            row = len(self.users)
+            if row == len(self.matrix):
+                grown = np.zeros((2 * len(self.matrix), self.dims), dtype=np.float32)
+                grown[:row] = self.matrix
+                self.matrix = grown
+            self.users.append(user_id)
+            self.destinations.append({})
+        self.rows[user_id] = row
+        return row
+
+    def remove(self, user_id: str) -> bool:
+        with self._lock:
+            row = self.rows.pop(str(user_id), None)
+            if row is None:
+                return False
+            self.matrix[row] = 0.0
+            self.users[row] = None
+            self.destinations[row] = {}
+            self.free.append(row)
+            return True
+
+    # --- Queries ---
+
+    def similar_many(self, user_ids: Sequence[str], k: int = 10) -> Dict[str, List[Tuple[str, float]]]:
+        """Top-k most similar other travelers for each user, from one matrix product"""
+        user_ids = [str(user_id) for user_id in user_ids]
+        with self._lock:
+            known = [user_id for user_id in user_ids if user_id in self.rows]
+            if not known:
+                return {user_id: [] for user_id in user_ids}
+            rows = np.array([self.rows[user_id] for user_id in known])
+            size = len(self.users)
+            scores = self.matrix[rows] @ self.matrix[:size].T  # queries x profiles
+            scores[np.arange(len(rows)), rows] = -np.inf
+            k = min(k, size - 1)
+            results = {user_id: [] for user_id in user_ids}
+            if k > 0:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                for i, user_id in enumerate(known):
+                    ranked = top[i][np.argsort(-scores[i, top[i]])]
+                    results[user_id] = [(self.users[row], float(scores[i, row])) for row in ranked
+                                        if scores[i, row] > 0 and self.users[row] not in (None, user_id)]
+            self.queries += len(known)
+            return results
+
+    def similar(self, user_id: str, k: int = 10) -> List[Tuple[str, float]]:
+        return self.similar_many([user_id], k)[str(user_id)]
+
+    def recommend_destinations_many(self, user_ids: Sequence[str], neighbors: int = 25, top: int = 5,
+                                    exclude: Iterable[str] = ()) -> Dict[str, List[str]]:
+        """Destinations of similar travelers each user has not been to, weighted by similarity"""
+        user_ids = [str(user_id) for user_id in user_ids]
+        excluded = {normalize_token(d) for d in exclude}
+        similar = self.similar_many(user_ids, neighbors)
+        results = {}
+        with self._lock:
+            for user_id in user_ids:
+                own = self.destinations[self.rows[user_id]] if user_id in self.rows else {}
+                totals: Dict[str, float] = {}
+                names: Dict[str, str] = {}
+                for other, score in similar[user_id]:
+                    row = self.rows.get(other)
+                    if row is None:
+                        continue
+                    for key, name in self.destinations[row].items():
+                        if key not in own and key not in excluded:
+                            totals[key] = totals.get(key, 0.0) + score
+                            names.setdefault(key, name)
+                ranked = sorted(totals, key=lambda key: (-totals[key], key))[:top]
+                results[user_id] = [names[key] for key in ranked]
+        return results
+
+    def recommend_destinations(self, user_id: str, neighbors: int = 25, top: int = 5,
+                               exclude: Iterable[str] = ()) -> List[str]:
+        return self.recommend_destinations_many([user_id], neighbors, top, exclude)[str(user_id)]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'profiles': len(self.rows),
+            'dims': self.dims,
+            'capacity': len(self.matrix),
+            'matrix_mb': round(self.matrix.nbytes / 1024 / 1024, 1),
+            'updates': self.updates,
+            'queries': self.queries
+        }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test script for the Booking dest_id cache:
+1. In-process and database tiers for known cities
+2. Cached negatives and uncached provider failures
+3. Expiry of stored entries
+"""
+
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep the app's databases and caches out of the instance folder
+tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "travel_planner.db")
+os.environ["PROFILE_STORE_PATH"] = os.path.join(tmp_dir, "profiles.db")
+os.environ["PLAN_QUEUE_PATH"] = os.path.join(tmp_dir, "plan_jobs.db")
+os.environ["SHARED_CACHE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "shared_cache.db")
+
+import traveler_planner as planner
+
+ANSWERS = {
+    "Tokyo": ("-246227", True),
+    "Atlantis": (None, True),
+    "Lisbon": (None, False)
+}
+
+def stub_lookups():
+    """Replace the Booking call with canned answers; returns the list of cities asked for"""
+    calls = []
+    def lookup(city):
+        calls.append(city)
+        return ANSWERS[city.strip().title()]
+    planner.lookup_dest_id = lookup
+    planner.dest_id_cache.clear()
+    return calls
+
+def stored_row(city):
+    with planner.app.app_context():
+        return planner.db.session.get(planner.DestinationCache, city)
+
+def test_known_city():
+    """Test that a city is looked up once and then served from either tier"""
+    print("🧪 Testing dest_id cache tiers...")
+
+    original_lookup = planner.lookup_dest_id
+    calls = stub_lookups()
+    try:
+        assert planner.get_dest_id("Tokyo") == "-246227"
+        assert planner.get_dest_id("  TOKYO ") == "-246227"
+        assert calls == ["Tokyo"]
+        print("✅ Repeat and differently written cities hit the in-process cache")
+
+        planner.dest_id_cache.clear()
+        assert planner.get_dest_id("tokyo") == "-246227" and calls == ["Tokyo"]
+        row = stored_row("tokyo")
+        assert row.dest_id == "-246227"
+        assert row.expires_at > datetime.utcnow() + planner.DEST_ID_TTL - timedelta(minutes=1)
+        print(f"✅ A new process is answered from the destination_cache table until {row.expires_at:%Y-%m-%d}")
+
+        assert planner.get_dest_id("") is None and planner.get_dest_id(None) is None
+        assert calls == ["Tokyo"]
+    finally:
+        planner.lookup_dest_id = original_lookup
+
+def test_negative_and_failed_lookups():
+    """Test that unknown cities are cached briefly and provider failures not at all"""
+    print("\n🧪 Testing cached negatives...")
+
+    original_lookup = planner.lookup_dest_id
+    calls = stub_lookups()
+    try:
+        assert planner.get_dest_id("Atlantis") is None
+        planner.dest_id_cache.clear()
+        assert planner.get_dest_id("atlantis") is None
+        assert calls == ["Atlantis"]
+        row = stored_row("atlantis")
+        assert row.dest_id is None
+        assert row.expires_at < datetime.utcnow() + planner.DEST_ID_NEGATIVE_TTL + timedelta(minutes=1)
+        print("✅ An unknown city was remembered for the short negative TTL")
+
+        assert planner.get_dest_id("Lisbon") is None
+        assert planner.get_dest_id("Lisbon") is None
+        assert calls == ["Atlantis", "Lisbon", "Lisbon"] and stored_row("lisbon") is None
+        print("✅ A failed lookup is retried on the next request and never stored")
+    finally:
+        planner.lookup_dest_id = original_lookup
+
+def test_expiry():
+    """Test that an expired stored entry is looked up again and refreshed"""
+    print("\n🧪 Testing dest_id expiry...")
+
+    original_lookup = planner.lookup_dest_id
+    calls = stub_lookups()
+    try:
+        planner.get_dest_id("Tokyo")
+        with planner.app.app_context():
+            row = planner.db.session.get(planner.DestinationCache, "tokyo")
+            row.expires_at = datetime.utcnow() - timedelta(seconds=1)
+            planner.db.session.commit()
+        planner.dest_id_cache.clear()
+        assert planner.get_dest_id("Tokyo") == "-246227" and calls == ["Tokyo"]
+        assert stored_row("tokyo").expires_at > datetime.utcnow()
+        print("✅ An expired row was looked up again and its expiry renewed")
+    finally:
+        planner.lookup_dest_id = original_lookup
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting dest_id cache tests...\n")
+
+    try:
+        test_known_city()
+        test_negative_and_failed_lookups()
+        test_expiry()
+        print("\n🎉 All dest_id cache tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        planner.plan_workers.stop()
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for the destination co-visit graph:
+1. Edge weights from co-visit frequency and interest overlap
+2. Precomputed related-destination lookups and recommendations
+3. Incremental plan syncing by plan id
+4. Plan edits and deletes, and previous trips from profiles
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from destination_graph import DestinationGraph
+from traveler_profile import TravelerProfile
+
+def build_graph():
+    graph = DestinationGraph(neighbors=3)
+    graph.add_visit("a", "Lisbon", ["Food", "Art"])
+    graph.add_visit("a", "Porto", ["food", "art"])
+    graph.add_visit("b", "lisbon ", ["Food"])
+    graph.add_visit("b", "Porto", ["Hiking"])
+    graph.add_visit("c", "Lisbon", ["Beach"])
+    graph.add_visit("c", "Seville", ["Beach"])
+    return graph
+
+def test_edge_weights():
+    """Test that edges count distinct travelers and add interest overlap"""
+    print("🧪 Testing co-visit edge weights...")
+
+    graph = build_graph()
+    assert graph.graph["lisbon"]["porto"] == {'weight': 3.0, 'travelers': 2}
+    assert graph.graph["lisbon"]["seville"]['weight'] == 2.0
+    assert graph.graph.nodes["lisbon"]['travelers'] == 3
+    print(f"✅ Lisbon-Porto weighs {graph.graph['lisbon']['porto']['weight']} from 2 travelers")
+
+    graph.add_visit("a", "Porto", ["Wine"])
+    assert graph.graph["lisbon"]["porto"]['weight'] == 3.0
+    assert graph.graph.nodes["porto"]['plans'] == 3 and graph.visits["a"]["porto"] == {"food", "art", "wine"}
+    assert not graph.add_visit("a", "  ")
+    print("✅ Repeat plans by the same traveler do not inflate co-visit weights")
+
+def test_related_lookups():
+    """Test that related() and recommend() read the precomputed neighbor lists"""
+    print("\n🧪 Testing related destinations...")
+
+    graph = build_graph()
+    assert graph.related("LISBON") == ["Porto", "Seville"]
+    assert graph.related("Porto") == ["Lisbon"] and graph.related("Atlantis") == []
+    assert graph.recommend(["Porto"]) == ["Lisbon"]
+    assert graph.recommend_for("c") == ["Porto"]
+    print(f"✅ Travelers who planned Lisbon also planned: {graph.related('Lisbon')}")
+
+    for i in range(5):
+        graph.add_visit("d", f"City {i}", [])
+    graph.add_visit("d", "Lisbon", [])
+    assert len(graph.related_lists["lisbon"]) == 3 and graph.related("Lisbon")[:1] == ["Porto"]
+    print("✅ Neighbor lists stay capped at the configured size")
+
+def test_plan_sync():
+    """Test that plans are applied once, in id order"""
+    print("\n🧪 Testing incremental plan sync...")
+
+    graph = DestinationGraph()
+    assert graph.add_plan(1, "a", "Rome", ["Food"])
+    assert graph.add_plan(2, "a", "Florence", ["Food", "Art"])
+    assert not graph.add_plan(2, "a", "Florence", ["Food", "Art"])
+    assert not graph.add_plan(1, "b", "Rome", [])
+    assert graph.graph["rome"]["florence"]['weight'] == 1.5
+    assert graph.stats()['last_plan_id'] == 2 and graph.stats()['travelers'] == 1
+    print(f"✅ Already-synced plans are skipped: {graph.stats()}")
+
+def test_plan_edits():
+    """Test that edited and deleted plans move or remove their co-visits"""
+    print("\n🧪 Testing plan edits and deletes...")
+
+    graph = DestinationGraph()
+    graph.add_plan(1, "a", "Rome", ["Food"])
+    graph.add_plan(2, "a", "Florence", ["Food"])
+    graph.add_plan(3, "b", "Rome", [])
+    graph.add_plan(4, "b", "Florence", [])
+    assert graph.graph["rome"]["florence"] == {'weight': 3.0, 'travelers': 2}
+
+    assert graph.update_plan(2, "a", "Naples", ["Food"])
+    assert graph.graph["rome"]["florence"] == {'weight': 1.0, 'travelers': 1}
+    assert graph.related("Rome") == ["Naples", "Florence"]
+    assert graph.graph.nodes["florence"]['plans'] == 1 and graph.graph.nodes["naples"]['travelers'] == 1
+    print(f"✅ An edited plan moved its co-visit: Rome -> {graph.related('Rome')}")
+
+    assert graph.remove_plan(4) and not graph.remove_plan(4)
+    assert "florence" not in graph.graph and graph.related("Rome") == ["Naples"]
+    assert graph.remove_plan(1)
+    assert graph.graph.number_of_edges() == 0 and graph.related("Naples") == []
+    assert not graph.update_plan(9, "a", "Oslo", [])
+    print(f"✅ Deleted plans leave no edges behind: {graph.stats()}")
+
+def test_previous_trips():
+    """Test that previous trips in profiles count as co-visits"""
+    print("\n🧪 Testing previous trips...")
+
+    graph = DestinationGraph()
+    graph.add_plan(1, "a", "Lisbon", ["Food"])
+    assert graph.set_trips("a", ["Porto", "Lisbon"], ["Food"])
+    assert not graph.set_trips("a", ["Porto", "Lisbon"], ["Food"])
+    assert graph.related("Porto") == ["Lisbon"] and graph.graph["lisbon"]["porto"]['travelers'] == 1
+    assert graph.graph.nodes["porto"]['plans'] == 0
+    assert graph.set_trips("a", [])
+    assert "porto" not in graph.graph and graph.visits["a"] == {"lisbon": {"food"}}
+    print("✅ Trips add and drop co-visits without counting as plans")
+
+    profiles = TravelerProfile()
+    profiles.attach_destination_graph(graph)
+    profiles.create_profile("a")
+    profiles.update_interests_profile("a", ["Food"])
+    profiles.add_previous_trip("a", "Seville", {})
+    assert graph.related("Lisbon") == ["Seville"]
+    assert graph.graph["lisbon"]["seville"]['weight'] == 2.0
+    profiles.delete_profile("a")
+    assert graph.related("Lisbon") == []
+    print("✅ A profile's previous trips follow the profile")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting destination graph tests...\n")
+
+    try:
+        test_edge_weights()
+        test_related_lookups()
+        test_plan_sync()
+        test_plan_edits()
+        test_previous_trips()
+        print("\n🎉 All destination graph tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script for the outbound email queue against a local SMTP stand-in:
+1. Connection reuse and batching
+2. Retry after a dropped connection
+3. Permanent failures and malformed messages
+"""
+
+import sys
+import os
+import socketserver
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from email_queue import EmailDispatcher
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that records messages; can drop the first N sessions"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, drop_sessions=0):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.messages = []
+        self.sessions = 0
+        self.drop_sessions = drop_sessions
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        server.sessions += 1
+        if server.sessions <= server.drop_sessions:
+            return
+        self.reply("220 stub ready")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ")[0].upper()
+            if command == "EHLO":
+                self.reply("250-stub\r\n250 AUTH PLAIN")
+            elif command == "AUTH":
+                self.reply("235 authenticated")
+            elif command == "RCPT" and "nobody@" in line:
+                self.reply("550 no such user")
+            elif command == "DATA":
+                self.reply("354 end with .")
+                data = []
+                while True:
+                    part = self.rfile.readline().decode()
+                    if part.rstrip("\r\n") == ".":
+                        break
+                    data.append(part)
+                server.messages.append("".join(data))
+                self.reply("250 queued")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+def start_stub(drop_sessions=0):
+    server = StubSMTPServer(drop_sessions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def test_connection_reuse():
+    """Test that a burst of messages shares one authenticated connection"""
+    print("🧪 Testing SMTP connection reuse...")
+
+    server = start_stub()
+    dispatcher = EmailDispatcher("127.0.0.1", server.server_address[1], "planner@example.com", "secret",
+                                 use_tls=False, batch_window=0.1)
+    for i in range(5):
+        assert dispatcher.enqueue(f"user{i}@example.com", "Verify", f"<b>code {i}</b>")
+    assert dispatcher.flush(timeout=5)
+
+    stats = dispatcher.stats()
+    assert len(server.messages) == 5 and server.sessions == 1
+    assert stats['sent'] == 5 and stats['connections'] == 1
+    print(f"✅ Sent five messages over one connection: {stats}")
+    server.shutdown()
+
+def test_retry():
+    """Test that a dropped connection is retried with backoff"""
+    print("\n🧪 Testing SMTP retry...")
+
+    server = start_stub(drop_sessions=1)
+    dispatcher = EmailDispatcher("127.0.0.1", server.server_address[1], "planner@example.com", "secret",
+                                 use_tls=False, backoff_factor=0.05)
+    assert dispatcher.enqueue("user@example.com", "Reset", "<b>code</b>")
+    assert dispatcher.flush(timeout=5)
+
+    stats = dispatcher.stats()
+    assert len(server.messages) == 1 and stats['retries'] == 1 and stats['failed'] == 0
+    print(f"✅ Delivered after a dropped connection: {stats}")
+    server.shutdown()
+
+    unconfigured = EmailDispatcher("127.0.0.1", 25)
+    assert unconfigured.enqueue("user@example.com", "Reset", "<b>code</b>") is False
+    print("✅ Refused to queue without SMTP credentials")
+
+def test_permanent_failures():
+    """Test that refused recipients and broken messages are dropped without stalling the queue"""
+    print("\n🧪 Testing permanent email failures...")
+
+    server = start_stub()
+    dispatcher = EmailDispatcher("127.0.0.1", server.server_address[1], "planner@example.com", "secret",
+                                 use_tls=False, backoff_factor=0.05)
+    assert dispatcher.enqueue("nobody@example.com", "Verify", "<b>code</b>")
+    assert dispatcher.enqueue("user@example.com", "Verify", None)
+    assert dispatcher.flush(timeout=5)
+    stats = dispatcher.stats()
+    assert stats['failed'] == 2 and stats['retries'] == 0 and server.messages == []
+    print(f"✅ A 550 recipient and an unbuildable message were dropped after one attempt: {stats}")
+
+    assert dispatcher.enqueue("user@example.com", "Verify", "<b>code</b>")
+    assert dispatcher.flush(timeout=5)
+    assert len(server.messages) == 1 and dispatcher.stats()['sent'] == 1
+    print("✅ The worker kept sending after the failures")
+    server.shutdown()
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting email queue tests...\n")
+
+    try:
+        test_connection_reuse()
+        test_retry()
+        test_permanent_failures()
+        print("\n🎉 All email queue tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
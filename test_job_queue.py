@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test script for the background job queue:
+1. Persistent queue (claim, retry, leases and restart recovery)
+2. Worker pool
+"""
+
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_queue import PersistentJobQueue, JobWorkerPool
+
+def test_persistent_queue():
+    """Test FIFO claims, retries and recovery of interrupted jobs"""
+    print("🧪 Testing persistent job queue...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        queue = PersistentJobQueue(path, max_attempts=2, lease_seconds=0.2)
+        first = queue.enqueue("plan", {"plan_id": 1})
+        queue.enqueue("plan", {"plan_id": 2})
+
+        job_id, kind, payload = queue.claim()
+        assert job_id == first and kind == "plan" and payload == {"plan_id": 1}
+        print("✅ Claimed the oldest job first")
+
+        # Another process starts while job 1 is still running under a live lease
+        restarted = PersistentJobQueue(path, max_attempts=2, lease_seconds=0.2)
+        assert restarted.requeue_expired() == 0
+        assert restarted.counts() == {"queued": 1, "running": 1}
+        assert queue.heartbeat([first]) == 1 and restarted.heartbeat([first]) == 0
+        print("✅ Left a job leased by a live worker alone")
+
+        # The first worker dies; its lease runs out
+        time.sleep(0.3)
+        assert restarted.requeue_expired() == 1
+        assert restarted.counts() == {"queued": 2}
+        assert not queue.complete(first)
+        print("✅ Requeued a job whose lease expired")
+
+        job_id, _, _ = restarted.claim()
+        assert job_id == first
+        assert restarted.fail(job_id, "RuntimeError: groq down") is False
+        assert restarted.counts() == {"queued": 1, "failed": 1}
+        job_id, _, _ = restarted.claim()
+        assert restarted.fail(job_id, "RuntimeError: groq down") is True
+        job_id, _, _ = restarted.claim()
+        restarted.complete(job_id)
+        assert restarted.claim() is None
+        assert restarted.counts() == {"done": 1, "failed": 1}
+        print(f"✅ Retried until max_attempts: {restarted.counts()}")
+
+def test_worker_pool():
+    """Test that a bounded pool runs every job and reports permanent failures"""
+    print("\n🧪 Testing job worker pool...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = PersistentJobQueue(os.path.join(tmp, "jobs.db"), max_attempts=1)
+        done = []
+        failures = []
+        lock = threading.Lock()
+
+        def handler(payload):
+            if payload["n"] == 3:
+                raise ValueError("bad plan")
+            with lock:
+                done.append(payload["n"])
+
+        pool = JobWorkerPool(queue, {"plan": handler}, workers=2, poll_interval=0.05,
+                             on_failure=lambda job_id, payload, error: failures.append(error))
+        pool.start()
+        for n in range(6):
+            queue.enqueue("plan", {"n": n})
+        pool.notify()
+
+        deadline = time.monotonic() + 5
+        while pool.completed + pool.failed < 6 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        pool.stop(timeout=1)
+
+        assert sorted(done) == [0, 1, 2, 4, 5]
+        assert failures == ["ValueError: bad plan"]
+        print(f"✅ Ran all jobs on two workers: {pool.stats()}")
+
+def test_lease_heartbeat():
+    """Test that a long job keeps its lease while its worker is alive"""
+    print("\n🧪 Testing job lease heartbeats...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        queue = PersistentJobQueue(path, lease_seconds=0.15)
+        started = threading.Event()
+
+        def slow_handler(payload):
+            started.set()
+            time.sleep(0.6)
+
+        pool = JobWorkerPool(queue, {"plan": slow_handler}, workers=1, poll_interval=0.05)
+        pool.start()
+        queue.enqueue("plan", {})
+        pool.notify()
+        assert started.wait(2)
+
+        other = PersistentJobQueue(path, lease_seconds=0.15)
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            assert other.claim() is None and other.requeue_expired() == 0
+            time.sleep(0.05)
+        while pool.completed < 1 and time.monotonic() < deadline + 2:
+            time.sleep(0.02)
+        pool.stop(timeout=1)
+        assert pool.completed == 1 and queue.counts() == {"done": 1}
+        print("✅ Another process never took over a job that outlived its lease period")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting job queue tests...\n")
+
+    try:
+        test_persistent_queue()
+        test_worker_pool()
+        test_lease_heartbeat()
+        print("\n🎉 All job queue tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
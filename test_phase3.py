@@ -146,6 +146,77 @@ def test_integration():
     
     return True
 
+def test_static_prefixes():
+    """Test that every prompt type has a byte-identical prefix across requests"""
+    print("\n🧪 Testing static prompt prefixes...")
+    
+    engine = PromptEngine()
+    requests = [
+        dict(destination="Reykjavik", days=5, budget=2000, preferences="Culture, Food"),
+        dict(destination="Lisbon", days=2, budget=700, preferences="Beaches")
+    ]
+    fields = {
+        "itinerary": ("destination", "days", "budget", "preferences"),
+        "budget_analysis": ("destination", "days", "budget"),
+        "travel_tips": ("destination",),
+        "comprehensive": ("destination", "days", "budget", "preferences")
+    }
+    for kind, names in fields.items():
+        parts = [engine.render(kind, profile, **{name: request[name] for name in names})
+                 for request, profile in zip(requests, [None, {"interests": ["Art"]}])]
+        assert parts[0][0].encode() == parts[1][0].encode()
+        assert parts[0][0] is engine.compiled[kind].prefix
+        assert "Reykjavik" not in parts[0][0] and "Lisbon" not in parts[1][0]
+        assert "Reykjavik" in parts[0][1] and "TRAVELER PROFILE CONTEXT" in parts[1][1]
+        print(f"✅ {kind}: {len(parts[0][0])}-character static prefix, "
+              f"{len(parts[0][1])}-character suffix")
+    
+    prompt = engine.build_comprehensive_prompt("Lisbon", 2, 700, "Beaches")
+    messages = engine.build_messages("comprehensive", destination="Lisbon", days=2, budget=700,
+                                     preferences="Beaches")
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert prompt == messages[0]["content"] + "\n" + messages[1]["content"]
+    print("✅ Chat messages put the static prefix in the system message")
+
+def test_token_budget():
+    """Test that prompts are trimmed to fit the context window and their sizes recorded"""
+    print("\n🧪 Testing prompt token budgeting...")
+    from prompt_engine import estimate_tokens
+    
+    assert estimate_tokens("") == 0 and estimate_tokens("Visit the Louvre") == 3
+    assert estimate_tokens('{"estimated": 1500}') == 9
+    print("✅ Estimated token counts offline")
+    
+    engine = PromptEngine()
+    profile = {"interests": ["Art"], "budget": "$900", "nationality": "Canadian",
+               "previous_trips": [{"destination": "Oslo"}]}
+    trip = dict(destination="Lisbon", days=4, budget=900, preferences="Food")
+    full = engine.plan_prompt("itinerary", profile, **trip)
+    assert not full.trimmed and full.examples == 2 and len(full.profile_fields) == 4
+    assert full.messages[0]["content"] is engine.compiled["itinerary"].prefix
+    assert full.max_tokens == engine.output_tokens("itinerary", 4)
+    print(f"✅ Full prompt fits: {full.prompt_tokens} tokens, max_tokens={full.max_tokens}")
+    
+    tight = engine.plan_prompt("itinerary", profile, context_tokens=full.prompt_tokens + full.max_tokens - 1, **trip)
+    assert tight.trimmed and tight.examples == 1 and len(tight.profile_fields) == 4
+    assert tight.prompt_tokens + tight.max_tokens <= full.prompt_tokens + full.max_tokens - 1
+    assert "Paris" not in tight.messages[0]["content"]
+    again = engine.plan_prompt("itinerary", profile, context_tokens=full.prompt_tokens + full.max_tokens - 1, **trip)
+    assert again.messages[0]["content"] is tight.messages[0]["content"]
+    print(f"✅ Dropped a few-shot example first: {tight.prompt_tokens} tokens")
+    
+    tiny = engine.plan_prompt("itinerary", profile, context_tokens=400, **trip)
+    assert tiny.examples == 0 and tiny.profile_fields == ()
+    assert tiny.max_tokens == 400 - tiny.prompt_tokens
+    print(f"✅ Shrank output to the room left: max_tokens={tiny.max_tokens}")
+    
+    engine.prompt_stats.record(full, 1.5, prompt_tokens=full.prompt_tokens * 2)
+    engine.prompt_stats.record(tiny, 0.5)
+    stats = engine.prompt_stats.stats()
+    assert stats['requests'] == 2 and stats['trimmed'] == 1 and stats['estimate_ratio'] == 2.0
+    assert sum(b['requests'] for b in stats['latency_by_prompt_tokens'].values()) == 2
+    print(f"✅ Recorded prompt sizes and latencies: {stats}")
+
 def main():
     """Run all tests"""
     print("🚀 Starting Phase 3 Feature Tests...\n")
@@ -160,6 +231,12 @@ def main():
         # Test integration
         test_integration()
         
+        # Test static prompt prefixes
+        test_static_prefixes()
+        
+        # Test prompt token budgeting
+        test_token_budget()
+        
         print("\n🎉 All tests passed! Phase 3 features are working correctly.")
         print("\n📋 Summary of implemented features:")
         print("   ✅ Graph-based traveler profile with NetworkX")
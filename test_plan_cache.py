@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM plan cache:
+1. Cache key canonicalization of the planning inputs
+2. Traveler profiles reaching the cache key
+3. Cache hits and the fresh-plan opt-out
+4. Error plans for unusable inputs in both generation modes
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep the app's databases and caches out of the instance folder
+tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "travel_planner.db")
+os.environ["PROFILE_STORE_PATH"] = os.path.join(tmp_dir, "profiles.db")
+os.environ["PLAN_QUEUE_PATH"] = os.path.join(tmp_dir, "plan_jobs.db")
+os.environ["SHARED_CACHE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "shared_cache.db")
+
+import traveler_planner as planner
+
+FORM = {
+    'destination': 'Kyoto',
+    'departure_city': 'Osaka',
+    'budget': '1500',
+    'days': '4',
+    'preferences': 'Temples, Food',
+    'checkin_date': '2026-04-01',
+    'checkout_date': '2026-04-05'
+}
+
+def make_user(email):
+    with planner.app.app_context():
+        user = planner.User(email=email, password_hash="unused")
+        planner.db.session.add(user)
+        planner.db.session.commit()
+        return user.id
+
+def test_key_canonicalization():
+    """Test that equivalent inputs share a key and meaningful changes do not"""
+    print("🧪 Testing plan cache key canonicalization...")
+
+    key = planner.plan_cache_key("Kyoto", "4", "1500", "Temples, Food", {})
+    assert key == planner.plan_cache_key("  kyoto ", 4, 2000, "food,temples , ,", {})
+    assert key == planner.plan_cache_key("KYOTO", "4", "1999", " FOOD, Temples", None)
+    print("✅ Case, whitespace, interest order and budget tier do not change the key")
+
+    assert planner.plan_cache_key("New  York", 3, 800, None, {}) == \
+        planner.plan_cache_key("new york", 3, 800, "General", {})
+    changed = [
+        planner.plan_cache_key("Osaka", "4", "1500", "Temples, Food", {}),
+        planner.plan_cache_key("Kyoto", "5", "1500", "Temples, Food", {}),
+        planner.plan_cache_key("Kyoto", "4", "2500", "Temples, Food", {}),
+        planner.plan_cache_key("Kyoto", "4", "1500", "Temples", {})
+    ]
+    assert key not in changed and len(set(changed)) == len(changed)
+    print("✅ Destination, days, budget tier and interests each change the key")
+
+def test_profile_in_key():
+    """Test that the traveler profile reaches and shapes the key"""
+    print("\n🧪 Testing profile-dependent keys...")
+
+    profile = {'travel_style': 'cultural', 'interests': ['temples', 'food']}
+    reordered = {'interests': ['temples', 'food'], 'travel_style': 'cultural'}
+    key = planner.plan_cache_key("Kyoto", 4, 1500, "Food", profile)
+    assert key == planner.plan_cache_key("Kyoto", 4, 1500, "Food", reordered)
+    assert key != planner.plan_cache_key("Kyoto", 4, 1500, "Food", {})
+    assert key != planner.plan_cache_key("Kyoto", 4, 1500, "Food", dict(profile, travel_style='luxury'))
+    print("✅ Profile contents, not their order, change the key")
+
+    user_id = make_user("cache-test@example.com")
+    with planner.app.test_request_context('/', method='POST', data=FORM):
+        pipeline_args, _ = planner.prepare_planning_request(user_id)
+    context = pipeline_args['profile_context']
+    assert context == {'budget': '$1500', 'interests': ['Temples', 'Food']}
+    assert pipeline_args['use_cache'] is True
+    assert planner.plan_cache_key("Kyoto", 4, 1500, "Temples, Food", context) != \
+        planner.plan_cache_key("Kyoto", 4, 1500, "Temples, Food", {})
+    print(f"✅ A planning request carries the traveler's profile into the key: {context}")
+
+def test_cache_opt_out():
+    """Test that repeat plans are cache hits and fresh plans bypass but refresh the cache"""
+    print("\n🧪 Testing plan cache hits and opt-out...")
+
+    replies = []
+    def fake_completion(prompt):
+        replies.append(prompt)
+        return json.dumps({
+            "itinerary": {"Day 1": [f"Fushimi Inari, take {len(replies)}"]},
+            "budget_analysis": {}, "travel_tips": {}, "personalized_recommendations": {}
+        })
+
+    original_completion = planner.groq_completion
+    planner.groq_completion = fake_completion
+    planner.plan_cache.clear()
+    try:
+        first = planner.generate_plan("Kyoto", 4, 1500, "Temples", {})
+        assert planner.generate_plan(" kyoto", "4", "1200", "temples", {}) == first
+        assert len(replies) == 1
+        print("✅ An equivalent request was served from the cache")
+
+        fresh = planner.generate_plan("Kyoto", 4, 1500, "Temples", {}, use_cache=False)
+        assert len(replies) == 2 and fresh != first
+        assert planner.generate_plan("Kyoto", 4, 1500, "Temples", {}) == fresh
+        assert len(replies) == 2
+        print("✅ A fresh plan skipped the cache and replaced the cached entry")
+    finally:
+        planner.groq_completion = original_completion
+
+    user_id = make_user("fresh-test@example.com")
+    with planner.app.test_request_context('/', method='POST', data=dict(FORM, fresh_plan='on')):
+        pipeline_args, _ = planner.prepare_planning_request(user_id)
+    assert pipeline_args['use_cache'] is False
+    print("✅ The fresh-plan checkbox turns the cache off for that request")
+
+def test_invalid_days():
+    """Test that both generation modes return the error plan for unusable days"""
+    print("\n🧪 Testing invalid trip lengths...")
+
+    for days in ("", "four", None):
+        for generate in (planner.generate_plan, planner.generate_plan_sections):
+            plan = generate("Kyoto", days, 1500, "Temples", {})
+            assert plan["itinerary"]["Day 1"][0].startswith("❌ Groq Error")
+            assert plan["budget_analysis"] == {} and plan["travel_tips"] == {}
+    print("✅ Comprehensive and per-section generation fail the same way")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting plan cache tests...\n")
+
+    try:
+        test_key_canonicalization()
+        test_profile_in_key()
+        test_cache_opt_out()
+        test_invalid_days()
+        print("\n🎉 All plan cache tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        planner.plan_workers.stop()
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM plan parser:
+1. Streaming section events
+2. Schema validation and recovery of malformed responses
+3. Per-section answers used by decomposed generation
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from plan_parser import StreamingPlanParser, parse_plan
+from prompt_engine import PromptEngine
+
+SAMPLE_PLAN = {
+    "itinerary": {
+        "Day 1": ["Visit Senso-ji Temple in Asakusa", "Explore Tsukiji Outer Market"],
+        "Day 2": ["Morning at Meiji Shrine", "Shibuya Crossing, then \"Hachiko\" statue"]
+    },
+    "budget_analysis": {
+        "accommodation": {"estimated": 300, "range": "250-350"},
+        "food": {"estimated": 200, "range": "180-250"}
+    },
+    "travel_tips": {
+        "cultural": ["Remove shoes when entering temples"],
+        "practical": ["Get a Pasmo/Suica card"]
+    },
+    "personalized_recommendations": {
+        "hidden_gems": ["Explore Yanaka Ginza"]
+    }
+}
+
+def test_streaming_events():
+    """Test that sections are reported as soon as they complete"""
+    print("🧪 Testing streaming section events...")
+
+    text = "Here is your plan:\n```json\n" + json.dumps(SAMPLE_PLAN, indent=4) + "\n```"
+    parser = StreamingPlanParser()
+    events = []
+    for i in range(0, len(text), 16):
+        events.extend(parser.feed(text[i:i + 16]))
+
+    day_events = [value for path, value in events if path == ("itinerary", "Day 1")]
+    assert day_events == [SAMPLE_PLAN["itinerary"]["Day 1"]]
+    first_budget = next(i for i, (path, _) in enumerate(events) if path[0] == "budget_analysis")
+    assert events.index((("itinerary", "Day 2"), SAMPLE_PLAN["itinerary"]["Day 2"])) < first_budget
+    print(f"✅ Streamed {len(events)} section events in document order")
+
+    assert parser.finished and parser.sections == SAMPLE_PLAN
+    print("✅ Reassembled the full plan from the stream")
+
+def test_recovery():
+    """Test that well-formed sections survive truncation and malformed entries"""
+    print("\n🧪 Testing schema-aware recovery...")
+    schema = PromptEngine().output_schemas["comprehensive"]
+    text = json.dumps(SAMPLE_PLAN)
+
+    plan, problems = parse_plan(text, schema)
+    assert plan == SAMPLE_PLAN and problems == []
+    print("✅ Parsed a well-formed plan with no problems")
+
+    truncated = text[:text.index('"practical"') + 5]
+    plan, problems = parse_plan(truncated, schema)
+    assert plan["itinerary"] == SAMPLE_PLAN["itinerary"]
+    assert plan["budget_analysis"] == SAMPLE_PLAN["budget_analysis"]
+    assert plan["travel_tips"] == {"cultural": SAMPLE_PLAN["travel_tips"]["cultural"]}
+    assert "personalized_recommendations: missing" in problems
+    print(f"✅ Recovered a truncated response: {problems}")
+
+    malformed = text.replace('["Morning at Meiji Shrine"', '[42, "Morning at Meiji Shrine"')
+    malformed = malformed.replace('"range": "180-250"}', '"range": "180-250",,}')
+    plan, problems = parse_plan(malformed, schema)
+    assert list(plan["itinerary"]) == ["Day 1"]
+    assert list(plan["budget_analysis"]) == ["accommodation"]
+    assert plan["travel_tips"] == SAMPLE_PLAN["travel_tips"]
+    print(f"✅ Dropped only the malformed entries: {problems}")
+
+    plan, problems = parse_plan("Sorry, I cannot help with that.", schema)
+    assert plan == {}
+    print("✅ Returned nothing for a response without JSON")
+
+def test_section_answers():
+    """Test that each section prompt's answer parses against its own schema"""
+    print("\n🧪 Testing section answers...")
+    engine = PromptEngine()
+    answers = {
+        "itinerary": ("itinerary", SAMPLE_PLAN["itinerary"]),
+        "budget_analysis": ("budget_breakdown", SAMPLE_PLAN["budget_analysis"]),
+        "travel_tips": ("tips", SAMPLE_PLAN["travel_tips"]),
+        "recommendations": ("recommendations", SAMPLE_PLAN["personalized_recommendations"])
+    }
+    for kind, (key, section) in answers.items():
+        example = engine.few_shot_examples[kind][0]["output"]
+        assert parse_plan(example, engine.output_schemas[kind]) == (json.loads(example), [])
+        plan, problems = parse_plan(json.dumps({key: section, "total_estimated": 500}), engine.output_schemas[kind])
+        assert plan[key] == section and problems == []
+    print(f"✅ Parsed the answers of {len(answers)} section prompts")
+
+    plan, problems = parse_plan('{"tips": {"cultural": "not a list"}}', engine.output_schemas["travel_tips"])
+    assert plan.get("tips") == {} and problems == ["tips.cultural: does not match the plan schema"]
+    print(f"✅ Dropped a malformed section entry: {problems}")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting plan parser tests...\n")
+
+    try:
+        test_streaming_events()
+        test_recovery()
+        test_section_answers()
+        print("\n🎉 All plan parser tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script for versioned profile syncing:
+1. Profile writes bump the row version and mark the in-memory profile synced
+2. Syncing an unchanged row is a version check only
+3. Changed rows reapply only the fields that differ
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep the app's databases and caches out of the instance folder
+tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "travel_planner.db")
+os.environ["PROFILE_STORE_PATH"] = os.path.join(tmp_dir, "profiles.db")
+os.environ["PLAN_QUEUE_PATH"] = os.path.join(tmp_dir, "plan_jobs.db")
+os.environ["SHARED_CACHE_URL"] = "sqlite:///" + os.path.join(tmp_dir, "shared_cache.db")
+
+import traveler_planner as planner
+
+profiles = planner.traveler_profiles
+
+def make_user(email):
+    with planner.app.app_context():
+        user = planner.User(email=email, password_hash="unused")
+        planner.db.session.add(user)
+        planner.db.session.commit()
+        return user.id
+
+def row_version(user_id):
+    with planner.app.app_context():
+        return planner.TravelerProfile.query.filter_by(user_id=user_id).first().version
+
+def count_profile_writes():
+    """Wrap the profile setters the sync uses; returns the list of calls"""
+    writes = []
+    for name in ('update_budget_profile', 'update_interests_profile'):
+        original = getattr(type(profiles), name)
+        def wrapper(user_id, *args, _name=name, _original=original, **kwargs):
+            writes.append(_name)
+            return _original(profiles, user_id, *args, **kwargs)
+        setattr(profiles, name, wrapper)
+    return writes
+
+def stop_counting():
+    for name in ('update_budget_profile', 'update_interests_profile'):
+        profiles.__dict__.pop(name, None)
+
+def test_writes_bump_version():
+    """Test that form updates version the row and leave the profile in sync"""
+    print("🧪 Testing profile versions...")
+
+    user_id = make_user("sync-versions@example.com")
+    form = {'budget': '900', 'preferences': 'Food, Art', 'destination': 'Rome'}
+    with planner.app.app_context():
+        planner.update_traveler_profile(user_id, form)
+    assert row_version(user_id) == 1 and profiles.get_synced_version(str(user_id)) is None
+    writes = count_profile_writes()
+    try:
+        with planner.app.app_context():
+            planner.sync_profile_from_database(user_id)
+    finally:
+        stop_counting()
+    assert writes == [] and profiles.get_synced_version(str(user_id)) == 1
+    print("✅ The first sync of a new profile records its version without rewriting it")
+
+    with planner.app.app_context():
+        planner.update_traveler_profile(user_id, form)
+    assert row_version(user_id) == 1
+    with planner.app.app_context():
+        planner.update_traveler_profile(user_id, dict(form, budget='1200'))
+    assert row_version(user_id) == 2 and profiles.get_synced_version(str(user_id)) == 2
+    print("✅ Only changed rows get a new version, and the writer's profile stays in sync")
+
+def test_unchanged_sync():
+    """Test that syncing an unchanged row does not touch the profile"""
+    print("\n🧪 Testing unchanged profile sync...")
+
+    user_id = make_user("sync-unchanged@example.com")
+    with planner.app.app_context():
+        planner.update_traveler_profile(user_id, {'budget': '700', 'preferences': 'Beaches'})
+    updated = profiles.get_profile_summary(str(user_id))['last_updated']
+    writes = count_profile_writes()
+    try:
+        with planner.app.app_context():
+            for _ in range(3):
+                planner.sync_profile_from_database(user_id)
+            planner.sync_profile_from_database(make_user("sync-no-row@example.com"))
+    finally:
+        stop_counting()
+    assert writes == [] and profiles.get_profile_summary(str(user_id))['last_updated'] == updated
+    print("✅ Three syncs of an unchanged row rewrote nothing")
+
+def test_changed_sync():
+    """Test that a row changed elsewhere reapplies just its changed fields"""
+    print("\n🧪 Testing changed profile sync...")
+
+    user_id = make_user("sync-changed@example.com")
+    with planner.app.app_context():
+        planner.update_traveler_profile(user_id, {'budget': '700', 'preferences': 'Beaches, Food'})
+        # Another worker edits the row
+        row = planner.TravelerProfile.query.filter_by(user_id=user_id).first()
+        row.budget = "$2500"
+        row.version += 1
+        planner.db.session.commit()
+
+    writes = count_profile_writes()
+    try:
+        with planner.app.app_context():
+            planner.sync_profile_from_database(user_id)
+            planner.sync_profile_from_database(user_id)
+    finally:
+        stop_counting()
+    profile_data = profiles.get_profile_summary(str(user_id))['profile_data']
+    assert writes == ['update_budget_profile']
+    assert profile_data == {'budget': '$2500', 'interests': ['Beaches', 'Food']}
+    assert profiles.get_synced_version(str(user_id)) == row_version(user_id) == 2
+    print(f"✅ Reapplied the new budget once and left interests alone: {profile_data}")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting profile sync tests...\n")
+
+    try:
+        test_writes_bump_version()
+        test_unchanged_sync()
+        test_changed_sync()
+        print("\n🎉 All profile sync tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        planner.plan_workers.stop()
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
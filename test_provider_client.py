@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Test script for the provider HTTP client:
+1. Retries for idempotent and non-idempotent methods
+2. Backoff, Retry-After and closing retried responses
+3. Per-attempt timeouts capped by the total deadline
+4. Pipeline stages that overrun their deadline
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import provider_client
+from provider_client import ProviderClient, stage_deadline, submit_with_deadline, result_or_fallback
+
+class StubResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class StubSession:
+    """Replays queued responses and exceptions, recording each call's timeout"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    def request(self, method, url, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+class SlowSession(StubSession):
+    """A provider that answers after `delay`, or times out like a socket would"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def request(self, method, url, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        read_timeout = kwargs['timeout'][1]
+        time.sleep(min(self.delay, read_timeout))
+        if self.delay > read_timeout:
+            raise requests.ReadTimeout()
+        return StubResponse(200)
+
+def make_client(*outcomes, **settings):
+    config = dict(connect_timeout=0.5, read_timeout=5.0, max_retries=2,
+                  backoff_factor=0.0, pool_size=1, total_timeout=30.0)
+    config.update(settings)
+    client = ProviderClient("stub", "https://example.test", **config)
+    client.session = StubSession(*outcomes)
+    return client
+
+def refused_connection():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(MaxRetryError(None, "https://example.test", reason))
+
+def test_idempotent_retries():
+    """Test that GET retries 5xx and read timeouts and closes the dropped responses"""
+    print("🧪 Testing idempotent retries...")
+
+    failed = StubResponse(502)
+    client = make_client(failed, requests.ReadTimeout(), StubResponse(200))
+    assert client.get("/search").status_code == 200
+    assert len(client.session.timeouts) == 3 and failed.closed
+    print("✅ GET retried a 502 and a read timeout, closing the 502 response")
+
+    client = make_client(StubResponse(500), StubResponse(500), StubResponse(500))
+    last = client.get("/search")
+    assert last.status_code == 500 and not last.closed
+    print("✅ The last attempt's response is returned open to the caller")
+
+def test_non_idempotent_retries():
+    """Test that POST only retries when the provider cannot have done the work"""
+    print("\n🧪 Testing non-idempotent retries...")
+
+    for status in (500, 502, 504):
+        client = make_client(StubResponse(status), StubResponse(200))
+        assert client.post("/complete").status_code == status
+        assert len(client.session.timeouts) == 1
+    print("✅ POST returns 500/502/504 without retrying")
+
+    client = make_client(requests.ReadTimeout(), StubResponse(200))
+    try:
+        client.post("/complete")
+        assert False, "read timeout should propagate"
+    except requests.ReadTimeout:
+        pass
+    assert len(client.session.timeouts) == 1
+    print("✅ POST read timeouts are not retried")
+
+    throttled = StubResponse(429)
+    client = make_client(throttled, StubResponse(503), StubResponse(200))
+    assert client.post("/complete").status_code == 200 and throttled.closed
+    client = make_client(requests.ConnectTimeout(), refused_connection(), StubResponse(200))
+    assert client.post("/complete").status_code == 200
+    assert len(client.session.timeouts) == 3
+    print("✅ POST retries 429/503 and connect errors")
+
+def test_backoff():
+    """Test jittered backoff bounds and Retry-After"""
+    print("\n🧪 Testing backoff...")
+
+    client = make_client(backoff_factor=0.5)
+    original_uniform = provider_client.random.uniform
+    provider_client.random.uniform = lambda low, high: high
+    try:
+        assert [client._retry_delay(attempt) for attempt in range(3)] == [0.5, 1.0, 2.0]
+        assert client._retry_delay(0, StubResponse(429, {'Retry-After': '3'})) == 3.0
+        assert client._retry_delay(0, StubResponse(429, {'Retry-After': '120'})) == 5.0
+        assert client._retry_delay(0, StubResponse(429, {'Retry-After': 'soon'})) == 0.5
+    finally:
+        provider_client.random.uniform = original_uniform
+    print("✅ Backoff doubles per attempt and Retry-After is capped at the read timeout")
+
+    sleeps = []
+    original_sleep = provider_client.time.sleep
+    provider_client.time.sleep = sleeps.append
+    try:
+        client = make_client(StubResponse(503, {'Retry-After': '2'}), StubResponse(200))
+        assert client.get("/search").status_code == 200 and sleeps == [2.0]
+    finally:
+        provider_client.time.sleep = original_sleep
+    print(f"✅ Retry waited {sleeps[0]}s as the provider asked")
+
+def test_total_deadline():
+    """Test that timeouts shrink to the time left and retries stop at the deadline"""
+    print("\n🧪 Testing the total deadline...")
+
+    client = make_client(StubResponse(200), total_timeout=2.0)
+    client.get("/search")
+    connect, read = client.session.timeouts[0]
+    assert connect == 0.5 and 1.9 < read <= 2.0
+    print(f"✅ Read timeout cut from 5.0s to {read:.2f}s")
+
+    client = make_client(StubResponse(200), total_timeout=2.0)
+    client.get("/search", total_timeout=1.0)
+    assert client.session.timeouts[0][1] <= 1.0
+    client = make_client(StubResponse(200), total_timeout=2.0)
+    client.get("/search", total_timeout=10.0)
+    assert client.session.timeouts[0][1] <= 2.0
+    print("✅ A per-call total_timeout can only shorten the client's limit")
+
+    throttled = StubResponse(429, {'Retry-After': '5'})
+    client = make_client(throttled, StubResponse(200), total_timeout=3.0)
+    started = time.monotonic()
+    assert client.get("/search") is throttled and not throttled.closed
+    assert time.monotonic() - started < 0.5
+    print("✅ A Retry-After beyond the deadline returns the 429 instead of waiting")
+
+    client = make_client(requests.ConnectTimeout(), StubResponse(200),
+                         backoff_factor=1.0, total_timeout=0.8)
+    original_uniform = provider_client.random.uniform
+    provider_client.random.uniform = lambda low, high: high
+    try:
+        client.get("/search")
+        assert False, "connect timeout should propagate once the deadline is near"
+    except requests.ConnectTimeout:
+        pass
+    finally:
+        provider_client.random.uniform = original_uniform
+    assert len(client.session.timeouts) == 1
+    print("✅ No retry starts without time left to connect")
+
+def test_stage_deadline():
+    """Test that a stage sleeping past its deadline falls back and frees its worker"""
+    print("\n🧪 Testing stage deadlines...")
+
+    client = make_client(max_retries=0)
+    client.session = SlowSession(delay=5.0)
+    def slow_stage():
+        try:
+            return client.post("/complete").status_code
+        except requests.Timeout:
+            return "gave up"
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    started = time.monotonic()
+    future = submit_with_deadline(executor, started + 0.2, slow_stage)
+    assert result_or_fallback(future, started + 0.2, lambda: "fallback") == "fallback"
+    assert time.monotonic() - started < 0.3
+    print("✅ The expired stage was replaced by its fallback at the deadline")
+
+    assert future.result(timeout=1) == "gave up"
+    assert time.monotonic() - started < 0.5 and client.session.timeouts[0][1] <= 0.2
+    queued = executor.submit(lambda: "next plan")
+    assert queued.result(timeout=1) == "next plan"
+    print(f"✅ The stage stopped on its own after {time.monotonic() - started:.2f}s, freeing the worker")
+
+    client.session = SlowSession(delay=0.01)
+    future = submit_with_deadline(executor, time.monotonic() + 1.0, slow_stage)
+    assert result_or_fallback(future, time.monotonic() + 1.0, lambda: "fallback") == 200
+    blocked = executor.submit(time.sleep, 0.3)
+    late = executor.submit(slow_stage)
+    assert result_or_fallback(late, time.monotonic() + 0.05, lambda: "fallback") == "fallback"
+    assert late.cancelled()
+    blocked.result()
+    executor.shutdown()
+    print("✅ Stages within their deadline return, and expired queued stages never start")
+
+    with stage_deadline(time.monotonic() - 1):
+        try:
+            client.get("/search")
+            assert False, "calls past the deadline should fail"
+        except requests.Timeout:
+            pass
+    assert len(client.session.timeouts) == 1
+    print("✅ Provider calls after the deadline fail without being sent")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting provider client tests...\n")
+
+    try:
+        test_idempotent_retries()
+        test_non_idempotent_retries()
+        test_backoff()
+        test_total_deadline()
+        test_stage_deadline()
+        print("\n🎉 All provider client tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test script for the traveler similarity index:
+1. Ranking, incremental updates and removals
+2. Batched queries and destination recommendations
+3. Keeping the index current from traveler profiles
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from similarity_index import SimilarityIndex
+from traveler_profile import TravelerProfile
+from profile_store import ProfileStore
+
+def build_index():
+    index = SimilarityIndex(capacity=2)
+    index.update("foodie", ["Food", "Art"], 1500, ["Lisbon", "Rome"])
+    index.update("twin", ["food", "art "], 1800, ["Lisbon", "Porto"])
+    index.update("hiker", ["Hiking"], 400, ["Oslo"])
+    index.update("mixed", ["Food"], 9000, ["Rome", "Kyoto"])
+    return index
+
+def test_ranking():
+    """Test that shared interests, budget tiers and destinations rank neighbors"""
+    print("🧪 Testing similarity ranking...")
+
+    index = build_index()
+    ranked = [user_id for user_id, _ in index.similar("foodie", k=3)]
+    assert ranked[:2] == ["twin", "mixed"] and "foodie" not in ranked
+    assert "hiker" not in ranked
+    assert index.stats()['capacity'] == 4
+    print(f"✅ Ranked neighbors by weighted cosine: {index.similar('foodie', k=3)}")
+
+    index.update("hiker", ["Food", "Art"], 2000, ["Lisbon", "Rome"])
+    assert index.similar("foodie", k=1)[0][0] == "hiker"
+    assert index.remove("twin") and not index.remove("twin")
+    index.update("newcomer", ["Hiking"], 300, ["Oslo"])
+    assert index.rows["newcomer"] == 1 and index.similar("twin") == []
+    print("✅ Updated a row in place and reused a removed row")
+
+def test_batched_queries():
+    """Test that one batched query matches single queries and recommends new places"""
+    print("\n🧪 Testing batched queries...")
+
+    index = build_index()
+    batched = index.similar_many(["foodie", "hiker", "unknown"], k=2)
+    assert batched["foodie"] == index.similar("foodie", k=2)
+    assert batched["hiker"] == index.similar("hiker", k=2) and batched["unknown"] == []
+    print("✅ A batched query returns the same neighbors as single queries")
+
+    assert index.recommend_destinations("foodie") == ["Porto", "Kyoto"]
+    assert index.recommend_destinations("foodie", exclude=["porto"]) == ["Kyoto"]
+    print(f"✅ Travelers like 'foodie' went to: {index.recommend_destinations('foodie')}")
+
+def test_profile_integration():
+    """Test that profile changes flow into the index and into recommendations"""
+    print("\n🧪 Testing index updates from traveler profiles...")
+
+    profiles = TravelerProfile()
+    profiles.attach_similarity(SimilarityIndex())
+    for user_id, trips in [("a", ["Lisbon", "Porto"]), ("b", ["Lisbon", "Seville"]), ("c", ["Oslo"])]:
+        profiles.update_interests_profile(user_id, ["Food"] if user_id != "c" else ["Hiking"])
+        profiles.update_budget_profile(user_id, "$1200")
+        for city in trips:
+            profiles.add_previous_trip(user_id, city, {})
+    assert profiles.similarity.similar("a", k=1)[0][0] == "b"
+    recommendations = profiles.get_recommendations("a", "Madrid")
+    assert recommendations['similar_travelers'] == ["Travelers like you also went to: Seville, Oslo"]
+    print(f"✅ {recommendations['similar_travelers'][0]}")
+
+    profiles.add_travel_preferences("c", {'destination': "Seville"})
+    profiles.update_interests_profile("c", ["Food"])
+    assert profiles.get_recommendations("a", "Seville")['similar_travelers'] == \
+        ["Travelers like you also went to: Oslo"]
+    profiles.delete_profile("b")
+    assert "b" not in profiles.similarity.rows
+    print(f"✅ Later changes to other travelers show up without invalidating memos: "
+          f"{profiles.similarity.stats()}")
+
+def test_user_id_keys():
+    """Test that int and string ids share a row and a user never matches themselves"""
+    print("\n🧪 Testing user id keys...")
+
+    index = SimilarityIndex()
+    index.update(4, ["Food"], 1000, ["Rome"])
+    index.update("4", ["Food"], 1000, ["Rome"])
+    index.update("5", ["Food"], 1000, ["Rome"])
+    assert list(index.rows) == ["4", "5"]
+    assert [user_id for user_id, _ in index.similar(4)] == ["5"]
+    assert index.recommend_destinations(4) == [] and index.remove(4)
+    print("✅ Keyed rows by string id and left the querying user out of their own neighbors")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.db")
+        writer = TravelerProfile(store=ProfileStore(path, flush_interval=60))
+        writer.update_budget_profile("4", "$1000")
+        writer.store.close()
+        reader = TravelerProfile(max_profiles=0, store=ProfileStore(path, flush_interval=60))
+        assert reader.warm_start() == 0
+        reader.store.close()
+    print("✅ Warm-started without a similarity index attached")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting similarity index tests...\n")
+
+    try:
+        test_ranking()
+        test_batched_queries()
+        test_profile_integration()
+        test_user_id_keys()
+        print("\n🎉 All similarity index tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test script for the upstream result caches:
+1. TTL/LRU cache
+2. Stale-while-revalidate search cache
+3. Single-flight request coalescing
+4. Shared KV tier across worker processes
+"""
+
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from travel_cache import TTLCache, StaleWhileRevalidateCache, SingleFlight, MISSING
+from kv_store import SQLiteKVStore, open_kv_store
+
+def test_ttl_cache():
+    """Test LRU eviction, expiry and cached negatives"""
+    print("🧪 Testing TTL cache...")
+
+    cache = TTLCache(max_entries=2)
+    cache.set("tokyo", "-246227")
+    cache.set("nowhere", None, ttl=0.05)
+    assert cache.get("nowhere") is None
+    assert cache.get("paris") is MISSING
+    print("✅ Cached a negative result")
+
+    cache.get("tokyo")
+    cache.set("paris", "-1456928")
+    assert cache.get("nowhere") is MISSING
+    assert cache.get("tokyo") == "-246227"
+    print("✅ Evicted the least recently used entry")
+
+    cache.set("rome", "-126693", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("rome") is MISSING
+    stats = cache.stats()
+    assert stats['evictions'] == 2 and stats['hits'] == 3
+    print(f"✅ Expired entries are misses: {stats}")
+
+def test_stale_while_revalidate():
+    """Test fresh hits, stale hits with background refresh and uncached failures"""
+    print("\n🧪 Testing stale-while-revalidate cache...")
+
+    calls = []
+    def loader():
+        calls.append(1)
+        return [f"result {len(calls)}"]
+
+    cache = StaleWhileRevalidateCache("test", fresh_for=0.05, stale_for=60)
+    assert cache.get_or_load("key", loader) == ["result 1"]
+    assert cache.get_or_load("key", loader) == ["result 1"]
+    print("✅ Served a fresh hit without calling upstream")
+
+    time.sleep(0.06)
+    assert cache.get_or_load("key", loader) == ["result 1"]
+    cache._refresh_executor.shutdown(wait=True)
+    assert cache.get_or_load("key", loader) == ["result 2"]
+    print("✅ Served the stale entry and refreshed it in the background")
+
+    def failing_loader():
+        raise RuntimeError("upstream down")
+    try:
+        cache.get_or_load("other", failing_loader)
+        assert False, "loader error should propagate"
+    except RuntimeError:
+        pass
+    stats = cache.stats()
+    assert stats['size'] == 1 and stats['misses'] == 2 and stats['stale_hits'] == 1
+    print(f"✅ Upstream failures are not cached: {stats}")
+
+def test_single_flight():
+    """Test that concurrent identical calls share one execution"""
+    print("\n🧪 Testing single-flight coalescing...")
+
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+    def generate():
+        calls.append(1)
+        release.wait(1)
+        return {"itinerary": {"Day 1": ["Senso-ji"]}}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("tokyo", generate, wait_timeout=2)))
+               for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flight.stats()['leaders'] == 0:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len(results) == 5
+    assert all(r == {"itinerary": {"Day 1": ["Senso-ji"]}} for r in results)
+    print(f"✅ Five concurrent requests ran one generation: {flight.stats()}")
+
+    def failing():
+        raise RuntimeError("groq down")
+    try:
+        flight.do("paris", failing, wait_timeout=1)
+        assert False, "leader error should propagate"
+    except RuntimeError:
+        pass
+    assert flight.do("paris", lambda: "retried", wait_timeout=1) == "retried"
+    assert flight.stats()['in_flight'] == 0
+    print("✅ A failed leader does not poison later calls")
+
+def test_single_flight_stream():
+    """Test that streamed runs lead and join the same keys as do()"""
+    print("\n🧪 Testing streamed single-flight coalescing...")
+
+    flight = SingleFlight()
+    release = threading.Event()
+    def sections():
+        yield ("itinerary", "Day 1")
+        release.wait(1)
+        yield {"itinerary": {"Day 1": ["Senso-ji"]}}
+
+    leader = flight.stream("tokyo", sections, wait_timeout=2)
+    assert next(leader) == ("itinerary", "Day 1")
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(flight.do("tokyo", lambda: "rerun", wait_timeout=2)))
+    streamed = threading.Thread(target=lambda: results.append(list(flight.stream("tokyo", sections, wait_timeout=2))))
+    waiter.start()
+    streamed.start()
+    time.sleep(0.05)
+    release.set()
+    assert list(leader) == [{"itinerary": {"Day 1": ["Senso-ji"]}}]
+    waiter.join()
+    streamed.join()
+    assert {"itinerary": {"Day 1": ["Senso-ji"]}} in results
+    assert [{"itinerary": {"Day 1": ["Senso-ji"]}}] in results
+    assert flight.stats()['coalesced'] == 2
+    print("✅ do() and stream() callers joined a streaming leader and got its last item")
+
+    abandoned = flight.stream("paris", sections, wait_timeout=1)
+    next(abandoned)
+    abandoned.close()
+    assert flight.stats()['in_flight'] == 0
+    assert list(flight.stream("paris", lambda: iter(["fresh"]), wait_timeout=1)) == ["fresh"]
+    print("✅ A closed stream releases its key")
+
+def test_shared_tier():
+    """Test that caches in different workers share entries through the KV store"""
+    print("\n🧪 Testing shared cache tier...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = open_kv_store(f"sqlite:///{os.path.join(tmp, 'shared.db')}")
+        assert isinstance(shared, SQLiteKVStore) and open_kv_store("none") is None
+        # Two caches over one store stand in for two gunicorn workers
+        worker_a = TTLCache(shared=shared, namespace="plans")
+        worker_b = TTLCache(shared=SQLiteKVStore(shared.path), namespace="plans")
+        worker_a.set(("tokyo", 5), {"Day 1": ["Senso-ji"]}, ttl=60)
+        worker_a.set("short", "gone soon", ttl=0.01)
+        assert worker_b.get(("tokyo", 5)) == {"Day 1": ["Senso-ji"]}
+        assert worker_b.get(("tokyo", 5)) == {"Day 1": ["Senso-ji"]}
+        time.sleep(0.02)
+        assert worker_b.get("short") is MISSING
+        stats = worker_b.stats()
+        assert stats['shared_hits'] == 1 and stats['hits'] == 1 and stats['misses'] == 1
+        print(f"✅ A second worker read the first worker's entry once, then locally: {stats}")
+
+        calls = []
+        def loader():
+            calls.append(1)
+            return ["Hotel Sakura"]
+        hotels_a = StaleWhileRevalidateCache("hotels", fresh_for=60, stale_for=60, shared=shared)
+        hotels_b = StaleWhileRevalidateCache("hotels", fresh_for=60, stale_for=60, shared=shared)
+        assert hotels_a.get_or_load(("-246227", "2025-05-01"), loader) == ["Hotel Sakura"]
+        assert hotels_b.get_or_load(("-246227", "2025-05-01"), loader) == ["Hotel Sakura"]
+        assert len(calls) == 1 and hotels_b.stats()['hits'] == 1
+        print("✅ Search results fetched by one worker are fresh hits in another")
+
+        worker_b.clear()
+        assert worker_a.get("short") is MISSING and shared.stats()['keys'] == 1
+        print("✅ Clearing a cache clears its namespace in the shared store")
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting cache tests...\n")
+
+    try:
+        test_ttl_cache()
+        test_stale_while_revalidate()
+        test_single_flight()
+        test_single_flight_stream()
+        test_shared_tier()
+        print("\n🎉 All cache tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
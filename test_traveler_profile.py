@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Test script for traveler profile storage:
+1. Per-type node index
+2. Retention and rollup of travel preferences
+3. Compact slotted backend
+4. LRU-bounded profile cache with rehydration
+5. Memoized summaries and recommendations
+6. SQLite profile store with an operation log and snapshots
+7. Concurrent updates on lock-striped shards
+8. Coherence between worker processes sharing one store
+"""
+
+import sys
+import os
+import json
+import random
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from traveler_profile import TravelerProfile, CompactTravelerProfile
+from profile_store import ProfileStore
+from kv_store import SQLiteKVStore
+
+def test_type_index():
+    """Test that typed lookups follow adds, removes, reloads and deletes"""
+    print("🧪 Testing per-type node index...")
+
+    profile = TravelerProfile()
+    user_id = profile.create_profile("index_user")
+    trips = [profile.add_previous_trip(user_id, city, {}) for city in ["Paris", "Rome"]]
+    budget = profile.update_budget_profile(user_id, "$1000")
+    assert profile.update_budget_profile(user_id, "$2000") == budget
+    assert profile.get_nodes_by_type(user_id, 'previous_trip') == trips
+    assert profile.get_profile_summary(user_id)['node_types'] == {'previous_trip': 2, 'budget': 1}
+    print("✅ Singleton upserts reuse the indexed node")
+
+    interests = profile.update_interests_profile(user_id, ["Food"])
+    profile.add_edge(user_id, trips[0], interests, "influenced_by")
+    assert profile.remove_node(user_id, trips[0])
+    assert profile.get_nodes_by_type(user_id, 'previous_trip') == [trips[1]]
+    assert profile.get_profile(user_id)['edges'] == []
+    assert not profile.remove_node(user_id, trips[0])
+    print("✅ Removing a node updates the index and its edges")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = profile.save_profile(user_id, os.path.join(tmp, "profile.json"))
+        reloaded = TravelerProfile()
+        assert reloaded.load_profile(filename)
+    assert reloaded.get_node_by_type(user_id, 'budget') == budget
+    assert reloaded.get_nodes_by_type(user_id, 'previous_trip') == [trips[1]]
+    print("✅ Loading a saved profile rebuilds its index")
+
+    assert profile.delete_profile(user_id)
+    assert profile.get_node_by_type(user_id, 'budget') is None
+    print("✅ Deleted the profile and its index")
+
+def test_retention():
+    """Test that travel preferences keep a bounded history plus a rollup"""
+    print("\n🧪 Testing travel preference retention...")
+
+    profile = TravelerProfile(retention={'travel_preferences': 3})
+    sizes = []
+    for i in range(50):
+        profile.add_travel_preferences("frequent_user", {
+            'destination': ["Tokyo", "Paris"][i % 2],
+            'days': "5",
+            'departure_city': "Delhi"
+        })
+        sizes.append(len(json.dumps(profile.get_profile("frequent_user"))))
+
+    recent = profile.get_nodes_by_type("frequent_user", 'travel_preferences')
+    assert len(recent) == 3
+    assert profile.get_profile("frequent_user")['nodes'][recent[-1]]['data']['preferences']['destination'] == "Paris"
+    assert max(sizes[10:]) - min(sizes[10:]) < 100
+    print(f"✅ Kept the 3 most recent preferences; profile JSON stays ~{sizes[-1]} bytes")
+
+    rollup_id = profile.get_node_by_type("frequent_user", 'travel_preferences_rollup')
+    rollup = profile.get_profile("frequent_user")['nodes'][rollup_id]['data']
+    assert rollup['count'] == 47
+    assert rollup['destinations'] == {"Tokyo": 24, "Paris": 23}
+    assert rollup['trip_lengths'] == {"5": 47} and rollup['departure_cities'] == {"Delhi": 47}
+    print(f"✅ Rolled older preferences into frequency counts: {rollup['destinations']}")
+
+    unbounded = TravelerProfile(retention={})
+    for i in range(10):
+        unbounded.add_travel_preferences("frequent_user", {'destination': "Rome"})
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = unbounded.save_profile("frequent_user", os.path.join(tmp, "profile.json"))
+        assert profile.load_profile(filename)
+    assert len(profile.get_nodes_by_type("frequent_user", 'travel_preferences')) == 3
+    print("✅ Compacted an oversized profile on load")
+
+def build_sample_profile(profile):
+    user_id = profile.create_profile("compact_user")
+    profile.update_budget_profile(user_id, "$1500")
+    profile.update_interests_profile(user_id, ["Food", "Art"])
+    profile.add_previous_trip(user_id, "Lisbon", {})
+    profile.update_visa_profile(user_id, "Indian", {"visa_required": True})
+    for city in ["Tokyo", "Paris", "Tokyo"]:
+        profile.add_travel_preferences(user_id, {'destination': city, 'days': "4"})
+    return user_id
+
+def test_compact_backend():
+    """Test that the compact backend matches the dict backend's public output"""
+    print("\n🧪 Testing compact profile backend...")
+
+    regular, compact = TravelerProfile(retention={'travel_preferences': 2}), \
+        CompactTravelerProfile(retention={'travel_preferences': 2})
+    user_id = build_sample_profile(regular)
+    build_sample_profile(compact)
+
+    expected, actual = regular.get_profile_summary(user_id), compact.get_profile_summary(user_id)
+    for key in ['node_count', 'edge_count', 'node_types', 'profile_data']:
+        assert expected[key] == actual[key], key
+    assert regular.get_recommendations(user_id, "Rome") == compact.get_recommendations(user_id, "Rome")
+    assert isinstance(compact.get_node_by_type(user_id, 'budget'), int)
+    print(f"✅ Same summary and recommendations: {actual['node_types']}")
+
+    exported = compact.get_profile(user_id)
+    assert exported['edges'][0]['relationship'] == "influenced_by"
+    assert isinstance(exported['created_at'], str)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = regular.save_profile(user_id, os.path.join(tmp, "profile.json"))
+        reloaded = CompactTravelerProfile()
+        assert reloaded.load_profile(filename)
+    summary = reloaded.get_profile_summary(user_id)
+    assert summary['node_types'] == expected['node_types'] and summary['edge_count'] == 1
+    assert summary['created_at'] == expected['created_at']
+    print("✅ Loaded a dict-backend profile into the compact backend")
+
+def test_profile_cache():
+    """Test LRU eviction to the profile store and lazy rehydration"""
+    print("\n🧪 Testing bounded profile cache...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(os.path.join(tmp, "profiles.db"), flush_interval=60)
+        profile = TravelerProfile(max_profiles=3, store=store, shards=1)
+        hydrated = []
+        profile.on_hydrate = hydrated.append
+        for u in range(5):
+            profile.update_budget_profile(str(u), f"${u}000")
+        assert len(profile.profiles) == 3 and profile.evictions == 2
+        store.flush()
+        assert sorted(store.user_ids()) == ["0", "1", "2", "3", "4"]
+        print(f"✅ Evicted the least recently used profiles: {profile.cache_stats()}")
+
+        budget = profile.update_budget_profile("0", "$500")
+        assert profile.get_nodes_by_type("0", 'budget') == [budget]
+        assert profile.get_profile_summary("0")['profile_data']['budget'] == "$500"
+        assert hydrated == ["0"] and len(profile.profiles) == 3
+        assert "2" not in profile.profiles
+        print("✅ Rehydrated an evicted profile on access without duplicating nodes")
+
+        assert profile.delete_profile("1")
+        assert not profile.has_profile("1")
+        assert not profile.has_profile("unknown")
+        stats = profile.cache_stats()
+        assert stats['hydrations'] == 1 and stats['misses'] >= 3
+        print(f"✅ Deleting an evicted profile removes it for good: {stats}")
+        store.close()
+
+def test_memoized_views():
+    """Test that derived views are cached until the profile changes"""
+    print("\n🧪 Testing memoized profile views...")
+
+    profile = TravelerProfile()
+    user_id = build_sample_profile(profile)
+    first = profile.get_profile_summary(user_id)
+    first['profile_data']['budget'] = "tampered"
+    assert profile.get_profile_summary(user_id)['profile_data']['budget'] == "$1500"
+    profile.get_recommendations(user_id, "Rome")
+    profile.get_recommendations(user_id, "Rome")
+    assert profile.derived_hits == 2 and profile.derived_misses == 2
+    print("✅ Served repeated summaries and recommendations from the memo")
+
+    profile.update_budget_profile(user_id, "$900")
+    assert profile.get_profile_summary(user_id)['profile_data']['budget'] == "$900"
+    assert profile.get_recommendations(user_id, "Rome")['budget_considerations'] == \
+        ["Based on your budget range: $900"]
+    profile.update_interests_profile(user_id, ["Hiking"])
+    assert profile.get_profile_summary(user_id)['profile_data']['interests'] == ["Hiking"]
+    print(f"✅ In-place upserts invalidate the memo: {profile.cache_stats()['derived_hit_rate']} hit rate")
+
+def test_profile_store():
+    """Test the operation log, snapshots, the bulk loader and the JSON migration"""
+    print("\n🧪 Testing SQLite profile store...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.db")
+        store = ProfileStore(path, flush_interval=60, snapshot_every=10)
+        profile = CompactTravelerProfile(store=store)
+        user_id = build_sample_profile(profile)
+        profile.add_travel_preferences("second_user", {'destination': "Oslo"})
+        assert store.stats()['pending'] == 11 and store.stats()['logged'] == 0
+        assert store.flush() == 11 and store.stats()['flushes'] == 1
+        print(f"✅ Logged both profiles' operations in one flush: {store.stats()}")
+
+        profile.update_budget_profile(user_id, "$1800")
+        assert store.stats()['pending'] == 1
+        store.flush()
+        stats = store.stats()
+        assert stats['snapshots'] == 1 and stats['logged'] == 2
+        assert store.load(user_id) == json.loads(json.dumps(profile.get_profile(user_id)))
+        print(f"✅ One update logs one operation; the long tail was folded into a snapshot: {stats}")
+
+        regular = TravelerProfile()
+        build_sample_profile(regular)
+        regular.create_profile("json_user")
+        regular.update_budget_profile("json_user", "$700")
+        regular.save_profile("json_user", os.path.join(tmp, "traveler_profile_json_user.json"))
+        regular.save_profile(user_id, os.path.join(tmp, f"traveler_profile_{user_id}.json"))
+        assert store.migrate_json_files(os.path.join(tmp, "traveler_profile_*.json")) == 1
+        print("✅ Migrated only the JSON profiles not already in the store")
+
+        warm = CompactTravelerProfile(store=ProfileStore(path, flush_interval=60))
+        assert warm.warm_start() == 3
+        expected = profile.get_profile_summary(user_id)
+        summary = warm.get_profile_summary(user_id)
+        assert summary['node_types'] == expected['node_types']
+        assert summary['profile_data'] == expected['profile_data'] and summary['edge_count'] == 1
+        assert warm.get_profile_summary("second_user")['node_types'] == {'travel_preferences': 1}
+        assert warm.get_profile_summary("json_user")['profile_data'] == {'budget': "$700"}
+        print(f"✅ Replayed snapshots plus log tails for {len(warm.profiles)} profiles")
+
+        warm.remove_node(user_id, warm.get_node_by_type(user_id, 'visa'))
+        warm.store.flush()
+        assert 'visa' not in {node['type'] for node in warm.store.load(user_id)['nodes'].values()}
+        replayed = TravelerProfile(store=ProfileStore(path, flush_interval=60))
+        assert 'nationality' not in replayed.get_profile_summary(user_id)['profile_data']
+        print("✅ Operations on a replayed profile refer to the same node ids")
+        for opened in (store, warm.store, replayed.store):
+            opened.close()
+
+def test_concurrent_updates():
+    """Test that many threads mutating overlapping profiles keep every invariant"""
+    print("\n🧪 Testing concurrent profile updates...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(os.path.join(tmp, "profiles.db"), flush_interval=0.01, snapshot_every=25)
+        profile = CompactTravelerProfile(retention={'travel_preferences': 3}, max_profiles=4,
+                                         store=store, shards=4)
+        users = [f"user{u}" for u in range(8)]
+        added = {user_id: [0, 0] for user_id in users}  # previous trips kept, preferences added
+        counts_lock = threading.Lock()
+        errors = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(150):
+                    user_id = rng.choice(users)
+                    action = rng.random()
+                    if action < 0.3:
+                        # Check-then-act across calls needs the user's lock
+                        with profile.locked(user_id):
+                            trips = profile.get_nodes_by_type(user_id, 'previous_trip')
+                            if trips and profile.remove_node(user_id, trips[0]):
+                                with counts_lock:
+                                    added[user_id][0] -= 1
+                    elif action < 0.5:
+                        profile.add_previous_trip(user_id, rng.choice(["Rome", "Oslo"]), {})
+                        with counts_lock:
+                            added[user_id][0] += 1
+                    elif action < 0.7:
+                        profile.add_travel_preferences(user_id, {'destination': "Lima"})
+                        with counts_lock:
+                            added[user_id][1] += 1
+                    elif action < 0.85:
+                        profile.update_budget_profile(user_id, f"${rng.randint(1, 9)}000")
+                    else:
+                        profile.get_recommendations(user_id, "Lima")
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == [], errors
+        store.close()
+
+        for user_id in users:
+            exported = profile.get_profile(user_id)
+            node_ids = {node['id'] for node in exported['nodes'].values()}
+            summary = profile.get_profile_summary(user_id)['node_types']
+            assert summary.get('previous_trip', 0) == added[user_id][0]
+            assert summary.get('budget', 0) <= 1
+            preferences = summary.get('travel_preferences', 0)
+            rollup = profile.get_node_by_type(user_id, 'travel_preferences_rollup')
+            rolled = profile._node_data(user_id, rollup)['count'] if rollup is not None else 0
+            assert preferences <= 3 and preferences + rolled == added[user_id][1]
+            assert all(edge['source'] in node_ids and edge['target'] in node_ids
+                       for edge in exported['edges'])
+            assert store.load(user_id) == json.loads(json.dumps(exported)), user_id
+        stats = profile.cache_stats()
+        print(f"✅ 12 threads on 8 users over 4 shards kept every invariant "
+              f"({stats['evictions']} evictions, {stats['hydrations']} hydrations)")
+        print("✅ Replaying the operation log reproduces every in-memory profile")
+
+def test_shared_workers():
+    """Test that two workers on one store and shared KV see each other's changes"""
+    print("\n🧪 Testing profiles shared between workers...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, shared = os.path.join(tmp, "profiles.db"), SQLiteKVStore(os.path.join(tmp, "shared.db"))
+        worker_a = TravelerProfile(store=ProfileStore(path, flush_interval=60, shared=shared, recheck_interval=0))
+        worker_b = TravelerProfile(store=ProfileStore(path, flush_interval=60, shared=shared, recheck_interval=0))
+        worker_a.update_budget_profile("42", "$1000")
+        worker_a.store.flush()
+        assert worker_b.get_profile_summary("42")['profile_data'] == {'budget': "$1000"}
+        print("✅ A profile created by one worker is visible to another")
+
+        worker_b.update_interests_profile("42", ["Food"])
+        worker_b.store.flush()
+        assert worker_a.get_profile_summary("42")['profile_data'] == {'budget': "$1000", 'interests': ["Food"]}
+        assert worker_a.cache_stats()['hydrations'] == 1
+        worker_a.update_budget_profile("42", "$1500")
+        worker_a.store.flush()
+        assert worker_b.get_profile_summary("42")['profile_data']['budget'] == "$1500"
+        assert not worker_a.store.is_stale("42")
+        print("✅ Each worker replays the profile after the other one changes it")
+
+        assert worker_b.delete_profile("42")
+        assert not worker_a.has_profile("42")
+        print("✅ A deletion in one worker reaches the other")
+        worker_a.store.close()
+        worker_b.store.close()
+
+def test_integer_user_ids():
+    """Test that an int id reaches the same profile as its string form, also after a flush"""
+    print("\n🧪 Testing integer user ids...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ProfileStore(os.path.join(tmp, "profiles.db"), flush_interval=60)
+        profiles = TravelerProfile(store=store, shards=1)
+        profiles.update_budget_profile("4", "$1000")
+        store.flush()
+        profiles._forget("4")
+        assert profiles.get_profile_summary(4)['profile_data'] == {'budget': "$1000"}
+        profiles.update_interests_profile(4, ["Food"])
+        assert list(profiles.profiles) == ["4"]
+        assert profiles.get_profile_summary("4")['profile_data'] == {'budget': "$1000", 'interests': ["Food"]}
+        assert profiles.get_recommendations(4, "Rome") == profiles.get_recommendations("4", "Rome")
+        assert profiles.create_profile(7) == "7" and "7" in profiles.profiles
+        print(f"✅ Hydrated and updated one profile under the key '4': {list(profiles.profiles)}")
+        store.close()
+
+def main():
+    """Run all tests"""
+    print("🚀 Starting traveler profile tests...\n")
+
+    try:
+        test_type_index()
+        test_retention()
+        test_compact_backend()
+        test_profile_cache()
+        test_memoized_views()
+        test_profile_store()
+        test_concurrent_updates()
+        test_shared_workers()
+        test_integer_user_ids()
+        print("\n🎉 All traveler profile tests passed!")
+    except Exception as e:
+        print(f"\n❌ Test failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
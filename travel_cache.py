@@ -0,0 +1,296 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Optional
+
+# Sentinel returned on a cache miss so that None can be cached as a real value
+MISSING = object()
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry time to live
+    Entries are evicted least-recently-used first once max_entries is reached.
+    With a shared KV store (see kv_store.py) the cache becomes two-tier: writes
+    go to both, and a local miss is answered from the store, so every worker
+    process on the host sees the same entries.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: Optional[float] = None,
+                 shared: Optional[Any] = None, namespace: str = "cache"):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.shared = shared
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key if isinstance(key, str) else json.dumps(key, default=str)}"
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Return the cached value, or default if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            if self.shared is None:
+                self.misses += 1
+                return default
+
+        try:
+            entry = self.shared.get(self._shared_key(key))
+        except Exception as e:
+            print(f"[ERROR] Shared cache read failed: {e}")
+            entry = MISSING
+        if entry is not MISSING:
+            # Shared entries carry their wall-clock expiry
+            expires_at, value = entry
+            ttl = None if expires_at is None else expires_at - time.time()
+            if ttl is None or ttl > 0:
+                self._set_local(key, value, ttl)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value; ttl overrides the cache default (None means no expiry)"""
+        ttl = self.default_ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(self._shared_key(key),
+                                [time.time() + ttl if ttl is not None else None, value], ttl)
+            except Exception as e:
+                print(f"[ERROR] Shared cache write failed: {e}")
+
+    def _set_local(self, key: Hashable, value: Any, ttl: Optional[float]):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear(f"{self.namespace}:")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for sizing the cache"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0
+        }
+
+class StaleWhileRevalidateCache:
+    """
+    Result cache for upstream searches
+    An entry younger than fresh_for is served as is. Once it is older but still
+    within stale_for it is served immediately while a background refresh fetches
+    a replacement. Anything older is a miss and is loaded inline. Entry ages are
+    wall-clock so they stay meaningful in a shared KV store.
+    """
+
+    def __init__(self, name: str, fresh_for: float, stale_for: float, max_entries: int = 1024,
+                 refresh_workers: int = 2, shared: Optional[Any] = None):
+        self.name = name
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self._entries = TTLCache(max_entries=max_entries, default_ttl=fresh_for + stale_for,
+                                 shared=shared, namespace=name)
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers,
+                                                    thread_name_prefix=f"{name}-refresh")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries.set(key, (time.time(), value))
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]):
+        try:
+            self._store(key, loader())
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            with self._lock:
+                self.refresh_failures += 1
+            print(f"[ERROR] Background refresh of {self.name} cache failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return a cached result for key, calling loader on a miss; loader errors propagate"""
+        entry = self._entries.get(key)
+        if entry is not MISSING:
+            stored_at, value = entry
+            if time.time() - stored_at < self.fresh_for:
+                with self._lock:
+                    self.hits += 1
+                return value
+
+            with self._lock:
+                self.stale_hits += 1
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if start_refresh:
+                self._refresh_executor.submit(self._refresh, key, loader)
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = loader()
+        self._store(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self._entries.max_entries,
+            'fresh_for': self.fresh_for,
+            'stale_for': self.stale_for,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'shared_hits': self._entries.shared_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'evictions': self._entries.evictions,
+            'hit_rate': round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0
+        }
+
+class _InFlightCall:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution
+    The first caller (the leader) runs the function; callers arriving while it
+    is in flight wait up to wait_timeout for its result. If the leader fails or
+    the wait runs out, a waiter falls back to running the function itself.
+    stream() does the same for generators, so a streamed run can lead or join
+    the same key as do() calls.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _InFlightCall] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self.leaders += 1
+        return call, leader
+
+    def _finish(self, key: Hashable, call: _InFlightCall):
+        with self._lock:
+            del self._calls[key]
+        call.done.set()
+
+    def _wait(self, call: _InFlightCall, wait_timeout: float) -> bool:
+        if call.done.wait(wait_timeout) and call.error is None:
+            with self._lock:
+                self.coalesced += 1
+            return True
+        with self._lock:
+            self.fallbacks += 1
+        return False
+
+    def do(self, key: Hashable, fn: Callable[[], Any], wait_timeout: float) -> Any:
+        call, leader = self._join(key)
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                self._finish(key, call)
+
+        if self._wait(call, wait_timeout):
+            return copy.deepcopy(call.result)
+        return fn()
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterable[Any]], wait_timeout: float) -> Iterator[Any]:
+        """
+        do() for a generator: the leader yields fn()'s items as they arrive and
+        shares its last item as the result; waiters yield only that last item.
+        A leader abandoned part way (a closed stream) counts as failed.
+        """
+        call, leader = self._join(key)
+        if leader:
+            try:
+                for item in fn():
+                    call.result = item
+                    yield item
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                self._finish(key, call)
+            return
+
+        if self._wait(call, wait_timeout):
+            yield copy.deepcopy(call.result)
+            return
+        yield from fn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'fallbacks': self.fallbacks
+        }
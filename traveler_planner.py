@@ -1,21 +1,29 @@
 import os
 import json
-import re
-import requests
-from flask import Flask, render_template, request, session, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, session, redirect, url_for, flash, send_file, Response, stream_with_context
 from dotenv import load_dotenv
 from traveler_profile import traveler_profiles
 from prompt_engine import prompt_engine
+from provider_client import providers, current_deadline, submit_with_deadline, result_or_fallback
+from travel_cache import TTLCache, StaleWhileRevalidateCache, SingleFlight, MISSING
+from plan_parser import StreamingPlanParser, parse_plan
+from job_queue import PersistentJobQueue, JobWorkerPool
+from email_queue import email_dispatcher
+from profile_store import ProfileStore
+from kv_store import open_kv_store
+from similarity_index import SimilarityIndex
+from destination_graph import DestinationGraph
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import random
 from datetime import datetime, timedelta
 import io
 import csv
+import time
+import hashlib
+import copy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
 
 load_dotenv()
 groq_api = os.getenv("GROQ_API_KEY")
@@ -24,7 +32,7 @@ rapidapi_key = os.getenv("RAPIDAPI_KEY")
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-here")
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///travel_planner.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'sqlite:///travel_planner.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
@@ -58,6 +66,7 @@ class TravelerProfile(db.Model):
     budget = db.Column(db.String(50))
     interests = db.Column(db.String(200))  # Comma-separated
     preferences = db.Column(db.String(200))
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every change
 
 class TravelPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,8 +79,14 @@ class TravelPlan(db.Model):
     budget = db.Column(db.String(50))
     preferences = db.Column(db.String(200))
     itinerary = db.Column(db.Text)  # Store as JSON string
+    status = db.Column(db.String(20), default='done')  # queued / running / done / failed
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
+class DestinationCache(db.Model):
+    city = db.Column(db.String(100), primary_key=True)  # Normalized city name
+    dest_id = db.Column(db.String(32), nullable=True)  # NULL caches a "not found" answer
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 CITY_IMAGES = {
     "tokyo": "https://images.unsplash.com/photo-1507699622108-4be3abd695ad",
     "paris": "https://images.unsplash.com/photo-1502602898657-3e91760cbb34",
@@ -82,72 +97,605 @@ CITY_IMAGES = {
     "default": "https://images.unsplash.com/photo-1507525428034-b723cf961d3e"
 }
 
-def get_dest_id(city):
+# --- Shared cache layer ---
+# Gunicorn workers are separate processes. Provider result caches, the plan
+# cache and profile versions go through one KV store so that every worker on
+# the host sees the same entries. SHARED_CACHE_URL is sqlite:///path (default,
+# in the instance folder), redis://host:port/db, or "none" for per-process caches.
+os.makedirs(app.instance_path, exist_ok=True)
+shared_cache = open_kv_store(os.getenv(
+    "SHARED_CACHE_URL", "sqlite:///" + os.path.join(app.instance_path, "shared_cache.db")))
+if shared_cache is not None:
+    shared_cache.purge_expired()
+
+# --- Destination ID cache ---
+# A city's Booking dest_id practically never changes, so lookups are cached in
+# two tiers: an in-process LRU in front of the destination_cache table. Cities
+# Booking does not know are cached as well, for a much shorter time.
+DEST_ID_TTL = timedelta(days=int(os.getenv("DEST_ID_TTL_DAYS", "30")))
+DEST_ID_NEGATIVE_TTL = timedelta(minutes=int(os.getenv("DEST_ID_NEGATIVE_TTL_MINUTES", "60")))
+dest_id_cache = TTLCache(max_entries=int(os.getenv("DEST_ID_CACHE_SIZE", "2048")))
+
+def normalize_city(city):
+    return ' '.join((city or '').lower().split())
+
+def lookup_dest_id(city):
+    """Ask Booking for a city's dest_id; returns (dest_id, answered)"""
     try:
-        url = "https://booking-com.p.rapidapi.com/v1/hotels/locations"
         headers = {
             "X-RapidAPI-Key": rapidapi_key,
             "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
         }
-        response = requests.get(url, headers=headers, params={"name": city, "locale": "en-us"})
+        response = providers["booking"].get("/v1/hotels/locations", headers=headers, params={"name": city, "locale": "en-us"})
+        if response.status_code != 200:
+            return None, False
         data = response.json()
         if data and "dest_id" in data[0]:
-            return data[0]["dest_id"]
+            return str(data[0]["dest_id"]), True
+        return None, True
     except:
+        return None, False
+
+def get_dest_id(city):
+    key = normalize_city(city)
+    if not key:
         return None
-    return None
+
+    cached = dest_id_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    with app.app_context():
+        now = datetime.utcnow()
+        row = db.session.get(DestinationCache, key)
+        if row and row.expires_at > now:
+            dest_id_cache.set(key, row.dest_id, (row.expires_at - now).total_seconds())
+            return row.dest_id
+
+        dest_id, answered = lookup_dest_id(city)
+        if not answered:
+            # Transient provider failure: don't remember anything
+            return None
+
+        ttl = DEST_ID_TTL if dest_id else DEST_ID_NEGATIVE_TTL
+        dest_id_cache.set(key, dest_id, ttl.total_seconds())
+        try:
+            if row is None:
+                row = DestinationCache(city=key)
+                db.session.add(row)
+            row.dest_id = dest_id
+            row.expires_at = now + ttl
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Failed to persist dest_id for {key}: {e}")
+        return dest_id
 
 # -- Robust JSON cleaner --
+FALLBACK_PLAN = {
+    "itinerary": {
+        "Day 1": [
+            "🏛️ Visit local cultural sites and museums",
+            "🍽️ Try authentic local cuisine for lunch",
+            "🌅 Explore main attractions and landmarks",
+            "🍽️ Enjoy traditional dinner at local restaurant"
+        ]
+    },
+    "budget_analysis": {
+        "accommodation": {"estimated": 100, "range": "80-150"},
+        "food": {"estimated": 80, "range": "60-120"},
+        "transportation": {"estimated": 30, "range": "20-50"},
+        "activities": {"estimated": 50, "range": "30-80"},
+        "miscellaneous": {"estimated": 20, "range": "10-30"}
+    },
+    "travel_tips": {
+        "cultural": ["Respect local customs", "Learn basic local phrases"],
+        "practical": ["Use public transportation", "Carry local currency"],
+        "safety": ["Stay in well-lit areas", "Keep valuables secure"],
+        "food": ["Try local specialties", "Drink bottled water"]
+    },
+    "personalized_recommendations": {
+        "based_on_interests": ["Visit museums and galleries", "Try cultural activities"],
+        "budget_optimization": ["Use public transport", "Eat at local markets"],
+        "hidden_gems": ["Explore local neighborhoods", "Visit free attractions"]
+    }
+}
+
+def plan_with_fallbacks(plan, problems, text):
+    """
+    Complete a parsed plan
+    Well-formed sections are kept; only missing or broken sections are replaced
+    from FALLBACK_PLAN, and the whole fallback is used only if nothing survived.
+    """
+    if not plan:
+        reason = "Empty response from Groq API" if not (text or '').strip() else "No valid JSON structure found in response"
+        fallback = copy.deepcopy(FALLBACK_PLAN)
+        fallback["_error_info"] = f"API Error: {reason} | Response: {text[:200] if text else 'No response'}..."
+        return fallback
+
+    for section, fallback in FALLBACK_PLAN.items():
+        if section not in plan:
+            plan[section] = copy.deepcopy(fallback)
+    if problems:
+        plan["_recovered_info"] = "; ".join(problems)
+    return plan
+
 def safe_json_loads(text):
+    plan, problems = parse_plan(text, prompt_engine.output_schemas["comprehensive"])
+    return plan_with_fallbacks(plan, problems, text)
+
+# --- Planning pipeline ---
+# The flight search, the hotel search (dest_id lookup + search) and the LLM
+# completion are independent, so they run side by side on a bounded pool.
+# Each stage has its own deadline measured from the start of the request; a
+# stage that misses it degrades to the same fallback used on provider errors.
+# Stages run under their deadline (see provider_client.stage_deadline), so a
+# slow provider holds a worker until about its stage deadline and no longer.
+# Every plan takes three workers, so PLANNING_WORKERS // 3 plans run at once
+# and further requests queue until a worker frees up.
+PLANNING_WORKERS = int(os.getenv("PLANNING_WORKERS", "8"))
+PROVIDER_DEADLINES = {
+    "flights": float(os.getenv("FLIGHTS_DEADLINE", "8")),
+    "hotels": float(os.getenv("HOTELS_DEADLINE", "8")),
+    "itinerary": float(os.getenv("ITINERARY_DEADLINE", "25"))
+}
+planning_executor = ThreadPoolExecutor(max_workers=PLANNING_WORKERS, thread_name_prefix="planner")
+
+# --- Hotel and flight result caches ---
+# Searches for the same destination and dates are served from a
+# stale-while-revalidate cache; only successful upstream answers are stored.
+BUDGET_BUCKETS = (500, 1000, 2000, 5000, 10000)
+HOTEL_CURRENCY = "USD"
+hotel_cache = StaleWhileRevalidateCache(
+    "hotels",
+    fresh_for=float(os.getenv("HOTEL_CACHE_FRESH_SECONDS", "600")),
+    stale_for=float(os.getenv("HOTEL_CACHE_STALE_SECONDS", "3600")),
+    max_entries=int(os.getenv("HOTEL_CACHE_SIZE", "1024")),
+    shared=shared_cache
+)
+flight_cache = StaleWhileRevalidateCache(
+    "flights",
+    fresh_for=float(os.getenv("FLIGHT_CACHE_FRESH_SECONDS", "900")),
+    stale_for=float(os.getenv("FLIGHT_CACHE_STALE_SECONDS", "3600")),
+    max_entries=int(os.getenv("FLIGHT_CACHE_SIZE", "1024")),
+    shared=shared_cache
+)
+
+def budget_bucket(budget):
+    """Round a budget up to the nearest form budget tier"""
     try:
-        # Check if text is empty or None
-        if not text or not text.strip():
-            raise ValueError("Empty response from Groq API")
-        
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        
-        # Check if we found valid JSON brackets
-        if start == -1 or end == 0:
-            raise ValueError("No valid JSON structure found in response")
-        
-        json_str = text[start:end]
+        amount = int(budget)
+    except (TypeError, ValueError):
+        return budget
+    for bucket in BUDGET_BUCKETS:
+        if amount <= bucket:
+            return bucket
+    return BUDGET_BUCKETS[-1]
+
+def fallback_hotels(destination):
+    return [
+        {"name": f"{destination.title()} Grand Hotel", "price": "$120/night"},
+        {"name": f"{destination.title()} Central Inn", "price": "$95/night"}
+    ]
 
-        # Clean up format
-        json_str = json_str.replace('\n', '').replace('\r', '')
-        json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)  # remove trailing commas
+def search_flights(departure_city, destination, budget):
+    """Tavily flight search; raises on provider errors"""
+    res = providers["tavily"].post("/search", json={
+        "api_key": tavily_api,
+        "query": f"cheap flights from {departure_city} to {destination} under ${budget}",
+        "search_depth": "basic"
+    }, headers={"Content-Type": "application/json"})
+    res.raise_for_status()
+    flight_data = res.json()
+    answer = flight_data.get("answer")
+    results = flight_data.get("results", [])
+    if answer and isinstance(answer, str) and answer.strip():
+        return [answer.strip()]
+    return [f"{r['title']} — {r['url']}" for r in results[:3]] if results else ["None"]
 
-        return json.loads(json_str)
+def fetch_flights(departure_city, destination, budget):
+    try:
+        bucket = budget_bucket(budget)
+        key = (normalize_city(departure_city), normalize_city(destination), bucket)
+        return flight_cache.get_or_load(key, lambda: search_flights(departure_city, destination, bucket))
     except Exception as e:
-        return {
-            "itinerary": {
-                "Day 1": [
-                    "🏛️ Visit local cultural sites and museums",
-                    "🍽️ Try authentic local cuisine for lunch",
-                    "🌅 Explore main attractions and landmarks",
-                    "🍽️ Enjoy traditional dinner at local restaurant"
-                ]
-            },
-            "budget_analysis": {
-                "accommodation": {"estimated": 100, "range": "80-150"},
-                "food": {"estimated": 80, "range": "60-120"},
-                "transportation": {"estimated": 30, "range": "20-50"},
-                "activities": {"estimated": 50, "range": "30-80"},
-                "miscellaneous": {"estimated": 20, "range": "10-30"}
-            },
-            "travel_tips": {
-                "cultural": ["Respect local customs", "Learn basic local phrases"],
-                "practical": ["Use public transportation", "Carry local currency"],
-                "safety": ["Stay in well-lit areas", "Keep valuables secure"],
-                "food": ["Try local specialties", "Drink bottled water"]
-            },
-            "personalized_recommendations": {
-                "based_on_interests": ["Visit museums and galleries", "Try cultural activities"],
-                "budget_optimization": ["Use public transport", "Eat at local markets"],
-                "hidden_gems": ["Explore local neighborhoods", "Visit free attractions"]
-            },
-            "_error_info": f"API Error: {str(e)} | Response: {text[:200] if text else 'No response'}..."
-        }
+        return [f"❌ Flights Error: {str(e)}"]
+
+def search_hotels(dest_id, checkin, checkout):
+    """Booking hotel search; raises on provider errors"""
+    res = providers["booking"].get("/v1/hotels/search", headers={
+        "X-RapidAPI-Key": rapidapi_key,
+        "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
+    }, params={
+        "checkout_date": checkout,
+        "checkin_date": checkin,
+        "dest_type": "city",
+        "dest_id": dest_id,
+        "order_by": "price",
+        "adults_number": "1",
+        "locale": "en-us",
+        "units": "metric",
+        "room_number": "1",
+        "filter_by_currency": HOTEL_CURRENCY,
+        "page_number": "0"
+    })
+    res.raise_for_status()
+    hotels = []
+    for h in res.json().get("result", [])[:3]:
+        hotels.append({
+            "name": h.get("hotel_name", "N/A"),
+            "price": f"${int(h.get('price_breakdown', {}).get('gross_price', 0))}/night"
+        })
+    return hotels
+
+def fetch_hotels(destination, checkin, checkout):
+    """Hotel stage of the pipeline; the dest_id lookup runs first on the same worker"""
+    try:
+        dest_id = get_dest_id(destination)
+        if not dest_id:
+            raise Exception("Dest ID not found")
+        key = (dest_id, checkin, checkout, HOTEL_CURRENCY)
+        return hotel_cache.get_or_load(key, lambda: search_hotels(dest_id, checkin, checkout))
+    except:
+        return fallback_hotels(destination)
+
+def generation_error(message):
+    return {
+        "itinerary": {"Day 1": [f"❌ Groq Error: {message}"]},
+        "budget_analysis": {},
+        "travel_tips": {},
+        "personalized_recommendations": {}
+    }
+
+# --- LLM plan cache ---
+# Parsed plans are cached under a hash of the normalized planning inputs and
+# the model name, so identical trips skip the Groq round trip entirely.
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-8b-8192")
+plan_cache = TTLCache(
+    max_entries=int(os.getenv("PLAN_CACHE_SIZE", "512")),
+    default_ttl=float(os.getenv("PLAN_CACHE_TTL_SECONDS", "21600")),
+    shared=shared_cache,
+    namespace="plans"
+)
+
+def plan_cache_key(destination, days, budget, preferences, profile_context):
+    """Canonical hash of everything that shapes the generated plan"""
+    interests = sorted({p.strip().lower() for p in (preferences or "General").split(',') if p.strip()})
+    payload = {
+        "destination": normalize_city(destination),
+        "days": int(days),
+        "budget": budget_bucket(budget),
+        "preferences": interests,
+        "profile": profile_context or {},
+        "model": GROQ_MODEL
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def generate_plan(destination, days, budget, preferences, profile_context, use_cache=True):
+    """Enhanced Groq LLaMA itinerary with profile context"""
+    try:
+        key = plan_cache_key(destination, days, budget, preferences, profile_context)
+        if use_cache:
+            cached = plan_cache.get(key)
+            if cached is not MISSING:
+                return cached
+
+        # The static prompt prefix goes first as the system message so the provider can cache it
+        prompt = prompt_engine.plan_prompt(
+            "comprehensive",
+            traveler_profile=profile_context,
+            destination=destination,
+            days=int(days),
+            budget=int(budget),
+            preferences=preferences or "General"
+        )
+
+        return plan_from_parsed(safe_json_loads(groq_completion(prompt)), key)
+    except Exception as e:
+        return generation_error(str(e))
+
+def groq_completion(prompt):
+    """Send one PromptPlan to Groq, record its size and latency and return the reply text"""
+    started = time.monotonic()
+    groq_res = providers["groq"].post("/openai/v1/chat/completions", headers={
+        "Authorization": f"Bearer {groq_api}",
+        "Content-Type": "application/json"
+    }, json={
+        "model": GROQ_MODEL,
+        "messages": prompt.messages,
+        "max_tokens": prompt.max_tokens
+    }, total_timeout=PROVIDER_DEADLINES["itinerary"])
+    response = groq_res.json()
+    prompt_engine.prompt_stats.record(prompt, time.monotonic() - started,
+                                      (response.get('usage') or {}).get('prompt_tokens'))
+    return response['choices'][0]['message']['content']
+
+# --- Decomposed generation ---
+# With PLAN_GENERATION=sections each plan section comes from its own smaller
+# prompt, all sent at once, so generation takes about as long as the slowest
+# section. A section that fails or times out falls back on its own. Sections
+# run on their own pool: they are awaited from planning_executor threads.
+PLAN_GENERATION = os.getenv("PLAN_GENERATION", "comprehensive").lower()
+PLAN_SECTIONS = {
+    # plan section -> (prompt type, top-level key of its answer)
+    "itinerary": ("itinerary", "itinerary"),
+    "budget_analysis": ("budget_analysis", "budget_breakdown"),
+    "travel_tips": ("travel_tips", "tips"),
+    "personalized_recommendations": ("recommendations", "recommendations")
+}
+section_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SECTION_WORKERS", "8")),
+                                      thread_name_prefix="sections")
+
+def generate_section(kind, answer_key, destination, days, budget, preferences, profile_context):
+    """Generate and parse one plan section; raises if the answer has no usable section"""
+    prompt = prompt_engine.plan_prompt(
+        kind,
+        traveler_profile=profile_context,
+        destination=destination,
+        days=int(days),
+        budget=int(budget),
+        preferences=preferences or "General"
+    )
+    parsed, problems = parse_plan(groq_completion(prompt), prompt_engine.output_schemas[kind])
+    if not parsed.get(answer_key):
+        raise ValueError("; ".join(problems) or f"no {answer_key} in response")
+    if problems:
+        print(f"[DEBUG] {kind} section recovered: {'; '.join(problems)}")
+    return parsed[answer_key]
+
+def iter_plan_sections(destination, days, budget, preferences, profile_context):
+    """Run all section prompts concurrently; yield (section, value) as each finishes, value None on failure"""
+    # Sections inherit the itinerary stage's deadline when run inside the pipeline
+    deadline = current_deadline() or time.monotonic() + PROVIDER_DEADLINES["itinerary"]
+    futures = {
+        submit_with_deadline(section_executor, deadline, generate_section, kind, answer_key,
+                             destination, days, budget, preferences, profile_context): section
+        for section, (kind, answer_key) in PLAN_SECTIONS.items()
+    }
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+            pending.discard(future)
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                print(f"[ERROR] {futures[future]} section failed: {e}")
+                yield futures[future], None
+    except FuturesTimeoutError:
+        for future in pending:
+            future.cancel()
+            print(f"[ERROR] {futures[future]} section missed its {PROVIDER_DEADLINES['itinerary']}s deadline")
+            yield futures[future], None
+
+def generate_plan_sections(destination, days, budget, preferences, profile_context, use_cache=True):
+    """generate_plan() from per-section prompts; failed sections get their FALLBACK_PLAN entry"""
+    try:
+        key = plan_cache_key(destination, days, budget, preferences, profile_context)
+        if use_cache:
+            cached = plan_cache.get(key)
+            if cached is not MISSING:
+                return cached
+
+        plan, problems = {}, []
+        for section, value in iter_plan_sections(destination, days, budget, preferences, profile_context):
+            if value is None:
+                problems.append(f"{section}: generation failed")
+            else:
+                plan[section] = value
+        return plan_from_parsed(plan_with_fallbacks(plan, problems, ""), key)
+    except Exception as e:
+        return generation_error(str(e))
+
+def plan_from_parsed(parsed, cache_key):
+    """Pick the plan sections out of a parsed response and cache real answers"""
+    plan = {
+        "itinerary": parsed.get("itinerary", {"Day 1": ["❌ No itinerary found"]}),
+        "budget_analysis": parsed.get("budget_analysis", {}),
+        "travel_tips": parsed.get("travel_tips", {}),
+        "personalized_recommendations": parsed.get("personalized_recommendations", {})
+    }
+    # Canned or partly recovered plans are never cached
+    if "_error_info" not in parsed and "_recovered_info" not in parsed:
+        plan_cache.set(cache_key, plan)
+    return plan
+
+def stream_plan(destination, days, budget, preferences, profile_context, use_cache=True):
+    """
+    Generate the plan with Groq streaming enabled
+    Yields ((section, key), value) as each itinerary day, budget line or tip
+    category completes, then (None, plan) with the assembled plan.
+    """
+    try:
+        key = plan_cache_key(destination, days, budget, preferences, profile_context)
+        if use_cache:
+            cached = plan_cache.get(key)
+            if cached is not MISSING:
+                for section, entries in cached.items():
+                    for name, value in entries.items():
+                        yield (section, name), value
+                yield None, cached
+                return
+
+        if PLAN_GENERATION == "sections":
+            plan, problems = {}, []
+            for section, value in iter_plan_sections(destination, days, budget, preferences, profile_context):
+                if value is None:
+                    problems.append(f"{section}: generation failed")
+                    continue
+                plan[section] = value
+                for name, entry in value.items():
+                    yield (section, name), entry
+            yield None, plan_from_parsed(plan_with_fallbacks(plan, problems, ""), key)
+            return
+
+        prompt = prompt_engine.plan_prompt(
+            "comprehensive",
+            traveler_profile=profile_context,
+            destination=destination,
+            days=int(days),
+            budget=int(budget),
+            preferences=preferences or "General"
+        )
+
+        started = time.monotonic()
+        groq_res = providers["groq"].post("/openai/v1/chat/completions", headers={
+            "Authorization": f"Bearer {groq_api}",
+            "Content-Type": "application/json"
+        }, json={
+            "model": GROQ_MODEL,
+            "messages": prompt.messages,
+            "max_tokens": prompt.max_tokens,
+            "stream": True
+        }, stream=True, total_timeout=PROVIDER_DEADLINES["itinerary"])
+        groq_res.raise_for_status()
+        groq_res.encoding = 'utf-8'
+
+        parser = StreamingPlanParser(prompt_engine.output_schemas["comprehensive"])
+        content = []
+        usage = {}
+        try:
+            for line in groq_res.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                chunk = json.loads(payload)
+                # Groq reports token usage on the last chunk
+                usage = chunk.get('x_groq', {}).get('usage') or chunk.get('usage') or usage
+                choices = chunk.get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if not delta:
+                    continue
+                content.append(delta)
+                for path, value in parser.feed(delta):
+                    if len(path) == 2:
+                        yield path, value
+        finally:
+            groq_res.close()
+            prompt_engine.prompt_stats.record(prompt, time.monotonic() - started, usage.get('prompt_tokens'))
+
+        plan, problems = parser.result()
+        yield None, plan_from_parsed(plan_with_fallbacks(plan, problems, ''.join(content)), key)
+    except Exception as e:
+        yield None, generation_error(str(e))
+
+def _submit_stage(started, stage, fn, *args):
+    """Run a pipeline stage on planning_executor with its provider calls capped at the stage deadline"""
+    return submit_with_deadline(planning_executor, started + PROVIDER_DEADLINES[stage], fn, *args)
+
+def _await_stage(future, started, stage, fallback):
+    """Wait for a pipeline stage until its deadline, then fall back"""
+    def expired():
+        print(f"[ERROR] {stage} stage missed its {PROVIDER_DEADLINES[stage]}s deadline")
+        return fallback()
+    return result_or_fallback(future, started + PROVIDER_DEADLINES[stage], expired)
+
+def run_planning_pipeline(destination, departure_city, budget, days, preferences,
+                          checkin, checkout, profile_context, use_cache=True):
+    """Run the flight, hotel and itinerary stages concurrently and assemble the result"""
+    started = time.monotonic()
+    flights_future = _submit_stage(started, "flights", fetch_flights, departure_city, destination, budget)
+    hotels_future = _submit_stage(started, "hotels", fetch_hotels, destination, checkin, checkout)
+    generate = generate_plan_sections if PLAN_GENERATION == "sections" else generate_plan
+    plan_future = _submit_stage(started, "itinerary", generate, destination, days, budget, preferences,
+                                profile_context, use_cache)
+
+    flights = _await_stage(flights_future, started, "flights",
+                           lambda: ["❌ Flights Error: search timed out"])
+    hotels = _await_stage(hotels_future, started, "hotels",
+                          lambda: fallback_hotels(destination))
+    plan = _await_stage(plan_future, started, "itinerary",
+                        lambda: generation_error("itinerary generation timed out"))
+
+    return {
+        "flights": flights,
+        "hotels": hotels,
+        "itinerary": plan["itinerary"],
+        "budget_analysis": plan["budget_analysis"],
+        "travel_tips": plan["travel_tips"],
+        "personalized_recommendations": plan["personalized_recommendations"]
+    }
+
+# --- Request coalescing ---
+# Identical planning submissions that arrive while one is already running
+# (double clicks, traffic spikes) wait for that run instead of starting their own.
+PLAN_COALESCE_WAIT = float(os.getenv("PLAN_COALESCE_WAIT", str(max(PROVIDER_DEADLINES.values()) + 2)))
+inflight_plans = SingleFlight()
+
+def planning_key(pipeline_args):
+    """Canonical hash of the normalized planning inputs"""
+    normalized = dict(pipeline_args)
+    normalized['destination'] = normalize_city(pipeline_args.get('destination'))
+    normalized['departure_city'] = normalize_city(pipeline_args.get('departure_city'))
+    normalized['preferences'] = ' '.join((pipeline_args.get('preferences') or '').lower().split())
+    canonical = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# --- Background planning jobs ---
+# In async mode the POST only records a queued TravelPlan and enqueues a job;
+# a small worker pool runs the pipeline and fills the plan in. The queue lives
+# in its own SQLite file so queued jobs survive a restart. Running jobs hold a
+# renewed lease, so only jobs of a stopped or crashed worker are taken over.
+ASYNC_PLANNING = os.getenv("ASYNC_PLANNING", "false").lower() in ("1", "true", "yes")
+PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "2"))
+PLAN_JOB_ATTEMPTS = int(os.getenv("PLAN_JOB_ATTEMPTS", "2"))
+PLAN_JOB_RETENTION = int(os.getenv("PLAN_JOB_RETENTION_DAYS", "7")) * 86400
+PLAN_JOB_LEASE = float(os.getenv("PLAN_JOB_LEASE_SECONDS", "60"))
+os.makedirs(app.instance_path, exist_ok=True)
+plan_jobs = PersistentJobQueue(
+    os.getenv("PLAN_QUEUE_PATH", os.path.join(app.instance_path, "plan_jobs.db")),
+    max_attempts=PLAN_JOB_ATTEMPTS,
+    lease_seconds=PLAN_JOB_LEASE
+)
+
+def set_plan_status(plan_id, status, result=None):
+    with app.app_context():
+        plan = db.session.get(TravelPlan, plan_id)
+        if plan is None:
+            return None
+        plan.status = status
+        if result is not None:
+            plan.itinerary = json.dumps(result)
+        db.session.commit()
+        return plan
+
+def run_plan_job(payload):
+    """Worker entry point: generate the plan for a queued TravelPlan"""
+    pipeline_args = payload['pipeline_args']
+    if set_plan_status(payload['plan_id'], 'running') is None:
+        print(f"[DEBUG] Plan {payload['plan_id']} was deleted before its job ran")
+        return
+    result = inflight_plans.do(
+        planning_key(pipeline_args),
+        lambda: run_planning_pipeline(**pipeline_args),
+        wait_timeout=PLAN_COALESCE_WAIT
+    )
+    set_plan_status(payload['plan_id'], 'done', result)
+
+def plan_job_failed(job_id, payload, error):
+    set_plan_status(payload['plan_id'], 'failed')
+
+plan_workers = JobWorkerPool(plan_jobs, {"plan": run_plan_job}, workers=PLAN_JOB_WORKERS,
+                             on_failure=plan_job_failed)
+
+def enqueue_travel_plan(user_id, pipeline_args):
+    """Record a queued TravelPlan and hand its generation to the worker pool"""
+    plan = save_travel_plan(user_id, pipeline_args, None, status='queued')
+    plan_jobs.enqueue("plan", {
+        'plan_id': plan.id,
+        'pipeline_args': pipeline_args
+    })
+    plan_workers.notify()
+    return plan
+
+@app.before_request
+def start_plan_workers():
+    # Started lazily so only the serving process (not the reloader) runs workers
+    if not plan_workers.running:
+        plan_jobs.purge_finished(PLAN_JOB_RETENTION)
+        plan_workers.start()
 
 def get_or_create_user_id():
     """Get or create a user ID for session management using the database"""
@@ -161,40 +709,50 @@ def get_or_create_user_id():
 
 def update_traveler_profile(user_id, form_data):
     """Update traveler profile based on form data using both database and in-memory system"""
-    # Update database profile
-    profile = TravelerProfile.query.filter_by(user_id=user_id).first()
-    if not profile:
-        profile = TravelerProfile(user_id=user_id)
-        db.session.add(profile)
+    # Hold the user's profile lock so concurrent requests cannot interleave
+    with traveler_profiles.locked(str(user_id)):
+        # Update database profile
+        profile = TravelerProfile.query.filter_by(user_id=user_id).first()
+        if not profile:
+            profile = TravelerProfile(user_id=user_id, version=0)
+            db.session.add(profile)
+        previous_version = profile.version or 0
+        in_sync = traveler_profiles.get_synced_version(str(user_id)) == previous_version
     
-    # Update budget
-    budget = form_data.get('budget')
-    if budget:
-        profile.budget = f"${budget}"
-        # Also update in-memory profile
-        traveler_profiles.update_budget_profile(str(user_id), f"${budget}")
+        # Update budget
+        budget = form_data.get('budget')
+        if budget:
+            profile.budget = f"${budget}"
+            # Also update in-memory profile
+            traveler_profiles.update_budget_profile(str(user_id), f"${budget}")
     
-    # Update interests
-    preferences = form_data.get('preferences')
-    if preferences:
-        interests = [interest.strip() for interest in preferences.split(',') if interest.strip()]
-        profile.interests = ','.join(interests)
-        profile.preferences = preferences
-        # Also update in-memory profile
-        traveler_profiles.update_interests_profile(str(user_id), interests)
+        # Update interests
+        preferences = form_data.get('preferences')
+        if preferences:
+            interests = [interest.strip() for interest in preferences.split(',') if interest.strip()]
+            profile.interests = ','.join(interests)
+            profile.preferences = preferences
+            # Also update in-memory profile
+            traveler_profiles.update_interests_profile(str(user_id), interests)
     
-    # Add travel preferences to in-memory profile
-    if any([form_data.get('destination'), form_data.get('days'), form_data.get('departure_city')]):
-        travel_prefs = {
-            'destination': form_data.get('destination'),
-            'days': form_data.get('days'),
-            'departure_city': form_data.get('departure_city'),
-            'checkin_date': form_data.get('checkin_date'),
-            'checkout_date': form_data.get('checkout_date')
-        }
-        traveler_profiles.add_travel_preferences(str(user_id), travel_prefs)
+        if db.session.is_modified(profile) or profile.id is None:
+            profile.version = previous_version + 1
     
-    db.session.commit()
+        # Add travel preferences to in-memory profile
+        if any([form_data.get('destination'), form_data.get('days'), form_data.get('departure_city')]):
+            travel_prefs = {
+                'destination': form_data.get('destination'),
+                'days': form_data.get('days'),
+                'departure_city': form_data.get('departure_city'),
+                'checkin_date': form_data.get('checkin_date'),
+                'checkout_date': form_data.get('checkout_date')
+            }
+            traveler_profiles.add_travel_preferences(str(user_id), travel_prefs)
+    
+        db.session.commit()
+        # The in-memory profile already has these changes; skip re-syncing them
+        if in_sync:
+            traveler_profiles.set_synced_version(str(user_id), profile.version)
 
 def login_required(f):
     @wraps(f)
@@ -205,6 +763,83 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def prepare_planning_request(user_id):
+    """Read the planning form, update the traveler profile and build the pipeline arguments"""
+    destination = request.form.get("destination", "").strip()
+    departure_city = request.form.get("departure_city", "").strip()
+    budget = request.form.get("budget")
+    days = request.form.get("days")
+    preferences = request.form.get("preferences")
+    checkin = request.form.get("checkin_date")
+    checkout = request.form.get("checkout_date")
+
+    # Update traveler profile
+    form_data = {
+        'destination': destination,
+        'departure_city': departure_city,
+        'budget': budget,
+        'days': days,
+        'preferences': preferences,
+        'checkin_date': checkin,
+        'checkout_date': checkout
+    }
+    update_traveler_profile(user_id, form_data)
+
+    # Get profile summary and recommendations
+    profile_summary = traveler_profiles.get_profile_summary(str(user_id))
+    personalized_recommendations = traveler_profiles.get_recommendations(str(user_id), destination)
+
+    pipeline_args = {
+        'destination': destination,
+        'departure_city': departure_city,
+        'budget': budget,
+        'days': days,
+        'preferences': preferences,
+        'checkin': checkin,
+        'checkout': checkout,
+        'profile_context': profile_summary.get('profile_data', {}),
+        'use_cache': request.form.get("fresh_plan") != "on"
+    }
+    return pipeline_args, personalized_recommendations
+
+def save_travel_plan(user_id, pipeline_args, result, status='done'):
+    """Save TravelPlan to DB"""
+    days = pipeline_args['days']
+    budget = pipeline_args['budget']
+    plan = TravelPlan(
+        user_id=user_id,
+        destination=pipeline_args['destination'],
+        departure_city=pipeline_args['departure_city'],
+        checkin_date=pipeline_args['checkin'],
+        checkout_date=pipeline_args['checkout'],
+        days=int(days) if days else None,
+        budget=f"${budget}" if budget else None,
+        preferences=pipeline_args['preferences'],
+        itinerary=json.dumps(result) if result else None,
+        status=status
+    )
+    db.session.add(plan)
+    db.session.commit()
+    sync_destination_graph()
+    return plan
+
+# Destinations planned by the same travelers, for related-destination lookups.
+# New plans are picked up by id from the database; edits and deletes made in
+# this worker move or remove the plan's co-visits right away.
+destination_graph = DestinationGraph()
+
+def plan_interests(preferences):
+    return [p.strip() for p in (preferences or '').split(',') if p.strip()]
+
+def sync_destination_graph():
+    """Add TravelPlan rows saved since the last sync, by this or any other worker, to the graph"""
+    rows = (db.session.query(TravelPlan.id, TravelPlan.user_id, TravelPlan.destination, TravelPlan.preferences)
+            .filter(TravelPlan.id > destination_graph.last_plan_id)
+            .order_by(TravelPlan.id).all())
+    for plan_id, user_id, destination, preferences in rows:
+        destination_graph.add_plan(plan_id, str(user_id), destination, plan_interests(preferences))
+    return len(rows)
+
 @app.route("/", methods=["GET", "POST"])
 @login_required
 def home():
@@ -218,139 +853,21 @@ def home():
     user_id = session.get('user_id')
 
     if request.method == "POST":
-        destination = request.form.get("destination", "").strip()
-        departure_city = request.form.get("departure_city", "").strip()
-        budget = request.form.get("budget")
-        days = request.form.get("days")
-        preferences = request.form.get("preferences")
-        checkin = request.form.get("checkin_date")
-        checkout = request.form.get("checkout_date")
-
+        pipeline_args, personalized_recommendations = prepare_planning_request(user_id)
+        destination = pipeline_args['destination']
         bg_image = CITY_IMAGES.get(destination.lower(), CITY_IMAGES["default"])
 
-        # Update traveler profile
-        form_data = {
-            'destination': destination,
-            'departure_city': departure_city,
-            'budget': budget,
-            'days': days,
-            'preferences': preferences,
-            'checkin_date': checkin,
-            'checkout_date': checkout
-        }
-        update_traveler_profile(user_id, form_data)
-        
-        # Get profile summary and recommendations
-        profile_summary = traveler_profiles.get_profile_summary(user_id)
-        personalized_recommendations = traveler_profiles.get_recommendations(user_id, destination)
+        if ASYNC_PLANNING or request.form.get("background") == "on":
+            plan = enqueue_travel_plan(user_id, pipeline_args)
+            flash("Your travel plan is being generated. This page updates when it is ready.", "info")
+            return redirect(url_for('view_plan', plan_id=plan.id))
 
-        # Tavily Flights
-        try:
-            res = requests.post("https://api.tavily.com/search", json={
-                "api_key": tavily_api,
-                "query": f"cheap flights from {departure_city} to {destination} under ${budget}",
-                "search_depth": "basic"
-            }, headers={"Content-Type": "application/json"})
-            flight_data = res.json()
-            answer = flight_data.get("answer")
-            results = flight_data.get("results", [])
-            if answer and isinstance(answer, str) and answer.strip():
-                flights = [answer.strip()]
-            else:
-                flights = [f"{r['title']} — {r['url']}" for r in results[:3]] if results else ["None"]
-        except Exception as e:
-            flights = [f"❌ Flights Error: {str(e)}"]
-
-        # Booking Hotels
-        hotels = []
-        dest_id = get_dest_id(destination)
-        try:
-            if not dest_id:
-                raise Exception("Dest ID not found")
-            res = requests.get("https://booking-com.p.rapidapi.com/v1/hotels/search", headers={
-                "X-RapidAPI-Key": rapidapi_key,
-                "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
-            }, params={
-                "checkout_date": checkout,
-                "checkin_date": checkin,
-                "dest_type": "city",
-                "dest_id": dest_id,
-                "order_by": "price",
-                "adults_number": "1",
-                "locale": "en-us",
-                "units": "metric",
-                "room_number": "1",
-                "filter_by_currency": "USD",
-                "page_number": "0"
-            })
-            for h in res.json().get("result", [])[:3]:
-                hotels.append({
-                    "name": h.get("hotel_name", "N/A"),
-                    "price": f"${int(h.get('price_breakdown', {}).get('gross_price', 0))}/night"
-                })
-        except:
-            hotels = [
-                {"name": f"{destination.title()} Grand Hotel", "price": "$120/night"},
-                {"name": f"{destination.title()} Central Inn", "price": "$95/night"}
-            ]
-
-        # Enhanced Groq LLaMA Itinerary with Profile Context
-        try:
-            # Build comprehensive prompt with profile context
-            profile_context = profile_summary.get('profile_data', {})
-            prompt = prompt_engine.build_comprehensive_prompt(
-                destination=destination,
-                days=int(days),
-                budget=int(budget),
-                preferences=preferences or "General",
-                traveler_profile=profile_context
-            )
-            
-            groq_res = requests.post("https://api.groq.com/openai/v1/chat/completions", headers={
-                "Authorization": f"Bearer {groq_api}",
-                "Content-Type": "application/json"
-            }, json={
-                "model": "llama3-8b-8192",
-                "messages": [{"role": "user", "content": prompt}]
-            })
-            content = groq_res.json()['choices'][0]['message']['content']
-            parsed = safe_json_loads(content)
-            
-            # Extract different components from the response
-            itinerary = parsed.get("itinerary", {"Day 1": ["❌ No itinerary found"]})
-            budget_analysis = parsed.get("budget_analysis", {})
-            travel_tips = parsed.get("travel_tips", {})
-            personalized_recs = parsed.get("personalized_recommendations", {})
-            
-        except Exception as e:
-            itinerary = {"Day 1": [f"❌ Groq Error: {str(e)}"]}
-            budget_analysis = {}
-            travel_tips = {}
-            personalized_recs = {}
-
-        result = {
-            "flights": flights,
-            "hotels": hotels,
-            "itinerary": itinerary,
-            "budget_analysis": budget_analysis,
-            "travel_tips": travel_tips,
-            "personalized_recommendations": personalized_recs
-        }
-
-        # --- Save TravelPlan to DB ---
-        plan = TravelPlan(
-            user_id=user_id,
-            destination=destination,
-            departure_city=departure_city,
-            checkin_date=checkin,
-            checkout_date=checkout,
-            days=int(days) if days else None,
-            budget=f"${budget}" if budget else None,
-            preferences=preferences,
-            itinerary=json.dumps(result) if result else None
+        result = inflight_plans.do(
+            planning_key(pipeline_args),
+            lambda: run_planning_pipeline(**pipeline_args),
+            wait_timeout=PLAN_COALESCE_WAIT
         )
-        db.session.add(plan)
-        db.session.commit()
+        save_travel_plan(user_id, pipeline_args, result)
         flash("Travel plan created successfully!", "success")
 
     # --- Retrieve all plans for the user ---
@@ -360,14 +877,115 @@ def home():
     sync_profile_from_database(user_id)
     profile_summary = traveler_profiles.get_profile_summary(str(user_id))
 
+    sync_destination_graph()
+    if destination:
+        related_destinations = destination_graph.related(destination)
+    else:
+        related_destinations = destination_graph.recommend_for(str(user_id))
+
     return render_template("index.html", 
                          result=result, 
                          destination=destination, 
                          bg_image=bg_image,
                          profile_summary=profile_summary,
                          personalized_recommendations=personalized_recommendations,
+                         related_destinations=related_destinations,
                          user_plans=user_plans)
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_planning_pipeline(destination, departure_city, budget, days, preferences,
+                             checkin, checkout, profile_context, use_cache=True):
+    """
+    run_planning_pipeline() as a generator
+    Yields (event, data) for each plan entry and search stage as it completes,
+    then the assembled result dict run_planning_pipeline() would return.
+    """
+    started = time.monotonic()
+    pending = {
+        "flights": _submit_stage(started, "flights", fetch_flights, departure_city, destination, budget),
+        "hotels": _submit_stage(started, "hotels", fetch_hotels, destination, checkin, checkout)
+    }
+    fallbacks = {
+        "flights": lambda: ["❌ Flights Error: search timed out"],
+        "hotels": lambda: fallback_hotels(destination)
+    }
+    stages = {}
+
+    plan = None
+    for path, value in stream_plan(destination, days, budget, preferences, profile_context, use_cache):
+        if path is None:
+            plan = value
+            continue
+        yield path[0], {"key": path[1], "value": value}
+        for stage in [stage for stage, future in pending.items() if future.done()]:
+            stages[stage] = pending.pop(stage).result()
+            yield stage, stages[stage]
+
+    for stage, future in pending.items():
+        stages[stage] = _await_stage(future, started, stage, fallbacks[stage])
+        yield stage, stages[stage]
+
+    yield {
+        "flights": stages["flights"],
+        "hotels": stages["hotels"],
+        "itinerary": plan["itinerary"],
+        "budget_analysis": plan["budget_analysis"],
+        "travel_tips": plan["travel_tips"],
+        "personalized_recommendations": plan["personalized_recommendations"]
+    }
+
+@app.route("/plan/stream", methods=["POST"])
+@login_required
+def stream_travel_plan():
+    """Plan a trip like home() but push each section to the browser as Server-Sent Events"""
+    user_id = session.get('user_id')
+    pipeline_args, _ = prepare_planning_request(user_id)
+    destination = pipeline_args['destination']
+
+    if ASYNC_PLANNING or request.form.get("background") == "on":
+        plan = enqueue_travel_plan(user_id, pipeline_args)
+        queued = sse_event("queued", {"plan_id": plan.id, "url": url_for('view_plan', plan_id=plan.id)})
+        return Response(queued, mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    def events():
+        yield sse_event("started", {"destination": destination})
+        # Shares one run with identical home() and stream requests; a joined run
+        # yields only its final result
+        runs = inflight_plans.stream(
+            planning_key(pipeline_args),
+            lambda: stream_planning_pipeline(**pipeline_args),
+            wait_timeout=PLAN_COALESCE_WAIT
+        )
+        sent = set()
+        result = None
+        for item in runs:
+            if isinstance(item, dict):
+                result = item
+                continue
+            event, data = item
+            sent.add((event, data["key"]) if event in PLAN_SECTIONS else event)
+            yield sse_event(event, data)
+
+        # Send what the stream did not: fallback-filled sections and joined results
+        for stage in ("flights", "hotels"):
+            if stage not in sent:
+                yield sse_event(stage, result[stage])
+        for section in PLAN_SECTIONS:
+            for name, value in result[section].items():
+                if (section, name) not in sent:
+                    yield sse_event(section, {"key": name, "value": value})
+
+        saved = save_travel_plan(user_id, pipeline_args, result)
+        related_destinations = destination_graph.related(destination)
+        if related_destinations:
+            yield sse_event("related", {"destination": destination, "places": related_destinations})
+        yield sse_event("done", {"plan_id": saved.id, "url": url_for('view_plan', plan_id=saved.id)})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/profile")
 @login_required
 def view_profile():
@@ -386,27 +1004,63 @@ def view_profile():
             details = {}
         print(f"[DEBUG] Plan ID: {plan.id}, Details: {details}")
         plans_with_details.append({'plan': plan, 'details': details})
-    return render_template("profile.html", profile_summary=profile_summary, plans_with_details=plans_with_details)
+    sync_destination_graph()
+    related_destinations = destination_graph.recommend_for(str(user_id))
+    return render_template("profile.html", profile_summary=profile_summary, plans_with_details=plans_with_details,
+                           related_destinations=related_destinations)
 
 def sync_profile_from_database(user_id):
     """Sync database profile data with in-memory profile system"""
-    # Get database profile
-    db_profile = TravelerProfile.query.filter_by(user_id=user_id).first()
-    if not db_profile:
+    # Cheap version check first; the row is only loaded when it changed
+    version = db.session.query(TravelerProfile.version).filter_by(user_id=user_id).scalar()
+    if version is None:
         return
+    with traveler_profiles.locked(str(user_id)):
+        if traveler_profiles.get_synced_version(str(user_id)) == version:
+            return
+        db_profile = TravelerProfile.query.filter_by(user_id=user_id).first()
+    
+        # Create profile in memory if it doesn't exist
+        if not traveler_profiles.has_profile(str(user_id)):
+            traveler_profiles.create_profile(str(user_id))
+        current = traveler_profiles.get_profile_summary(str(user_id)).get('profile_data', {})
     
-    # Create profile in memory if it doesn't exist
-    if str(user_id) not in traveler_profiles.profiles:
-        traveler_profiles.create_profile(str(user_id))
+        # Sync budget
+        if db_profile.budget and db_profile.budget != current.get('budget'):
+            traveler_profiles.update_budget_profile(str(user_id), db_profile.budget)
     
-    # Sync budget
-    if db_profile.budget:
-        traveler_profiles.update_budget_profile(str(user_id), db_profile.budget)
+        # Sync interests
+        if db_profile.interests:
+            interests = [interest.strip() for interest in db_profile.interests.split(',') if interest.strip()]
+            if interests != current.get('interests'):
+                traveler_profiles.update_interests_profile(str(user_id), interests)
     
-    # Sync interests
-    if db_profile.interests:
-        interests = [interest.strip() for interest in db_profile.interests.split(',') if interest.strip()]
-        traveler_profiles.update_interests_profile(str(user_id), interests)
+        traveler_profiles.set_synced_version(str(user_id), db_profile.version)
+
+def hydrate_profile_from_database(user_id):
+    """Reapply the TravelerProfile row to a profile rehydrated after eviction"""
+    if str(user_id).isdigit():
+        with app.app_context():
+            sync_profile_from_database(int(user_id))
+
+# The in-memory profile store is an LRU cache in front of a single SQLite file.
+# Changes are flushed write-behind; evicted profiles are brought back (and
+# re-synced with the database) on next access. Per-user JSON dumps from older
+# versions are imported once, then the most recent profiles are warm-started.
+# Every worker process opens the same file; profile versions in the shared
+# cache tell a worker to replay a profile another worker has changed.
+traveler_profiles.on_hydrate = hydrate_profile_from_database
+traveler_profiles.attach_store(ProfileStore(
+    os.getenv("PROFILE_STORE_PATH", os.path.join(app.instance_path, "profiles.db")),
+    flush_interval=float(os.getenv("PROFILE_FLUSH_INTERVAL", "2")),
+    shared=shared_cache
+))
+traveler_profiles.store.migrate_json_files(os.path.join(app.root_path, "traveler_profile_*.json"))
+# "Travelers like you" recommendations search every stored profile, cached or not
+traveler_profiles.attach_similarity(SimilarityIndex())
+# Previous trips in profiles count as co-visits alongside saved plans
+traveler_profiles.attach_destination_graph(destination_graph)
+traveler_profiles.warm_start()
 
 @app.route("/plan/<int:plan_id>")
 @login_required
@@ -418,6 +1072,15 @@ def view_plan(plan_id):
     itinerary = json.loads(plan.itinerary) if plan.itinerary else {}
     return render_template("plan_detail.html", plan=plan, itinerary=itinerary)
 
+@app.route("/plan/<int:plan_id>/status")
+@login_required
+def plan_status(plan_id):
+    plan = TravelPlan.query.get_or_404(plan_id)
+    if plan.user_id != session.get('user_id'):
+        return {"error": "Access denied."}, 403
+    return {"plan_id": plan.id, "status": plan.status or 'done',
+            "url": url_for('view_plan', plan_id=plan.id)}
+
 @app.route("/plan/<int:plan_id>/edit", methods=["GET", "POST"])
 @login_required
 def edit_plan(plan_id):
@@ -434,6 +1097,7 @@ def edit_plan(plan_id):
         plan.budget = request.form.get("budget")
         plan.preferences = request.form.get("preferences")
         db.session.commit()
+        destination_graph.update_plan(plan.id, str(plan.user_id), plan.destination, plan_interests(plan.preferences))
         flash("Travel plan updated successfully!", "success")
         return render_template("plan_detail.html", plan=plan, itinerary=json.loads(plan.itinerary) if plan.itinerary else {})
     return render_template("plan_edit.html", plan=plan)
@@ -447,6 +1111,7 @@ def delete_plan(plan_id):
         return redirect(url_for('home'))
     db.session.delete(plan)
     db.session.commit()
+    destination_graph.remove_plan(plan_id)
     flash("Travel plan deleted.", "info")
     return redirect(url_for('home'))
 
@@ -541,84 +1206,16 @@ def verify():
 
 # --- Email Utility ---
 def send_verification_email(to_email, code):
-    gmail_user = os.getenv('GMAIL_USER')
-    gmail_password = os.getenv('GMAIL_PASSWORD')
+    """Queue the welcome email with the verification code"""
     print(f"[DEBUG] Sending verification code: {code} to {to_email}")
-    if not gmail_user or not gmail_password:
-        print('Gmail credentials not set in .env')
-        return False
-    subject = 'Welcome to AI Travel Planner - Verify Your Email'
-    body = f"""
-    <div style='font-family: Arial, sans-serif; max-width: 500px; margin: auto; border: 1px solid #eee; border-radius: 8px; box-shadow: 0 2px 8px #f0f0f0; padding: 24px;'>
-        <h2 style='color: #2d7ff9;'>Welcome to AI Travel Planner!</h2>
-        <p>Dear Traveler,</p>
-        <p>Thank you for creating an account with us. Your registration was <b>successful</b>!</p>
-        <p style='margin-top: 24px; font-size: 16px;'>
-            <b>Your verification code:</b>
-            <span style='display: inline-block; background: #f5f5f5; color: #2d7ff9; font-size: 22px; letter-spacing: 2px; padding: 8px 18px; border-radius: 6px; margin-left: 10px;'>{code}</span>
-        </p>
-        <p style='margin-top: 24px;'>Please enter this code on the verification page to activate your account.</p>
-        <hr style='margin: 32px 0;'>
-        <p style='color: #888;'>If you did not sign up for AI Travel Planner, please ignore this email.</p>
-        <p style='color: #888;'>Safe travels!<br>AI Travel Planner Team</p>
-    </div>
-    """
-    msg = MIMEMultipart()
-    msg['From'] = gmail_user
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'html'))
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.sendmail(gmail_user, to_email, msg.as_string())
-        server.quit()
-        print(f"[DEBUG] Email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print('[ERROR] Failed to send email:', e)
-        return False
+    return email_dispatcher.enqueue(to_email, 'Welcome to AI Travel Planner - Verify Your Email',
+                                    render_template('email/verification.html', code=code))
 
 def send_reset_email(to_email, code):
-    gmail_user = os.getenv('GMAIL_USER')
-    gmail_password = os.getenv('GMAIL_PASSWORD')
+    """Queue the password reset email"""
     print(f"[DEBUG] Sending reset code: {code} to {to_email}")
-    if not gmail_user or not gmail_password:
-        print('[ERROR] Gmail credentials not set in .env')
-        return False
-    subject = 'Password Reset - AI Travel Planner'
-    body = f"""
-    <div style='font-family: Arial, sans-serif; max-width: 500px; margin: auto; border: 1px solid #eee; border-radius: 8px; box-shadow: 0 2px 8px #f0f0f0; padding: 24px;'>
-        <h2 style='color: #a855f7;'>Password Reset Request</h2>
-        <p>Dear Traveler,</p>
-        <p>We received a request to reset your password for your AI Travel Planner account.</p>
-        <p style='margin-top: 24px; font-size: 16px;'>
-            <b>Your password reset code:</b>
-            <span style='display: inline-block; background: #f5f5f5; color: #a855f7; font-size: 22px; letter-spacing: 2px; padding: 8px 18px; border-radius: 6px; margin-left: 10px;'>{code}</span>
-        </p>
-        <p style='margin-top: 24px;'>Please enter this code on the password reset page. This code will expire in <b>15 minutes</b>.</p>
-        <hr style='margin: 32px 0;'>
-        <p style='color: #888;'>If you did not request a password reset, you can safely ignore this email.</p>
-        <p style='color: #888;'>Safe travels!<br>AI Travel Planner Team</p>
-    </div>
-    """
-    msg = MIMEMultipart()
-    msg['From'] = gmail_user
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'html'))
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.sendmail(gmail_user, to_email, msg.as_string())
-        server.quit()
-        print(f"[DEBUG] Reset email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print('[ERROR] Failed to send reset email:', e)
-        return False
+    return email_dispatcher.enqueue(to_email, 'Password Reset - AI Travel Planner',
+                                    render_template('email/reset.html', code=code))
 
 @app.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
@@ -681,7 +1278,7 @@ def reset_password():
 def download_profile_csv():
     user_id = session.get('user_id')
     sync_profile_from_database(user_id)
-    profile_data = traveler_profiles.profiles.get(str(user_id))
+    profile_data = traveler_profiles.get_profile(str(user_id))
     if not profile_data:
         return "No profile data found", 404
 
@@ -734,23 +1331,61 @@ def download_profile_csv():
         mimetype='text/csv'
     )
 
+@app.route('/cache/stats')
+@login_required
+def cache_stats():
+    return {
+        "dest_id": dest_id_cache.stats(),
+        "hotels": hotel_cache.stats(),
+        "flights": flight_cache.stats(),
+        "plans": plan_cache.stats(),
+        "coalescing": inflight_plans.stats(),
+        "plan_jobs": plan_workers.stats(),
+        "email": email_dispatcher.stats(),
+        "profiles": traveler_profiles.cache_stats(),
+        "similarity": traveler_profiles.similarity.stats(),
+        "prompts": prompt_engine.prompt_stats.stats(),
+        "destinations": destination_graph.stats(),
+        "shared": shared_cache.stats() if shared_cache is not None else None
+    }
+
 @app.route('/clear_profile', methods=['POST'])
 @login_required
 def clear_profile():
     user_id = session.get('user_id')
-    # Delete from database
-    db_profile = TravelerProfile.query.filter_by(user_id=user_id).first()
-    if db_profile:
-        db.session.delete(db_profile)
-        db.session.commit()
-    # Delete from in-memory
-    if str(user_id) in traveler_profiles.profiles:
-        del traveler_profiles.profiles[str(user_id)]
+    # Hold the profile lock across both deletes so a concurrent update cannot
+    # rehydrate the in-memory profile from the row in between
+    with traveler_profiles.locked(str(user_id)):
+        # Delete from database
+        db_profile = TravelerProfile.query.filter_by(user_id=user_id).first()
+        if db_profile:
+            db.session.delete(db_profile)
+            db.session.commit()
+        # Delete from in-memory
+        traveler_profiles.delete_profile(str(user_id))
     return {"status": "success"}
 
+# Columns added after the first release; create_all() does not alter existing tables
+ADDED_COLUMNS = {
+    'travel_plan': {'status': "VARCHAR(20) DEFAULT 'done'"},
+    'traveler_profile': {'version': "INTEGER NOT NULL DEFAULT 0"}
+}
+
+def upgrade_schema():
+    """Add any missing ADDED_COLUMNS to existing SQLite tables"""
+    with db.engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            for column, ddl in columns.items():
+                if column not in existing:
+                    conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+                    print(f"[DEBUG] Added column {table}.{column}")
+
 # --- Create DB Tables if not exist ---
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    sync_destination_graph()
 
 if __name__ == "__main__":
     app.run(debug=True, host='0.0.0.0', port=3000)
\ No newline at end of file
@@ -1,73 +1,540 @@
 import networkx as nx
+import copy
+import functools
 import json
+import os
+import re
+import threading
+import time
 import uuid
+import zlib
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
+
+# Repeatable node types keep only their most recent nodes; older ones are folded
+# into a '<type>_rollup' node. Maps each type to the fields counted in the rollup.
+ROLLUP_FIELDS = {
+    'travel_preferences': {
+        'destination': 'destinations',
+        'days': 'trip_lengths',
+        'departure_city': 'departure_cities'
+    }
+}
+
+DEFAULT_RETENTION = {
+    'travel_preferences': int(os.getenv("PROFILE_PREFERENCES_HISTORY", "20"))
+}
+
+# Profiles kept in memory; the least recently used beyond this are evicted
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+
+# Lock stripes; users in different shards never wait on each other
+PROFILE_LOCK_SHARDS = int(os.getenv("PROFILE_LOCK_SHARDS", "16"))
+
+class ProfileShard:
+    """One stripe of the profile cache: an LRU of profiles and the lock guarding them"""
+    __slots__ = ('lock', 'profiles')
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.profiles = OrderedDict()
+
+class ShardedProfiles:
+    """Mapping of user_id -> profile spread over shards by a stable hash of the user id"""
+    
+    def __init__(self, shards: int):
+        self.shards = [ProfileShard() for _ in range(max(1, shards))]
+    
+    def shard(self, user_id: str) -> ProfileShard:
+        return self.shards[zlib.crc32(str(user_id).encode()) % len(self.shards)]
+    
+    def __getitem__(self, user_id: str):
+        return self.shard(user_id).profiles[user_id]
+    
+    def __setitem__(self, user_id: str, profile):
+        self.shard(user_id).profiles[user_id] = profile
+    
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self.shard(user_id).profiles
+    
+    def __len__(self) -> int:
+        return sum(len(shard.profiles) for shard in self.shards)
+    
+    def __iter__(self):
+        for shard in self.shards:
+            yield from list(shard.profiles)
+    
+    def get(self, user_id: str, default=None):
+        return self.shard(user_id).profiles.get(user_id, default)
+    
+    def pop(self, user_id: str, default=None):
+        return self.shard(user_id).profiles.pop(user_id, default)
+    
+    def move_to_end(self, user_id: str):
+        self.shard(user_id).profiles.move_to_end(user_id)
+
+def profile_features(nodes) -> Dict[str, Any]:
+    """Interests, budget amount and destinations of a profile, from (node_type, data) pairs"""
+    interests, budget, destinations = [], None, []
+    for node_type, data in nodes:
+        if node_type == 'interests':
+            interests = data.get('interests', [])
+        elif node_type == 'budget':
+            amount = re.sub(r'[^\d.]', '', str(data.get('budget_range') or ''))
+            try:
+                budget = float(amount)
+            except ValueError:
+                budget = None
+        elif node_type == 'previous_trip':
+            destinations.append(data.get('destination'))
+        elif node_type == 'travel_preferences':
+            destinations.append(data.get('preferences', {}).get('destination'))
+        elif node_type == 'travel_preferences_rollup':
+            destinations.extend(data.get('destinations', {}))
+    return {'interests': interests, 'budget': budget, 'destinations': [d for d in destinations if d]}
+
+def previous_trips(nodes) -> List[str]:
+    """Destinations of a profile's previous_trip nodes, from (node_type, data) pairs"""
+    return [data.get('destination') for node_type, data in nodes if node_type == 'previous_trip']
+
+def _locked(method):
+    """Run a TravelerProfile method under the lock of the shard owning its user_id"""
+    @functools.wraps(method)
+    def wrapper(self, user_id, *args, **kwargs):
+        # Profiles are keyed by string ids; an int session id must not create a second copy
+        user_id = str(user_id)
+        with self.profiles.shard(user_id).lock:
+            return method(self, user_id, *args, **kwargs)
+    return wrapper
 
 class TravelerProfile:
     """
     Graph-based traveler profile system using NetworkX
     Nodes represent different aspects of a traveler's profile
     Edges represent relationships between different profile aspects
+    
+    Profiles are striped over shards by user id. Every public operation holds
+    its user's shard lock, so concurrent requests for one user are serialized
+    while unrelated users rarely contend; each shard keeps its own LRU.
     """
     
-    def __init__(self):
+    def __init__(self, retention: Optional[Dict[str, int]] = None, max_profiles: Optional[int] = None,
+                 store: Optional[Any] = None, shards: Optional[int] = None):
         self.graph = nx.Graph()
-        self.profiles = {}  # Store multiple profiles by user_id
-        
-    def create_profile(self, user_id: str = None) -> str:
-        """Create a new traveler profile"""
-        if user_id is None:
-            user_id = str(uuid.uuid4())
-        
-        # Initialize profile with basic nodes
-        profile_data = {
+        self.retention = dict(DEFAULT_RETENTION if retention is None else retention)
+        # Store multiple profiles by user_id, least recently used first within each shard
+        self.profiles = ShardedProfiles(PROFILE_LOCK_SHARDS if shards is None else shards)
+        # Secondary index: user_id -> node_type -> node ids in insertion order
+        self.type_index: Dict[str, Dict[str, Dict[str, None]]] = {}
+        
+        # Every mutation is logged to the store (a ProfileStore) and evicted
+        # profiles are replayed from it on next access; on_hydrate lets the
+        # application reapply its own records afterwards
+        self.max_profiles = PROFILE_CACHE_SIZE if max_profiles is None else max_profiles
+        self.shard_capacity = max(1, -(-self.max_profiles // len(self.profiles.shards)))
+        self.store = None
+        self.on_hydrate: Optional[Callable[[str], None]] = None
+        # Optional cross-user SimilarityIndex, kept current as profiles change
+        self.similarity = None
+        # Optional DestinationGraph fed with every profile's previous trips
+        self.destination_graph = None
+        # Counters are bumped under different shard locks, so they are approximate
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hydrations = 0
+        
+        # Memoized summaries and recommendations, dropped by _changed()
+        self.derived: Dict[str, Dict[Any, Any]] = {}
+        self.derived_hits = 0
+        self.derived_misses = 0
+        if store is not None:
+            self.attach_store(store)
+    
+    # --- In-memory cache ---
+    
+    def locked(self, user_id: str) -> threading.RLock:
+        """The reentrant lock of a user's shard, for grouping several operations atomically"""
+        return self.profiles.shard(str(user_id)).lock
+    
+    @_locked
+    def has_profile(self, user_id: str) -> bool:
+        """Whether the profile exists, rehydrating an evicted one if needed"""
+        if user_id in self.profiles:
+            if self.store is None or not self.store.is_stale(user_id):
+                self.profiles.move_to_end(user_id)
+                self.hits += 1
+                return True
+            # Another worker process changed it; replay the stored version instead
+            self._forget(user_id)
+        self.misses += 1
+        return self._hydrate(user_id)
+    
+    @_locked
+    def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The profile as a plain dict with 'nodes' and 'edges' (the save_profile format)"""
+        if not self.has_profile(user_id):
+            return None
+        return copy.deepcopy(self._export(user_id))
+    
+    def attach_store(self, store):
+        """Log mutations to a ProfileStore and start its background flusher"""
+        self.store = store
+        store.start()
+    
+    def attach_similarity(self, index):
+        """Keep a SimilarityIndex up to date with every profile change"""
+        self.similarity = index
+        for user_id in list(self.profiles):
+            with self.locked(user_id):
+                if user_id in self.profiles:
+                    self._index(user_id)
+    
+    def attach_destination_graph(self, graph):
+        """Keep a DestinationGraph's previous-trip destinations in step with every profile"""
+        self.destination_graph = graph
+        for user_id in list(self.profiles):
+            with self.locked(user_id):
+                if user_id in self.profiles:
+                    self._index(user_id)
+    
+    def warm_start(self) -> int:
+        """Bulk-load the most recently updated stored profiles, up to max_profiles"""
+        if self.store is None:
+            return 0
+        # The similarity index and destination graph cover every stored profile, not just the cached ones
+        indexed = self.similarity is not None or self.destination_graph is not None
+        stored = list(self.store.load_all(limit=None if indexed else self.max_profiles))
+        recent = stored[-self.max_profiles:] if self.max_profiles else []
+        if indexed:
+            for profile_data in stored[:len(stored) - len(recent)]:
+                nodes = [(node['type'], node['data']) for node in profile_data['nodes'].values()]
+                self._index_nodes(str(profile_data['user_id']), nodes)
+        for profile_data in recent:
+            with self.locked(profile_data['user_id']):
+                self._adopt(profile_data)
+        return len(recent)
+    
+    def _adopt(self, profile_data: Dict[str, Any], replace: bool = False):
+        """Install a dict-shaped profile, index it and apply the retention policy"""
+        user_id = profile_data['user_id'] = str(profile_data['user_id'])
+        self.derived.pop(user_id, None)
+        renumbered = self._import_profile(profile_data)
+        if replace or renumbered:
+            # The log must refer to nodes by the ids they have in memory
+            self._record(user_id, 'replace', {'profile': self._export(user_id)})
+        self._reindex(user_id)
+        for node_type in self.retention:
+            self.compact(user_id, node_type)
+        self._index(user_id)
+        self._evict_overflow(user_id)
+    
+    def _hydrate(self, user_id: str) -> bool:
+        if self.store is None:
+            return False
+        try:
+            profile_data = self.store.load(user_id)
+            if profile_data is None:
+                return False
+            self._adopt(profile_data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] Could not rehydrate profile {user_id}: {e}")
+            return False
+        self.hydrations += 1
+        if self.on_hydrate is not None:
+            self.on_hydrate(user_id)
+        return True
+    
+    def _evict_overflow(self, user_id: str):
+        """Evict the least recently used profiles of this user's shard (its lock is held)"""
+        shard = self.profiles.shard(user_id)
+        while len(shard.profiles) > self.shard_capacity:
+            self._forget(next(iter(shard.profiles)))
+            self.evictions += 1
+    
+    def _forget(self, user_id: str):
+        """Drop the in-memory copy of a profile; the store keeps it"""
+        self.type_index.pop(user_id, None)
+        self.derived.pop(user_id, None)
+        self._drop_profile(user_id)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for sizing the profile cache"""
+        lookups = self.hits + self.misses
+        derived = self.derived_hits + self.derived_misses
+        return {
+            'size': len(self.profiles),
+            'max_profiles': self.max_profiles,
+            'shards': len(self.profiles.shards),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hydrations': self.hydrations,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'derived_hits': self.derived_hits,
+            'derived_misses': self.derived_misses,
+            'derived_hit_rate': round(self.derived_hits / derived, 3) if derived else 0.0,
+            'store': self.store.stats() if self.store is not None else None
+        }
+    
+    def _changed(self, user_id: str, op: str, args: Dict[str, Any]):
+        """Record a mutation: bump last_updated, drop the memoized views and log it"""
+        self._touch(user_id)
+        self.derived.pop(user_id, None)
+        self._record(user_id, op, args)
+        self._index(user_id)
+    
+    def _index(self, user_id: str):
+        if self.similarity is not None or self.destination_graph is not None:
+            self._index_nodes(user_id, [(node_type, self._node_data(user_id, node_id))
+                                        for node_id, node_type in self._node_types(user_id)])
+    
+    def _index_nodes(self, user_id: str, nodes):
+        features = profile_features(nodes)
+        if self.similarity is not None:
+            self.similarity.update(user_id, **features)
+        if self.destination_graph is not None:
+            self.destination_graph.set_trips(user_id, previous_trips(nodes), features['interests'])
+    
+    def _record(self, user_id: str, op: str, args: Dict[str, Any]):
+        if self.store is not None:
+            self.store.append(user_id, op, dict(args, at=self._profile_info(user_id)[1]))
+    
+    def _memoized(self, user_id: str, key: Any, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        views = self.derived.setdefault(user_id, {})
+        if key in views:
+            self.derived_hits += 1
+        else:
+            self.derived_misses += 1
+            if len(views) >= 16:
+                views.clear()
+            views[key] = build()
+        # Callers get their own copy so they cannot corrupt the memoized one
+        return copy.deepcopy(views[key])
+    
+    @_locked
+    def get_synced_version(self, user_id: str) -> Optional[int]:
+        """Version of the database row this profile was last synced with"""
+        if not self.has_profile(user_id):
+            return None
+        return self._get_synced_version(user_id)
+    
+    @_locked
+    def set_synced_version(self, user_id: str, version: int):
+        if self.has_profile(user_id):
+            self._set_synced_version(user_id, version)
+            self._record(user_id, 'synced', {'version': version})
+    
+    # --- Storage primitives ---
+    # Everything below create_profile goes through these, so a backend with a
+    # different in-memory layout only has to override this block.
+    
+    def _export(self, user_id: str) -> Dict[str, Any]:
+        return self.profiles[user_id]
+    
+    def _get_synced_version(self, user_id: str) -> Optional[int]:
+        return self.profiles[user_id].get('synced_version')
+    
+    def _set_synced_version(self, user_id: str, version: int):
+        self.profiles[user_id]['synced_version'] = version
+    
+    def _new_profile(self, user_id: str):
+        now = datetime.now().isoformat()
+        self.profiles[user_id] = {
             'user_id': user_id,
-            'created_at': datetime.now().isoformat(),
-            'last_updated': datetime.now().isoformat(),
+            'created_at': now,
+            'last_updated': now,
             'nodes': {},
             'edges': []
         }
-        
-        self.profiles[user_id] = profile_data
-        return user_id
     
-    def add_node(self, user_id: str, node_type: str, node_data: Dict[str, Any]) -> str:
-        """Add a node to the traveler profile"""
-        if user_id not in self.profiles:
-            self.create_profile(user_id)
-        
+    def _import_profile(self, profile_data: Dict[str, Any]) -> bool:
+        """Install a dict-shaped profile; returns True if node ids had to be renumbered"""
+        self.profiles[profile_data['user_id']] = profile_data
+        return False
+    
+    def _insert_node(self, user_id: str, node_type: str, node_data: Dict[str, Any]) -> str:
         node_id = f"{user_id}_{node_type}_{uuid.uuid4().hex[:8]}"
-        
-        node_info = {
+        self.profiles[user_id]['nodes'][node_id] = {
             'id': node_id,
             'type': node_type,
             'data': node_data,
             'created_at': datetime.now().isoformat()
         }
-        
-        self.profiles[user_id]['nodes'][node_id] = node_info
+        return node_id
+    
+    def _pop_node(self, user_id: str, node_id: Any) -> Optional[str]:
+        """Delete a node and its edges; returns the node type, or None if absent"""
+        profile = self.profiles[user_id]
+        node_info = profile['nodes'].pop(node_id, None)
+        if node_info is None:
+            return None
+        profile['edges'] = [
+            edge for edge in profile['edges']
+            if edge['source'] != node_id and edge['target'] != node_id
+        ]
+        return node_info['type']
+    
+    def _node_data(self, user_id: str, node_id: Any) -> Dict[str, Any]:
+        return self.profiles[user_id]['nodes'][node_id]['data']
+    
+    def _node_created_at(self, user_id: str, node_id: Any) -> str:
+        return self.profiles[user_id]['nodes'][node_id]['created_at']
+    
+    def _node_types(self, user_id: str):
+        """(node_id, node_type) pairs in insertion order"""
+        return [(node_id, node_info['type']) for node_id, node_info in self.profiles[user_id]['nodes'].items()]
+    
+    def _insert_edge(self, user_id: str, source_node: Any, target_node: Any, relationship: str) -> str:
+        """Append an edge; returns its created_at"""
+        created_at = datetime.now().isoformat()
+        self.profiles[user_id]['edges'].append({
+            'source': source_node,
+            'target': target_node,
+            'relationship': relationship,
+            'created_at': created_at
+        })
+        return created_at
+    
+    def _touch(self, user_id: str):
         self.profiles[user_id]['last_updated'] = datetime.now().isoformat()
+    
+    def _drop_profile(self, user_id: str) -> bool:
+        return self.profiles.pop(user_id, None) is not None
+    
+    def _profile_info(self, user_id: str):
+        """(created_at, last_updated, node_count, edge_count)"""
+        profile = self.profiles[user_id]
+        return profile['created_at'], profile['last_updated'], len(profile['nodes']), len(profile['edges'])
+    
+    # --- Profile operations ---
+    
+    def create_profile(self, user_id: str = None) -> str:
+        """Create a new traveler profile"""
+        user_id = str(uuid.uuid4()) if user_id is None else str(user_id)
+        
+        with self.locked(user_id):
+            self._new_profile(user_id)
+            self.type_index[user_id] = {}
+            self.derived.pop(user_id, None)
+            self._record(user_id, 'create', {})
+            self._evict_overflow(user_id)
+        return user_id
+    
+    @_locked
+    def add_node(self, user_id: str, node_type: str, node_data: Dict[str, Any]) -> str:
+        """Add a node to the traveler profile"""
+        if not self.has_profile(user_id):
+            self.create_profile(user_id)
+        
+        node_id = self._insert_node(user_id, node_type, node_data)
+        self.type_index.setdefault(user_id, {}).setdefault(node_type, {})[node_id] = None
+        self._changed(user_id, 'add_node', {'id': node_id, 'type': node_type, 'data': node_data,
+                                            'created_at': self._node_created_at(user_id, node_id)})
         
+        if node_type in self.retention:
+            self.compact(user_id, node_type)
         return node_id
     
+    @_locked
+    def compact(self, user_id: str, node_type: str) -> int:
+        """Fold the oldest nodes of a type beyond its retention limit into the rollup node"""
+        limit = self.retention.get(node_type)
+        node_ids = self.type_index.get(user_id, {}).get(node_type)
+        if limit is None or not node_ids or len(node_ids) <= limit:
+            return 0
+        
+        rollup_type = f"{node_type}_rollup"
+        rollup_id = self.get_node_by_type(user_id, rollup_type)
+        if rollup_id is None:
+            rollup_id = self.add_node(user_id, rollup_type, {
+                'count': 0,
+                'first_seen': None,
+                'last_seen': None,
+                **{name: {} for name in ROLLUP_FIELDS.get(node_type, {}).values()}
+            })
+        rollup = self._node_data(user_id, rollup_id)
+        
+        # Index order is insertion order, so the first ids are the oldest
+        expired = list(node_ids)[:len(node_ids) - limit]
+        for node_id in expired:
+            data = self._node_data(user_id, node_id)
+            created_at = self._node_created_at(user_id, node_id)
+            values = data.get('preferences', data)
+            for field, name in ROLLUP_FIELDS.get(node_type, {}).items():
+                value = values.get(field)
+                if value not in (None, ""):
+                    key = str(value).strip()
+                    rollup[name][key] = rollup[name].get(key, 0) + 1
+            rollup['count'] += 1
+            rollup['first_seen'] = rollup['first_seen'] or created_at
+            rollup['last_seen'] = created_at
+            self.remove_node(user_id, node_id)
+        self._changed(user_id, 'update_node', {'id': rollup_id, 'data': rollup})
+        return len(expired)
+    
+    def compact_all(self) -> int:
+        """Apply the retention policy to every loaded profile"""
+        return sum(self.compact(user_id, node_type)
+                   for user_id in list(self.profiles) for node_type in self.retention)
+    
+    @_locked
+    def remove_node(self, user_id: str, node_id: str) -> bool:
+        """Remove a node and the edges touching it"""
+        node_type = self._pop_node(user_id, node_id) if self.has_profile(user_id) else None
+        if node_type is None:
+            return False
+        
+        ids = self.type_index.get(user_id, {}).get(node_type)
+        if ids is not None:
+            ids.pop(node_id, None)
+            if not ids:
+                del self.type_index[user_id][node_type]
+        self._changed(user_id, 'remove_node', {'id': node_id})
+        return True
+    
+    @_locked
+    def delete_profile(self, user_id: str) -> bool:
+        """Drop a profile and its index entries"""
+        self.type_index.pop(user_id, None)
+        self.derived.pop(user_id, None)
+        if self.similarity is not None:
+            self.similarity.remove(user_id)
+        if self.destination_graph is not None:
+            self.destination_graph.set_trips(user_id, [])
+        stored = self.store is not None and self.store.delete(user_id)
+        return self._drop_profile(user_id) or stored
+    
+    def _reindex(self, user_id: str):
+        """Rebuild the type index of one profile from its nodes"""
+        index = {}
+        for node_id, node_type in self._node_types(user_id):
+            index.setdefault(node_type, {})[node_id] = None
+        self.type_index[user_id] = index
+    
+    def _upsert_singleton(self, user_id: str, node_type: str, data: Dict[str, Any]) -> str:
+        """Update the single node of a type in place, or create it"""
+        existing = self.get_node_by_type(user_id, node_type)
+        if existing is not None:
+            self._node_data(user_id, existing).update(data)
+            self._changed(user_id, 'update_node', {'id': existing, 'data': data})
+            return existing
+        return self.add_node(user_id, node_type, data)
+    
+    @_locked
     def add_edge(self, user_id: str, source_node: str, target_node: str, relationship: str = "related"):
         """Add an edge between two nodes"""
-        if user_id not in self.profiles:
+        if not self.has_profile(user_id):
             return False
         
-        edge_info = {
-            'source': source_node,
-            'target': target_node,
-            'relationship': relationship,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        self.profiles[user_id]['edges'].append(edge_info)
-        self.profiles[user_id]['last_updated'] = datetime.now().isoformat()
+        created_at = self._insert_edge(user_id, source_node, target_node, relationship)
+        self._changed(user_id, 'add_edge', {'source': source_node, 'target': target_node,
+                                            'relationship': relationship, 'created_at': created_at})
         
         return True
     
+    @_locked
     def update_budget_profile(self, user_id: str, budget_range: str, preferred_currency: str = "USD") -> str:
         """Add or update budget profile node"""
         budget_data = {
@@ -76,19 +543,9 @@ class TravelerProfile:
             'last_updated': datetime.now().isoformat()
         }
         
-        # Find existing budget node or create new one
-        existing_budget = None
-        for node_id, node_info in self.profiles.get(user_id, {}).get('nodes', {}).items():
-            if node_info['type'] == 'budget':
-                existing_budget = node_id
-                break
-        
-        if existing_budget:
-            self.profiles[user_id]['nodes'][existing_budget]['data'].update(budget_data)
-            return existing_budget
-        else:
-            return self.add_node(user_id, 'budget', budget_data)
+        return self._upsert_singleton(user_id, 'budget', budget_data)
     
+    @_locked
     def update_interests_profile(self, user_id: str, interests: List[str]) -> str:
         """Add or update interests profile node"""
         interests_data = {
@@ -97,19 +554,9 @@ class TravelerProfile:
             'last_updated': datetime.now().isoformat()
         }
         
-        # Find existing interests node or create new one
-        existing_interests = None
-        for node_id, node_info in self.profiles.get(user_id, {}).get('nodes', {}).items():
-            if node_info['type'] == 'interests':
-                existing_interests = node_id
-                break
-        
-        if existing_interests:
-            self.profiles[user_id]['nodes'][existing_interests]['data'].update(interests_data)
-            return existing_interests
-        else:
-            return self.add_node(user_id, 'interests', interests_data)
+        return self._upsert_singleton(user_id, 'interests', interests_data)
     
+    @_locked
     def add_previous_trip(self, user_id: str, destination: str, trip_data: Dict[str, Any]) -> str:
         """Add a previous trip to the profile"""
         trip_data.update({
@@ -121,11 +568,12 @@ class TravelerProfile:
         
         # Connect to interests if they exist
         interests_node = self.get_node_by_type(user_id, 'interests')
-        if interests_node:
+        if interests_node is not None:
             self.add_edge(user_id, trip_node_id, interests_node, "influenced_by")
         
         return trip_node_id
     
+    @_locked
     def update_visa_profile(self, user_id: str, nationality: str, visa_requirements: Dict[str, Any]) -> str:
         """Add or update visa profile node"""
         visa_data = {
@@ -134,19 +582,9 @@ class TravelerProfile:
             'last_updated': datetime.now().isoformat()
         }
         
-        # Find existing visa node or create new one
-        existing_visa = None
-        for node_id, node_info in self.profiles.get(user_id, {}).get('nodes', {}).items():
-            if node_info['type'] == 'visa':
-                existing_visa = node_id
-                break
-        
-        if existing_visa:
-            self.profiles[user_id]['nodes'][existing_visa]['data'].update(visa_data)
-            return existing_visa
-        else:
-            return self.add_node(user_id, 'visa', visa_data)
+        return self._upsert_singleton(user_id, 'visa', visa_data)
     
+    @_locked
     def add_travel_preferences(self, user_id: str, preferences: Dict[str, Any]) -> str:
         """Add travel preferences node"""
         preferences_data = {
@@ -156,52 +594,73 @@ class TravelerProfile:
         
         return self.add_node(user_id, 'travel_preferences', preferences_data)
     
+    @_locked
     def get_node_by_type(self, user_id: str, node_type: str) -> Optional[str]:
         """Get the first node of a specific type"""
-        for node_id, node_info in self.profiles.get(user_id, {}).get('nodes', {}).items():
-            if node_info['type'] == node_type:
-                return node_id
-        return None
+        if not self.has_profile(user_id):
+            return None
+        return next(iter(self.type_index.get(user_id, {}).get(node_type, ())), None)
+    
+    @_locked
+    def get_nodes_by_type(self, user_id: str, node_type: str) -> List[str]:
+        """Get all nodes of a specific type, oldest first"""
+        if not self.has_profile(user_id):
+            return []
+        return list(self.type_index.get(user_id, {}).get(node_type, ()))
     
+    @_locked
     def get_profile_summary(self, user_id: str) -> Dict[str, Any]:
         """Get a summary of the traveler profile"""
-        if user_id not in self.profiles:
+        if not self.has_profile(user_id):
             return {}
-        
-        profile = self.profiles[user_id]
+        return self._memoized(user_id, 'summary', lambda: self._build_summary(user_id))
+    
+    def _build_summary(self, user_id: str) -> Dict[str, Any]:
+        created_at, last_updated, node_count, edge_count = self._profile_info(user_id)
         summary = {
             'user_id': user_id,
-            'created_at': profile['created_at'],
-            'last_updated': profile['last_updated'],
-            'node_count': len(profile['nodes']),
-            'edge_count': len(profile['edges']),
+            'created_at': created_at,
+            'last_updated': last_updated,
+            'node_count': node_count,
+            'edge_count': edge_count,
             'node_types': {},
             'profile_data': {}
         }
         
         # Count node types and collect data
-        for node_id, node_info in profile['nodes'].items():
-            node_type = node_info['type']
-            if node_type not in summary['node_types']:
-                summary['node_types'][node_type] = 0
-            summary['node_types'][node_type] += 1
-            
-            # Collect key data for summary
-            if node_type == 'budget':
-                summary['profile_data']['budget'] = node_info['data'].get('budget_range')
-            elif node_type == 'interests':
-                summary['profile_data']['interests'] = node_info['data'].get('interests', [])
-            elif node_type == 'visa':
-                summary['profile_data']['nationality'] = node_info['data'].get('nationality')
+        for node_type, node_ids in self.type_index.get(user_id, {}).items():
+            summary['node_types'][node_type] = len(node_ids)
+        
+        # Collect key data for summary
+        budget_node = self.get_node_by_type(user_id, 'budget')
+        if budget_node is not None:
+            summary['profile_data']['budget'] = self._node_data(user_id, budget_node).get('budget_range')
+        interests_node = self.get_node_by_type(user_id, 'interests')
+        if interests_node is not None:
+            summary['profile_data']['interests'] = self._node_data(user_id, interests_node).get('interests', [])
+        visa_node = self.get_node_by_type(user_id, 'visa')
+        if visa_node is not None:
+            summary['profile_data']['nationality'] = self._node_data(user_id, visa_node).get('nationality')
         
         return summary
     
+    @_locked
     def get_recommendations(self, user_id: str, destination: str) -> Dict[str, Any]:
         """Generate personalized recommendations based on profile"""
-        if user_id not in self.profiles:
+        if not self.has_profile(user_id):
             return {}
-        
-        profile = self.profiles[user_id]
+        recommendations = self._memoized(user_id, ('recommendations', destination),
+                                         lambda: self._build_recommendations(user_id, destination))
+        # Other travelers change independently, so this part is never memoized
+        if self.similarity is not None:
+            destinations = self.similarity.recommend_destinations(user_id, exclude=[destination])
+            if destinations:
+                recommendations['similar_travelers'] = [
+                    f"Travelers like you also went to: {', '.join(destinations)}"
+                ]
+        return recommendations
+    
+    def _build_recommendations(self, user_id: str, destination: str) -> Dict[str, Any]:
         recommendations = {
             'budget_considerations': [],
             'interest_based_suggestions': [],
@@ -211,16 +670,16 @@ class TravelerProfile:
         
         # Analyze budget profile
         budget_node = self.get_node_by_type(user_id, 'budget')
-        if budget_node:
-            budget_data = profile['nodes'][budget_node]['data']
+        if budget_node is not None:
+            budget_data = self._node_data(user_id, budget_node)
             recommendations['budget_considerations'].append(
                 f"Based on your budget range: {budget_data.get('budget_range')}"
             )
         
         # Analyze interests
         interests_node = self.get_node_by_type(user_id, 'interests')
-        if interests_node:
-            interests = profile['nodes'][interests_node]['data'].get('interests', [])
+        if interests_node is not None:
+            interests = self._node_data(user_id, interests_node).get('interests', [])
             recommendations['interest_based_suggestions'] = [
                 f"Focus on {interest.lower()} activities in {destination}" 
                 for interest in interests[:3]  # Top 3 interests
@@ -228,35 +687,35 @@ class TravelerProfile:
         
         # Analyze visa requirements
         visa_node = self.get_node_by_type(user_id, 'visa')
-        if visa_node:
-            visa_data = profile['nodes'][visa_node]['data']
+        if visa_node is not None:
+            visa_data = self._node_data(user_id, visa_node)
             recommendations['visa_requirements'].append(
                 f"Check visa requirements for {visa_data.get('nationality')} citizens visiting {destination}"
             )
         
         # Analyze previous trips
         previous_trips = [
-            node_info for node_info in profile['nodes'].values() 
-            if node_info['type'] == 'previous_trip'
+            self._node_data(user_id, node_id) for node_id in self.get_nodes_by_type(user_id, 'previous_trip')
         ]
         if previous_trips:
-            destinations = [trip['data'].get('destination', 'Unknown') for trip in previous_trips]
+            destinations = [trip.get('destination', 'Unknown') for trip in previous_trips]
             recommendations['previous_trip_insights'] = [
                 f"Based on your previous trips to: {', '.join(destinations)}"
             ]
         
         return recommendations
     
+    @_locked
     def save_profile(self, user_id: str, filename: str = None) -> str:
         """Save profile to JSON file"""
-        if user_id not in self.profiles:
+        if not self.has_profile(user_id):
             return ""
         
         if filename is None:
             filename = f"traveler_profile_{user_id}.json"
         
         with open(filename, 'w') as f:
-            json.dump(self.profiles[user_id], f, indent=2)
+            json.dump(self.get_profile(user_id), f, indent=2)
         
         return filename
     
@@ -268,12 +727,193 @@ class TravelerProfile:
             
             user_id = profile_data.get('user_id')
             if user_id:
-                self.profiles[user_id] = profile_data
+                with self.locked(user_id):
+                    self._adopt(profile_data, replace=True)
                 return True
         except Exception as e:
             print(f"Error loading profile: {e}")
         
         return False
 
+class NodeTypes:
+    """Registry that interns type and relationship names as small integer codes"""
+    
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()  # Shared by every shard
+    
+    def code(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self.codes.get(name)
+                if code is None:
+                    self.names.append(name)
+                    code = self.codes[name] = len(self.names) - 1
+        return code
+    
+    def name(self, code: int) -> str:
+        return self.names[code]
+
+class _Node:
+    __slots__ = ('type_code', 'data', 'created_at')
+    
+    def __init__(self, type_code: int, data: Dict[str, Any], created_at: float):
+        self.type_code = type_code
+        self.data = data
+        self.created_at = created_at
+
+class _Edge:
+    __slots__ = ('source', 'target', 'relationship_code', 'created_at')
+    
+    def __init__(self, source: int, target: int, relationship_code: int, created_at: float):
+        self.source = source
+        self.target = target
+        self.relationship_code = relationship_code
+        self.created_at = created_at
+
+class _CompactProfile:
+    __slots__ = ('created_at', 'last_updated', 'nodes', 'edges', 'next_id', 'synced_version')
+    
+    def __init__(self, created_at: float):
+        self.created_at = created_at
+        self.last_updated = created_at
+        self.nodes: Dict[int, _Node] = {}
+        self.edges: List[_Edge] = []
+        self.next_id = 0
+        self.synced_version: Optional[int] = None
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+def _epoch(value: Any) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+class CompactTravelerProfile(TravelerProfile):
+    """
+    Memory-lean backend with the same public API as TravelerProfile
+    Nodes and edges are __slots__ records, node types and relationships are
+    interned integer codes, node ids are small integers local to each user and
+    timestamps are epoch floats. get_profile() and save_profile() still produce
+    the dict-shaped format, with timestamps rendered as ISO strings.
+    """
+    
+    def __init__(self, retention: Optional[Dict[str, int]] = None, max_profiles: Optional[int] = None,
+                 store: Optional[Any] = None, shards: Optional[int] = None):
+        self.node_types = NodeTypes()
+        self.relationships = NodeTypes()
+        super().__init__(retention, max_profiles, store, shards)
+    
+    def _export(self, user_id: str) -> Dict[str, Any]:
+        profile = self.profiles[user_id]
+        return {
+            'user_id': user_id,
+            'created_at': _iso(profile.created_at),
+            'last_updated': _iso(profile.last_updated),
+            'nodes': {
+                str(node_id): {
+                    'id': node_id,
+                    'type': self.node_types.name(node.type_code),
+                    'data': node.data,
+                    'created_at': _iso(node.created_at)
+                }
+                for node_id, node in profile.nodes.items()
+            },
+            'edges': [
+                {
+                    'source': edge.source,
+                    'target': edge.target,
+                    'relationship': self.relationships.name(edge.relationship_code),
+                    'created_at': _iso(edge.created_at)
+                }
+                for edge in profile.edges
+            ],
+            'synced_version': profile.synced_version
+        }
+    
+    def _get_synced_version(self, user_id: str) -> Optional[int]:
+        return self.profiles[user_id].synced_version
+    
+    def _set_synced_version(self, user_id: str, version: int):
+        self.profiles[user_id].synced_version = version
+    
+    def _new_profile(self, user_id: str):
+        self.profiles[user_id] = _CompactProfile(time.time())
+    
+    def _import_profile(self, profile_data: Dict[str, Any]) -> bool:
+        profile = _CompactProfile(_epoch(profile_data.get('created_at')))
+        profile.last_updated = _epoch(profile_data.get('last_updated'))
+        profile.synced_version = profile_data.get('synced_version')
+        nodes = profile_data.get('nodes', {})
+        # Integer ids are kept; ids from the dict backend are strings and get renumbered
+        profile.next_id = 1 + max((node_info.get('id') for node_info in nodes.values()
+                                   if isinstance(node_info.get('id'), int)), default=-1)
+        ids = {}
+        for old_id, node_info in nodes.items():
+            node_id = node_info.get('id', old_id)
+            if not isinstance(node_id, int):
+                node_id = profile.next_id
+                profile.next_id += 1
+            ids[node_info.get('id', old_id)] = ids[old_id] = node_id
+            profile.nodes[node_id] = _Node(self.node_types.code(node_info['type']),
+                                           node_info.get('data', {}),
+                                           _epoch(node_info.get('created_at')))
+        for edge in profile_data.get('edges', []):
+            if edge['source'] in ids and edge['target'] in ids:
+                profile.edges.append(_Edge(ids[edge['source']], ids[edge['target']],
+                                           self.relationships.code(edge.get('relationship', 'related')),
+                                           _epoch(edge.get('created_at'))))
+        self.profiles[profile_data['user_id']] = profile
+        return any(key != value for key, value in ids.items())
+    
+    def _insert_node(self, user_id: str, node_type: str, node_data: Dict[str, Any]) -> int:
+        profile = self.profiles[user_id]
+        node_id = profile.next_id
+        profile.next_id += 1
+        profile.nodes[node_id] = _Node(self.node_types.code(node_type), node_data, time.time())
+        return node_id
+    
+    def _pop_node(self, user_id: str, node_id: Any) -> Optional[str]:
+        profile = self.profiles[user_id]
+        node = profile.nodes.pop(node_id, None)
+        if node is None:
+            return None
+        if profile.edges:
+            profile.edges = [edge for edge in profile.edges
+                             if edge.source != node_id and edge.target != node_id]
+        return self.node_types.name(node.type_code)
+    
+    def _node_data(self, user_id: str, node_id: Any) -> Dict[str, Any]:
+        return self.profiles[user_id].nodes[node_id].data
+    
+    def _node_created_at(self, user_id: str, node_id: Any) -> str:
+        return _iso(self.profiles[user_id].nodes[node_id].created_at)
+    
+    def _node_types(self, user_id: str):
+        return [(node_id, self.node_types.name(node.type_code))
+                for node_id, node in self.profiles[user_id].nodes.items()]
+    
+    def _insert_edge(self, user_id: str, source_node: Any, target_node: Any, relationship: str) -> str:
+        created_at = time.time()
+        self.profiles[user_id].edges.append(
+            _Edge(source_node, target_node, self.relationships.code(relationship), created_at))
+        return _iso(created_at)
+    
+    def _touch(self, user_id: str):
+        self.profiles[user_id].last_updated = time.time()
+    
+    def _profile_info(self, user_id: str):
+        profile = self.profiles[user_id]
+        return _iso(profile.created_at), _iso(profile.last_updated), len(profile.nodes), len(profile.edges)
+
+PROFILE_BACKENDS = {
+    'dict': TravelerProfile,
+    'compact': CompactTravelerProfile
+}
+
 # Global instance for the application
-traveler_profiles = TravelerProfile() 
\ No newline at end of file
+traveler_profiles = PROFILE_BACKENDS[os.getenv("PROFILE_BACKEND", "dict")]() 
\ No newline at end of file